@@ -1,11 +1,14 @@
+import click
 from flask import Flask
+from flask.cli import with_appcontext
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_restful import Api
+from sqlalchemy.orm import configure_mappers
 
-from modelos import db
+from modelos import db, configurar_base_de_datos, crear_esquema, preparar_motor
 from vistas import \
-    VistaIngrediente, VistaIngredientes, \
+    VistaIngrediente, VistaIngredientes, VistaImportarIngredientes, \
     VistaReceta, VistaRecetas, \
     VistaSignIn, VistaLogIn, \
     VistaRestaurantes, \
@@ -15,36 +18,78 @@ from vistas import \
     VistaMenusChef, \
     VistaMenusAdmin, \
     VistaMenu, \
-    VistaReporteMenus
-
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///dbapp.sqlite'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = 'frase-secreta'
-app.config['PROPAGATE_EXCEPTIONS'] = True
-
-app_context = app.app_context()
-app_context.push()
-
-db.init_app(app)
-db.create_all()
-
-cors = CORS(app)
-
-api = Api(app)
-api.add_resource(VistaSignIn, '/signin')
-api.add_resource(VistaLogIn, '/login')
-api.add_resource(VistaRestaurantes, '/usuarios/<int:id_usuario>/restaurantes')
-api.add_resource(VistaRestaurante, '/usuarios/<int:id_usuario>/restaurante/<int:id_restaurante>')
-api.add_resource(VistaIngredientes, '/usuarios/<int:id_usuario>/ingredientes')
-api.add_resource(VistaIngrediente, '/ingredientes/<int:id_ingrediente>')
-api.add_resource(VistaRecetas, '/usuarios/<int:id_usuario>/recetas')
-api.add_resource(VistaReceta, '/recetas/<int:id_receta>')
-api.add_resource(VistaChefs, '/restaurantes/<int:id_restaurante>/chefs')
-api.add_resource(VistaMenus, '/usuarios/<int:id_usuario>/menus')
-api.add_resource(VistaMenusChef, '/usuarios/<int:id_usuario>/menus')
-api.add_resource(VistaMenusAdmin, '/usuarios/<int:id_usuario>/restaurantes/<int:id_restaurante>/menus')
-api.add_resource(VistaMenu, '/usuarios/<int:id_usuario>/menu/<int:id_menu>')
-api.add_resource(VistaReporteMenus, '/reporteMenu')
-
-jwt = JWTManager(app)
+    VistaReporteMenus, \
+    VistaDemanda, \
+    VistaBusqueda, \
+    VistaMetricas, \
+    VistaTrabajo, VistaResultadoTrabajo, \
+    RecetaUtil, \
+    configurar_cache, \
+    configurar_instrumentacion, \
+    configurar_trabajos
+
+
+def create_app(config=None):
+    # Construir la aplicación no abre conexiones: el esquema se crea con `flask crear-esquema`
+    app = Flask(__name__)
+    app.config.update(config or {})
+    configurar_base_de_datos(app)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('JWT_SECRET_KEY', 'frase-secreta')
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    configurar_cache(app)
+    configurar_trabajos(app)
+
+    db.init_app(app)
+    motor = db.get_engine(app)
+    preparar_motor(app, motor)
+    configurar_instrumentacion(app, motor)
+    # Los mappers se configuran aquí y no en la primera consulta: con gunicorn --preload los workers los heredan listos
+    configure_mappers()
+
+    CORS(app)
+
+    api = Api(app)
+    api.add_resource(VistaSignIn, '/signin')
+    api.add_resource(VistaLogIn, '/login')
+    api.add_resource(VistaRestaurantes, '/usuarios/<int:id_usuario>/restaurantes')
+    api.add_resource(VistaRestaurante, '/usuarios/<int:id_usuario>/restaurante/<int:id_restaurante>')
+    api.add_resource(VistaIngredientes, '/usuarios/<int:id_usuario>/ingredientes')
+    api.add_resource(VistaImportarIngredientes, '/usuarios/<int:id_usuario>/ingredientes/importar')
+    api.add_resource(VistaIngrediente, '/ingredientes/<int:id_ingrediente>')
+    api.add_resource(VistaRecetas, '/usuarios/<int:id_usuario>/recetas')
+    api.add_resource(VistaReceta, '/recetas/<int:id_receta>')
+    api.add_resource(VistaChefs, '/restaurantes/<int:id_restaurante>/chefs')
+    api.add_resource(VistaMenus, '/usuarios/<int:id_usuario>/menus')
+    api.add_resource(VistaMenusChef, '/usuarios/<int:id_usuario>/menus')
+    api.add_resource(VistaMenusAdmin, '/usuarios/<int:id_usuario>/restaurantes/<int:id_restaurante>/menus')
+    api.add_resource(VistaMenu, '/usuarios/<int:id_usuario>/menu/<int:id_menu>')
+    api.add_resource(VistaReporteMenus, '/reporteMenu')
+    api.add_resource(VistaDemanda, '/usuarios/<int:id_usuario>/demanda')
+    api.add_resource(VistaBusqueda, '/usuarios/<int:id_usuario>/buscar')
+    api.add_resource(VistaTrabajo, '/trabajos/<string:id_trabajo>')
+    api.add_resource(VistaResultadoTrabajo, '/trabajos/<string:id_trabajo>/resultado')
+    api.add_resource(VistaMetricas, '/metrics')
+
+    JWTManager(app)
+
+    app.cli.add_command(crear_esquema_comando)
+    app.cli.add_command(recalcular_totales)
+    return app
+
+@click.command('crear-esquema')
+@with_appcontext
+def crear_esquema_comando():
+    """Crea las tablas faltantes y agrega las columnas e índices nuevos de los modelos."""
+    crear_esquema(db.engine)
+    click.echo('Esquema actualizado')
+
+@click.command('recalcular-totales')
+@with_appcontext
+def recalcular_totales():
+    """Reconstruye los totales de costo y calorías de todas las recetas."""
+    actualizadas = RecetaUtil.recalcularTotales()
+    click.echo('Recetas actualizadas: {}'.format(actualizadas))
+
+# Instancia para `gunicorn app:app` y `flask`; importarla no toca la base de datos
+app = create_app()
@@ -0,0 +1,89 @@
+"""Mide el arranque en frío de un worker, con y sin gunicorn --preload.
+
+Uso:
+    python -m benchmarks.arranque
+    python -m benchmarks.arranque --repeticiones 10
+"""
+import argparse
+import atexit
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Proceso nuevo, como un worker sin --preload: importa la aplicación y atiende la primera solicitud
+PROCESO_FRIO = '''
+import json, time
+inicio = time.perf_counter()
+from app import app
+importado = time.perf_counter()
+from modelos import db, crear_esquema
+with app.app_context():
+    crear_esquema(db.engine)
+esquema = time.perf_counter()
+respuesta = app.test_client().post('/login', json={'usuario': 'nadie', 'contrasena': 'x'})
+atendido = time.perf_counter()
+print(json.dumps({'importar_ms': (importado - inicio) * 1000, 'esquema_ms': (esquema - importado) * 1000,
+                  'primera_solicitud_ms': (atendido - esquema) * 1000, 'estado': respuesta.status_code}))
+'''
+
+
+def medir_en_frio(entorno):
+    inicio = time.perf_counter()
+    salida = subprocess.run([sys.executable, '-c', PROCESO_FRIO], env=entorno, check=True,
+                            stdout=subprocess.PIPE, text=True).stdout
+    medicion = json.loads(salida.strip().splitlines()[-1])
+    medicion['total_ms'] = (time.perf_counter() - inicio) * 1000
+    return medicion
+
+def medir_con_precarga(app, repeticiones):
+    # Como gunicorn --preload: el padre ya importó la aplicación y cada worker nace de un fork
+    tiempos = []
+    for i in range(repeticiones):
+        lectura, escritura = os.pipe()
+        inicio = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(lectura)
+            app.test_client().post('/login', json={'usuario': 'nadie', 'contrasena': 'x'})
+            os.write(escritura, b'listo')
+            os._exit(0)
+        os.close(escritura)
+        os.read(lectura, 5)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        os.close(lectura)
+        os.waitpid(pid, 0)
+    return tiempos
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    argumentos = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='recetario-arranque-')
+    atexit.register(shutil.rmtree, directorio, True)
+    entorno = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(directorio, 'arranque.sqlite'),
+                   CACHE_RESPUESTAS_RUTA=os.path.join(directorio, 'cache.sqlite'))
+    os.environ.update(entorno)
+    # La primera corrida crea el esquema; las siguientes miden lo que pagaba cada worker al revisarlo
+    medir_en_frio(entorno)
+    frio = [medir_en_frio(entorno) for i in range(argumentos.repeticiones)]
+
+    from app import app
+    precarga = medir_con_precarga(app, argumentos.repeticiones)
+
+    mediana = lambda clave: statistics.median(medicion[clave] for medicion in frio)
+    print('Sin --preload (proceso nuevo por worker), mediana de {} corridas:'.format(argumentos.repeticiones))
+    print('  importar y crear la aplicación   {:>8.1f} ms'.format(mediana('importar_ms')))
+    print('  revisar el esquema (create_all)  {:>8.1f} ms  (antes se pagaba en cada import)'.format(mediana('esquema_ms')))
+    print('  primera solicitud                {:>8.1f} ms'.format(mediana('primera_solicitud_ms')))
+    print('  total, incluido el intérprete    {:>8.1f} ms'.format(mediana('total_ms')))
+    print('Con --preload (fork de un padre ya cargado):')
+    print('  fork hasta la primera respuesta  {:>8.1f} ms'.format(statistics.median(precarga)))
+
+if __name__ == '__main__':
+    main()
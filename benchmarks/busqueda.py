@@ -0,0 +1,62 @@
+"""Mide la búsqueda de texto completo sobre un tenant grande y uno pequeño que comparten el índice.
+
+Uso:
+    python -m benchmarks.busqueda
+    python -m benchmarks.busqueda --ingredientes 100000 --recetas 20000 --consultas 200
+"""
+import argparse
+import atexit
+import os
+import shutil
+import tempfile
+import time
+
+from faker import Faker
+
+
+def medir(funcion, consultas):
+    tiempos = []
+    for i in range(consultas):
+        inicio = time.perf_counter()
+        funcion(i)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2], tiempos[int(len(tiempos) * 0.95)], tiempos[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ingredientes', type=int, default=100000)
+    parser.add_argument('--recetas', type=int, default=20000)
+    parser.add_argument('--pequeno', type=int, default=1000, help='ingredientes y recetas del tenant pequeño')
+    parser.add_argument('--consultas', type=int, default=200)
+    argumentos = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='recetario-busqueda-')
+    atexit.register(shutil.rmtree, directorio, True)
+    os.environ.update({'DATABASE_URL': 'sqlite:///' + os.path.join(directorio, 'busqueda.sqlite'),
+                       'CACHE_RESPUESTAS_RUTA': os.path.join(directorio, 'cache.sqlite')})
+    from app import app
+    from benchmarks.datos import sembrar
+    from modelos import db, crear_esquema, buscar, Ingrediente, Receta
+    from vistas import BusquedaUtil
+
+    app.app_context().push()
+    crear_esquema(db.engine)
+    inicio = time.perf_counter()
+    grande = sembrar(ingredientes=argumentos.ingredientes, recetas=argumentos.recetas, menus=0, restaurantes=1)
+    pequeno = sembrar(ingredientes=argumentos.pequeno, recetas=argumentos.pequeno, menus=0, restaurantes=1, semilla=1)
+    print('Datos sembrados e indexados en {:.1f} s'.format(time.perf_counter() - inicio))
+
+    data_factory = Faker()
+    Faker.seed(2)
+    palabras = [data_factory.word() for i in range(argumentos.consultas)]
+    print('{:<12} {:<12} {:>7} {:>9} {:>9} {:>9}'.format('tenant', 'tabla', 'letras', 'p50 ms', 'p95 ms', 'max ms'))
+    for nombre, contexto in (('grande', grande), ('pequeño', pequeno)):
+        for modelo in (Ingrediente, Receta):
+            for letras in (2, 3, 5):
+                p50, p95, maximo = medir(lambda i: buscar(db.session, modelo, contexto['id_administrador'], \
+                    palabras[i][:letras], BusquedaUtil.LIMITE_POR_DEFECTO, BusquedaUtil.CANDIDATOS), argumentos.consultas)
+                print('{:<12} {:<12} {:>7} {:>9.2f} {:>9.2f} {:>9.2f}'.format(nombre, modelo.__tablename__, letras, p50, p95, maximo))
+
+if __name__ == '__main__':
+    main()
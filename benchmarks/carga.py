@@ -0,0 +1,240 @@
+"""Pruebas de carga de todos los endpoints sobre un tenant sintético.
+
+Uso:
+    python -m benchmarks.carga                                   # cliente de pruebas de Flask, en proceso
+    python -m benchmarks.carga --gunicorn --hilos 8              # levanta gunicorn y genera carga HTTP concurrente
+    python -m benchmarks.carga --url http://127.0.0.1:8000       # servidor ya levantado sobre la misma base
+    python -m benchmarks.carga --guardar linea_base.json         # guarda los resultados como línea base
+    python -m benchmarks.carga --comparar linea_base.json        # compara contra una línea base guardada
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+class ClientePrueba():
+    # Cliente de pruebas de Flask: sin red, mide solo el costo de la aplicación
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def solicitar(self, metodo, ruta, token=None, cuerpo=None, tipo='application/json'):
+        encabezados = {'Content-Type': tipo}
+        if token:
+            encabezados['Authorization'] = 'Bearer {}'.format(token)
+        respuesta = self.cliente.open(ruta, method=metodo, data=cuerpo, headers=encabezados)
+        return respuesta.status_code, respuesta.get_data(), respuesta.headers
+
+class ClienteHttp():
+    # Una conexión persistente por hilo contra el servidor
+
+    def __init__(self, url):
+        destino = urlparse(url)
+        self.host = destino.hostname
+        self.puerto = destino.port or 80
+        self.locales = threading.local()
+
+    def conexion(self):
+        if getattr(self.locales, 'conexion', None) is None:
+            self.locales.conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=120)
+        return self.locales.conexion
+
+    def solicitar(self, metodo, ruta, token=None, cuerpo=None, tipo='application/json'):
+        encabezados = {'Content-Type': tipo}
+        if token:
+            encabezados['Authorization'] = 'Bearer {}'.format(token)
+        try:
+            conexion = self.conexion()
+            conexion.request(metodo, ruta, body=cuerpo.encode('utf-8') if isinstance(cuerpo, str) else cuerpo, headers=encabezados)
+            respuesta = conexion.getresponse()
+            return respuesta.status, respuesta.read(), respuesta.headers
+        except (http.client.HTTPException, OSError):
+            self.locales.conexion = None
+            raise
+
+def iniciar_sesion(cliente, usuario, contrasena):
+    estado, datos, encabezados = cliente.solicitar('POST', '/login', cuerpo=json.dumps({"usuario": usuario, "contrasena": contrasena}))
+    respuesta = json.loads(datos)
+    return respuesta['token'], respuesta['id']
+
+def ejecutar_escenario(cliente, escenario, contexto, solicitudes, hilos, calentamiento):
+    token = None if escenario.get('sin_token') else contexto['token_chef' if escenario.get('usuario') == 'chef' else 'token']
+    tipo = escenario.get('tipo', 'application/json')
+
+    def una_solicitud(i):
+        # La ruta y el cuerpo se arman antes de medir: pueden crear registros de apoyo
+        ruta = escenario['ruta'](cliente, contexto, i)
+        cuerpo = escenario['cuerpo'](cliente, contexto, i) if 'cuerpo' in escenario else None
+        if cuerpo is not None and tipo == 'application/json':
+            cuerpo = json.dumps(cuerpo)
+        inicio = time.perf_counter()
+        estado, datos, encabezados = cliente.solicitar(escenario['metodo'], ruta, token, cuerpo, tipo)
+        duracion = time.perf_counter() - inicio
+        # Las respuestas en streaming marcan la cuenta como no disponible
+        consultas = encabezados.get('X-Consultas-SQL')
+        return duracion, estado, int(consultas) if consultas is not None and consultas.isdigit() else None
+
+    for i in range(calentamiento):
+        una_solicitud(solicitudes + i)
+    inicio = time.perf_counter()
+    if hilos > 1:
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            resultados = list(ejecutor.map(una_solicitud, range(solicitudes)))
+    else:
+        resultados = [una_solicitud(i) for i in range(solicitudes)]
+    total = time.perf_counter() - inicio
+
+    latencias = [duracion * 1000 for duracion, estado, consultas in resultados]
+    consultas = [consultas for duracion, estado, consultas in resultados if consultas is not None]
+    return {
+        'solicitudes': solicitudes,
+        'errores': len([estado for duracion, estado, c in resultados if estado >= 400]),
+        'p50_ms': round(percentil(latencias, 50), 2),
+        'p95_ms': round(percentil(latencias, 95), 2),
+        'p99_ms': round(percentil(latencias, 99), 2),
+        # Incluye la preparación de las solicitudes; es una cota inferior del rendimiento real
+        'rps': round(solicitudes / total, 1),
+        'consultas_sql': round(sum(consultas) / len(consultas), 1) if consultas else None
+    }
+
+def comparar(resultados, linea_base, tolerancia):
+    # Una regresión es un p95 por encima de la tolerancia o más consultas SQL por solicitud
+    regresiones = []
+    for campo in ('modo', 'hilos', 'datos'):
+        if resultados[campo] != linea_base.get(campo):
+            print('Aviso: la línea base usa otro {} ({} frente a {})'.format(campo, linea_base.get(campo), resultados[campo]))
+    print('\n{:<32} {:>12} {:>12} {:>8} {:>10} {:>10}'.format('endpoint', 'p95 base', 'p95 actual', 'cambio', 'sql base', 'sql actual'))
+    for nombre, actual in resultados['endpoints'].items():
+        base = linea_base['endpoints'].get(nombre)
+        if base is None:
+            print('{:<32} {:>12} {:>12}'.format(nombre, '-', actual['p95_ms']))
+            continue
+        cambio = (actual['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100 if base['p95_ms'] else 0
+        marca = ''
+        if cambio > tolerancia or (actual['consultas_sql'] or 0) > (base['consultas_sql'] or 0):
+            regresiones.append(nombre)
+            marca = '  <- regresión'
+        print('{:<32} {:>12} {:>12} {:>7.1f}% {:>10} {:>10}{}'.format(nombre, base['p95_ms'], actual['p95_ms'], cambio,
+                                                                    str(base['consultas_sql']), str(actual['consultas_sql']), marca))
+    return regresiones
+
+def preparar_entorno(argumentos):
+    # La base de las pruebas de carga es propia y se recrea en cada corrida, nunca dbapp.sqlite
+    ruta_base = argumentos.base or os.path.join(tempfile.gettempdir(), 'recetario-benchmark.sqlite')
+    ruta_cache = ruta_base + '.cache'
+    if not argumentos.reutilizar_datos:
+        # La caché compartida se descarta junto con la base para no servir respuestas de una corrida anterior
+        for ruta in (ruta_base, ruta_cache):
+            for sufijo in ('', '-wal', '-shm'):
+                if os.path.exists(ruta + sufijo):
+                    os.remove(ruta + sufijo)
+    entorno = {'DATABASE_URL': 'sqlite:///' + ruta_base, 'CACHE_RESPUESTAS_RUTA': ruta_cache, 'CONTAR_CONSULTAS': '1'}
+    if argumentos.sin_cache:
+        entorno['CACHE_RESPUESTAS'] = '0'
+    os.environ.update(entorno)
+    return entorno
+
+def iniciar_gunicorn(entorno, trabajadores, puerto):
+    proceso = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--preload', 'app:app', '-w', str(trabajadores), '-b', '127.0.0.1:{}'.format(puerto)],
+                               env=dict(os.environ, **entorno))
+    url = 'http://127.0.0.1:{}'.format(puerto)
+    for intento in range(100):
+        try:
+            http.client.HTTPConnection('127.0.0.1', puerto, timeout=1).request('GET', '/login')
+            return proceso, url
+        except OSError:
+            time.sleep(0.1)
+    proceso.terminate()
+    raise RuntimeError('gunicorn no respondió en el puerto {}'.format(puerto))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ingredientes', type=int, default=10000)
+    parser.add_argument('--recetas', type=int, default=2000)
+    parser.add_argument('--menus', type=int, default=500)
+    parser.add_argument('--restaurantes', type=int, default=5)
+    parser.add_argument('--solicitudes', type=int, default=50, help='solicitudes medidas por endpoint')
+    parser.add_argument('--calentamiento', type=int, default=2)
+    parser.add_argument('--hilos', type=int, default=1)
+    parser.add_argument('--gunicorn', action='store_true', help='levanta gunicorn y mide por HTTP')
+    parser.add_argument('--trabajadores', type=int, default=4)
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--url', help='mide por HTTP contra un servidor ya levantado')
+    parser.add_argument('--base', help='archivo SQLite para los datos sintéticos')
+    parser.add_argument('--reutilizar-datos', action='store_true')
+    parser.add_argument('--sin-cache', action='store_true')
+    parser.add_argument('--endpoint', action='append', help='solo los endpoints cuyo nombre contenga este texto')
+    parser.add_argument('--guardar', help='archivo JSON donde guardar los resultados')
+    parser.add_argument('--comparar', help='línea base JSON contra la cual comparar')
+    parser.add_argument('--tolerancia', type=float, default=20.0, help='aumento de p95 permitido, en porcentaje')
+    argumentos = parser.parse_args()
+
+    entorno = preparar_entorno(argumentos)
+    from app import app
+    from benchmarks.datos import sembrar
+    from benchmarks.escenarios import ESCENARIOS
+    from modelos import db, crear_esquema
+
+    # La aplicación ya no crea el esquema al importarse; el contexto queda activo para sembrar y medir
+    app.app_context().push()
+    crear_esquema(db.engine)
+    inicio = time.perf_counter()
+    contexto = sembrar(ingredientes=argumentos.ingredientes, recetas=argumentos.recetas, menus=argumentos.menus,
+                       restaurantes=argumentos.restaurantes)
+    print('Datos sembrados en {:.1f} s'.format(time.perf_counter() - inicio))
+
+    proceso = None
+    if argumentos.gunicorn:
+        proceso, url = iniciar_gunicorn(entorno, argumentos.trabajadores, argumentos.puerto)
+        cliente, modo = ClienteHttp(url), 'gunicorn'
+    elif argumentos.url:
+        cliente, modo = ClienteHttp(argumentos.url), 'http'
+    else:
+        cliente, modo = ClientePrueba(app), 'cliente'
+    try:
+        contexto['token'], _ = iniciar_sesion(cliente, contexto['usuario'], contexto['contrasena'])
+        contexto['token_chef'], contexto['id_chef'] = iniciar_sesion(cliente, contexto['usuario_chef'], contexto['contrasena'])
+        resultados = {'modo': modo, 'hilos': argumentos.hilos,
+                      'datos': {'ingredientes': argumentos.ingredientes, 'recetas': argumentos.recetas,
+                                'menus': argumentos.menus, 'restaurantes': argumentos.restaurantes},
+                      'endpoints': {}}
+        print('{:<32} {:>6} {:>9} {:>9} {:>9} {:>9} {:>7} {:>8}'.format('endpoint', 'n', 'p50 ms', 'p95 ms', 'p99 ms', 'sol/s', 'sql', 'errores'))
+        for escenario in ESCENARIOS:
+            if argumentos.endpoint and not any(filtro in escenario['nombre'] for filtro in argumentos.endpoint):
+                continue
+            medicion = ejecutar_escenario(cliente, escenario, contexto, argumentos.solicitudes, argumentos.hilos, argumentos.calentamiento)
+            resultados['endpoints'][escenario['nombre']] = medicion
+            print('{:<32} {solicitudes:>6} {p50_ms:>9} {p95_ms:>9} {p99_ms:>9} {rps:>9} {consultas:>7} {errores:>8}'.format(
+                escenario['nombre'], consultas=str(medicion['consultas_sql'] if medicion['consultas_sql'] is not None else '-'), **medicion))
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+
+    if argumentos.guardar:
+        with open(argumentos.guardar, 'w') as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+    if argumentos.comparar:
+        with open(argumentos.comparar) as archivo:
+            regresiones = comparar(resultados, json.load(archivo), argumentos.tolerancia)
+        if regresiones:
+            print('\nRegresiones: {}'.format(', '.join(regresiones)))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
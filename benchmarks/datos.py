@@ -0,0 +1,97 @@
+"""Siembra un tenant sintético de tamaño configurable con Faker."""
+import hashlib
+import random
+from datetime import date, timedelta
+
+from faker import Faker
+
+from modelos import db, Administrador, Chef, Ingrediente, Menu, MenuReceta, Receta, RecetaIngrediente, Restaurante
+from vistas import RecetaUtil
+
+TAMANO_LOTE = 1000
+
+
+def insertar_por_lotes(tabla, filas):
+    for inicio in range(0, len(filas), TAMANO_LOTE):
+        db.session.execute(tabla.insert(), filas[inicio:inicio + TAMANO_LOTE])
+
+def sembrar(ingredientes=10000, recetas=2000, menus=500, restaurantes=5, chefs_por_restaurante=2,
+            lineas_por_receta=5, recetas_por_menu=4, semilla=0):
+    # Las filas masivas se insertan con executemany; solo usuarios y restaurantes pasan por el ORM
+    data_factory = Faker()
+    Faker.seed(semilla)
+    aleatorio = random.Random(semilla)
+    sufijo = data_factory.uuid4()[:8]
+    contrasena = 'Bench$' + sufijo
+
+    administrador = Administrador(nombre=data_factory.name(), usuario='bench_admin_' + sufijo,
+                                  contrasena=hashlib.md5(contrasena.encode('utf-8')).hexdigest())
+    db.session.add(administrador)
+    db.session.commit()
+    id_administrador = administrador.id
+
+    ids_restaurantes = []
+    for i in range(restaurantes):
+        restaurante = Restaurante(nombre=data_factory.company(), direccion=data_factory.address(),
+                                  telefono=data_factory.phone_number(), redes_sociales=data_factory.url(),
+                                  hora_apertura='08:00', servicio_sitio=True, servicio_domicilio=bool(i % 2),
+                                  tipo_comida=data_factory.word(), plataformas=data_factory.word(),
+                                  administrador=id_administrador)
+        db.session.add(restaurante)
+        db.session.commit()
+        ids_restaurantes.append(restaurante.id)
+
+    usuarios_chef = []
+    for id_restaurante in ids_restaurantes:
+        for i in range(chefs_por_restaurante):
+            chef = Chef(nombre=data_factory.name(), usuario='bench_chef_{}_{}_{}'.format(sufijo, id_restaurante, i),
+                        contrasena=hashlib.md5(contrasena.encode('utf-8')).hexdigest(), restaurante=id_restaurante)
+            db.session.add(chef)
+            usuarios_chef.append(chef.usuario)
+    db.session.commit()
+
+    sitios = [data_factory.company() for i in range(20)]
+    unidades = ['kg', 'g', 'l', 'ml', 'und']
+    insertar_por_lotes(Ingrediente.__table__, [{
+        'nombre': data_factory.sentence(nb_words=3), 'unidad': aleatorio.choice(unidades),
+        'costo': round(aleatorio.uniform(0.1, 50), 2), 'calorias': round(aleatorio.uniform(0, 900), 2),
+        'sitio': aleatorio.choice(sitios), 'administrador': id_administrador} for i in range(ingredientes)])
+    ids_ingredientes = [fila[0] for fila in db.session.query(Ingrediente.id).filter(Ingrediente.administrador == id_administrador)]
+
+    insertar_por_lotes(Receta.__table__, [{
+        'nombre': data_factory.sentence(nb_words=4), 'preparacion': data_factory.paragraph(),
+        'duracion': aleatorio.randint(10, 180), 'porcion': aleatorio.randint(1, 8),
+        'usuario': id_administrador, 'administrador': id_administrador} for i in range(recetas)])
+    ids_recetas = [fila[0] for fila in db.session.query(Receta.id).filter(Receta.administrador == id_administrador)]
+    insertar_por_lotes(RecetaIngrediente.__table__, [{
+        'receta': id_receta, 'ingrediente': id_ingrediente, 'cantidad': round(aleatorio.uniform(0.05, 3), 2)}
+        for id_receta in ids_recetas
+        for id_ingrediente in aleatorio.sample(ids_ingredientes, min(lineas_por_receta, len(ids_ingredientes)))])
+
+    inicio = date(2024, 1, 1)
+    filas_menus = []
+    for i in range(menus):
+        fecha_inicio = inicio + timedelta(days=aleatorio.randint(0, 364))
+        filas_menus.append({'nombre': data_factory.sentence(nb_words=3), 'descripcion': data_factory.sentence(),
+                            'fechaInicio': fecha_inicio, 'fechaFin': fecha_inicio + timedelta(days=aleatorio.randint(0, 13)),
+                            'foto': data_factory.image_url(), 'autor': id_administrador,
+                            'autor_name': administrador.usuario, 'restaurante': ids_restaurantes[i % len(ids_restaurantes)]})
+    insertar_por_lotes(Menu.__table__, filas_menus)
+    ids_menus = [fila[0] for fila in db.session.query(Menu.id).filter(Menu.autor == id_administrador)]
+    insertar_por_lotes(MenuReceta.__table__, [{
+        'menu': id_menu, 'receta': id_receta, 'personas': aleatorio.randint(1, 40)}
+        for id_menu in ids_menus
+        for id_receta in aleatorio.sample(ids_recetas, min(recetas_por_menu, len(ids_recetas)))])
+    db.session.commit()
+    RecetaUtil.recalcularTotales()
+
+    return {
+        'usuario': administrador.usuario,
+        'contrasena': contrasena,
+        'id_administrador': id_administrador,
+        'usuario_chef': usuarios_chef[0] if usuarios_chef else None,
+        'restaurantes': ids_restaurantes,
+        'ingredientes': ids_ingredientes,
+        'recetas': ids_recetas,
+        'menus': ids_menus
+    }
@@ -0,0 +1,104 @@
+"""Una solicitud representativa por cada endpoint registrado en app.py."""
+import json
+
+from faker import Faker
+
+data_factory = Faker()
+
+
+def ingrediente_nuevo():
+    return {"nombre": data_factory.sentence(nb_words=3), "unidad": "kg", "costo": 1.25, "calorias": 100, "sitio": data_factory.company()}
+
+def receta_nueva(contexto, i):
+    ingredientes = contexto['ingredientes']
+    return {"nombre": data_factory.sentence(nb_words=4), "preparacion": data_factory.sentence(), "duracion": 30, "porcion": 4,
+            "ingredientes": [{"idIngrediente": ingredientes[(i * 7 + j) % len(ingredientes)], "cantidad": 1} for j in range(5)]}
+
+def menu_nuevo(contexto, i):
+    recetas = contexto['recetas']
+    return {"nombre": data_factory.sentence(nb_words=3), "descripcion": data_factory.sentence(),
+            "fechaInicio": "2024-07-01", "fechaFin": "2024-07-07", "foto": data_factory.image_url(),
+            "restaurante": contexto['restaurantes'][0],
+            "recetas": [{"receta": recetas[(i * 3 + j) % len(recetas)], "personas": 10} for j in range(4)]}
+
+def restaurante_nuevo():
+    return {"nombre": data_factory.company(), "direccion": data_factory.address(), "telefono": data_factory.phone_number(),
+            "redes_sociales": data_factory.url(), "hora_apertura": "08:00", "servicio_sitio": True, "servicio_domicilio": False,
+            "tipo_comida": data_factory.word(), "plataformas": data_factory.word()}
+
+def csv_ingredientes(filas):
+    lineas = ["nombre,unidad,costo,calorias,sitio"]
+    lineas += ["{},kg,1.5,100,{}".format(data_factory.word(), data_factory.word()) for i in range(filas)]
+    return "\n".join(lineas) + "\n"
+
+def crear(cliente, contexto, ruta, cuerpo):
+    # Preparación que no se mide: crea el registro que luego se borra
+    estado, datos, encabezados = cliente.solicitar('POST', ruta, contexto['token'], json.dumps(cuerpo))
+    return json.loads(datos)['id']
+
+def receta_editada(cliente, contexto, id_receta, i):
+    estado, datos, encabezados = cliente.solicitar('GET', '/recetas/{}'.format(id_receta), contexto['token'])
+    receta = json.loads(datos)
+    lineas = [{"id": linea['id'], "idIngrediente": linea['ingrediente']['id'], "cantidad": float(linea['cantidad']) + (i % 3)}
+              for linea in receta['ingredientes']]
+    return {"nombre": receta['nombre'], "preparacion": receta['preparacion'] or "", "duracion": 30, "porcion": 4, "ingredientes": lineas}
+
+def menu_editado(cliente, contexto, id_menu, i):
+    menu = menu_nuevo(contexto, i)
+    menu['restaurante'] = {"id": contexto['restaurantes'][0]}
+    return menu
+
+# Cada escenario: nombre, método, ruta, cuerpo (opcional), tipo de contenido y usuario ('admin' o 'chef').
+# Las funciones reciben (cliente, contexto, i) para poder preparar registros sin medir esa preparación.
+ESCENARIOS = [
+    {'nombre': 'POST /signin', 'metodo': 'POST', 'ruta': lambda c, x, i: '/signin',
+     'cuerpo': lambda c, x, i: {"usuario": 'bench_' + data_factory.uuid4(), "contrasena": "Bench$1"}, 'sin_token': True},
+    {'nombre': 'POST /login', 'metodo': 'POST', 'ruta': lambda c, x, i: '/login',
+     'cuerpo': lambda c, x, i: {"usuario": x['usuario'], "contrasena": x['contrasena']}, 'sin_token': True},
+    {'nombre': 'GET restaurantes', 'metodo': 'GET', 'ruta': lambda c, x, i: '/usuarios/{}/restaurantes'.format(x['id_administrador'])},
+    {'nombre': 'POST restaurantes', 'metodo': 'POST', 'ruta': lambda c, x, i: '/usuarios/{}/restaurantes'.format(x['id_administrador']),
+     'cuerpo': lambda c, x, i: restaurante_nuevo()},
+    {'nombre': 'GET restaurante', 'metodo': 'GET',
+     'ruta': lambda c, x, i: '/usuarios/{}/restaurante/{}'.format(x['id_administrador'], x['restaurantes'][i % len(x['restaurantes'])])},
+    {'nombre': 'GET ingredientes', 'metodo': 'GET', 'ruta': lambda c, x, i: '/usuarios/{}/ingredientes'.format(x['id_administrador'])},
+    {'nombre': 'GET ingredientes?limit=100', 'metodo': 'GET',
+     'ruta': lambda c, x, i: '/usuarios/{}/ingredientes?limit=100&after={}'.format(x['id_administrador'], x['ingredientes'][i % len(x['ingredientes'])])},
+    {'nombre': 'GET ingredientes?stream=ndjson', 'metodo': 'GET',
+     'ruta': lambda c, x, i: '/usuarios/{}/ingredientes?stream=ndjson'.format(x['id_administrador'])},
+    {'nombre': 'POST ingredientes', 'metodo': 'POST', 'ruta': lambda c, x, i: '/usuarios/{}/ingredientes'.format(x['id_administrador']),
+     'cuerpo': lambda c, x, i: ingrediente_nuevo()},
+    {'nombre': 'POST ingredientes/importar', 'metodo': 'POST', 'tipo': 'text/csv',
+     'ruta': lambda c, x, i: '/usuarios/{}/ingredientes/importar'.format(x['id_administrador']), 'cuerpo': lambda c, x, i: csv_ingredientes(100)},
+    {'nombre': 'GET ingrediente', 'metodo': 'GET', 'ruta': lambda c, x, i: '/ingredientes/{}'.format(x['ingredientes'][i % len(x['ingredientes'])])},
+    {'nombre': 'PUT ingrediente', 'metodo': 'PUT', 'ruta': lambda c, x, i: '/ingredientes/{}'.format(x['ingredientes'][i % len(x['ingredientes'])]),
+     'cuerpo': lambda c, x, i: ingrediente_nuevo()},
+    {'nombre': 'DELETE ingrediente', 'metodo': 'DELETE',
+     'ruta': lambda c, x, i: '/ingredientes/{}'.format(crear(c, x, '/usuarios/{}/ingredientes'.format(x['id_administrador']), ingrediente_nuevo()))},
+    {'nombre': 'GET recetas', 'metodo': 'GET', 'ruta': lambda c, x, i: '/usuarios/{}/recetas'.format(x['id_administrador'])},
+    {'nombre': 'GET recetas?limit=100', 'metodo': 'GET',
+     'ruta': lambda c, x, i: '/usuarios/{}/recetas?limit=100&after={}'.format(x['id_administrador'], x['recetas'][i % len(x['recetas'])])},
+    {'nombre': 'POST recetas', 'metodo': 'POST', 'ruta': lambda c, x, i: '/usuarios/{}/recetas'.format(x['id_administrador']),
+     'cuerpo': lambda c, x, i: receta_nueva(x, i)},
+    {'nombre': 'GET receta', 'metodo': 'GET', 'ruta': lambda c, x, i: '/recetas/{}'.format(x['recetas'][i % len(x['recetas'])])},
+    {'nombre': 'PUT receta', 'metodo': 'PUT', 'ruta': lambda c, x, i: '/recetas/{}'.format(x['recetas'][i % len(x['recetas'])]),
+     'cuerpo': lambda c, x, i: receta_editada(c, x, x['recetas'][i % len(x['recetas'])], i)},
+    {'nombre': 'DELETE receta', 'metodo': 'DELETE',
+     'ruta': lambda c, x, i: '/recetas/{}'.format(crear(c, x, '/usuarios/{}/recetas'.format(x['id_administrador']), receta_nueva(x, i)))},
+    {'nombre': 'GET chefs', 'metodo': 'GET', 'ruta': lambda c, x, i: '/restaurantes/{}/chefs'.format(x['restaurantes'][i % len(x['restaurantes'])])},
+    {'nombre': 'POST chefs', 'metodo': 'POST', 'ruta': lambda c, x, i: '/restaurantes/{}/chefs'.format(x['restaurantes'][0]),
+     'cuerpo': lambda c, x, i: {"nombre": data_factory.name(), "usuario": 'bench_' + data_factory.uuid4(), "contrasena": "Bench$1"}},
+    {'nombre': 'POST menus', 'metodo': 'POST', 'ruta': lambda c, x, i: '/usuarios/{}/menus'.format(x['id_administrador']),
+     'cuerpo': lambda c, x, i: menu_nuevo(x, i)},
+    {'nombre': 'GET menus (chef)', 'metodo': 'GET', 'ruta': lambda c, x, i: '/usuarios/{}/menus'.format(x['id_chef']), 'usuario': 'chef'},
+    {'nombre': 'GET menus de restaurante', 'metodo': 'GET',
+     'ruta': lambda c, x, i: '/usuarios/{}/restaurantes/{}/menus'.format(x['id_administrador'], x['restaurantes'][i % len(x['restaurantes'])])},
+    {'nombre': 'GET menu', 'metodo': 'GET', 'ruta': lambda c, x, i: '/usuarios/{}/menu/{}'.format(x['id_administrador'], x['menus'][i % len(x['menus'])])},
+    {'nombre': 'PUT menu', 'metodo': 'PUT', 'ruta': lambda c, x, i: '/usuarios/{}/menu/{}'.format(x['id_administrador'], x['menus'][i % len(x['menus'])]),
+     'cuerpo': lambda c, x, i: menu_editado(c, x, x['menus'][i % len(x['menus'])], i)},
+    {'nombre': 'POST reporteMenu', 'metodo': 'POST', 'ruta': lambda c, x, i: '/reporteMenu',
+     'cuerpo': lambda c, x, i: {"recetas": [{"receta": x['recetas'][(i + j) % len(x['recetas'])], "personas": 10} for j in range(10)]}},
+    {'nombre': 'GET demanda', 'metodo': 'GET',
+     'ruta': lambda c, x, i: '/usuarios/{}/demanda?desde=2024-0{}-01&hasta=2024-0{}-28'.format(x['id_administrador'], i % 9 + 1, i % 9 + 1)},
+    {'nombre': 'GET buscar', 'metodo': 'GET',
+     'ruta': lambda c, x, i: '/usuarios/{}/buscar?q={}'.format(x['id_administrador'], data_factory.word()[:i % 4 + 2])},
+]
@@ -0,0 +1,78 @@
+"""Compara schema.dump de marshmallow con SerializadorCompilado en listados de 1k y 10k filas.
+
+Uso: python -m benchmarks.serializacion [--repeticiones N]
+"""
+import argparse
+import json
+import time
+from datetime import date
+from decimal import Decimal
+
+from faker import Faker
+
+from modelos import \
+    Chef, Ingrediente, IngredienteSchema, Menu, MenuReceta, MenuSchema, Receta, RecetaIngrediente, RecetaSchema, \
+    Restaurante, RestauranteSchema, SerializadorCompilado
+
+
+def generar_objetos(data_factory, filas):
+    # Objetos transitorios: el benchmark mide solo la serialización, sin acceso a la base de datos
+    ingredientes = [Ingrediente(id=i, nombre=data_factory.sentence(), unidad=data_factory.word(),
+                                costo=Decimal(data_factory.pydecimal(left_digits=3, right_digits=2, positive=True)),
+                                calorias=Decimal(data_factory.pydecimal(left_digits=3, right_digits=2, positive=True)),
+                                sitio=data_factory.city(), administrador=1) for i in range(filas)]
+    recetas = []
+    for i in range(filas):
+        receta = Receta(id=i, nombre=data_factory.sentence(), preparacion=data_factory.text(), duracion=30, porcion=4,
+                        costo_total=Decimal("12.50"), calorias_total=Decimal("830.00"),
+                        costo_porcion=Decimal("3.125"), calorias_porcion=Decimal("207.5"), administrador=1, usuario=1)
+        receta.ingredientes = [RecetaIngrediente(id=i * 3 + j, cantidad=Decimal("1.5"), ingrediente=j, receta=i) for j in range(3)]
+        recetas.append(receta)
+    menus = []
+    for i in range(filas):
+        menu = Menu(id=i, nombre=data_factory.sentence(), descripcion=data_factory.sentence(), fechaInicio=date(2024, 7, 1),
+                    fechaFin=date(2024, 7, 7), foto=data_factory.url(), autor=1, restaurante=1)
+        menu.recetas = [MenuReceta(id=i * 2 + j, personas=4, receta=j, menu=i) for j in range(2)]
+        menus.append(menu)
+    restaurantes = []
+    for i in range(filas):
+        restaurante = Restaurante(id=i, nombre=data_factory.company(), direccion=data_factory.address(),
+                                  telefono=data_factory.phone_number(), servicio_sitio=True, servicio_domicilio=False,
+                                  tipo_comida=data_factory.word(), administrador=1)
+        restaurante.chefs = [Chef(id=i * 2 + j) for j in range(2)]
+        restaurantes.append(restaurante)
+    return {IngredienteSchema: ingredientes, RecetaSchema: recetas, MenuSchema: menus, RestauranteSchema: restaurantes}
+
+def medir(funcion, repeticiones):
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor
+
+def ejecutar(filas_por_corrida=(1000, 10000), repeticiones=5):
+    data_factory = Faker()
+    Faker.seed(0)
+    resultados = []
+    for filas in filas_por_corrida:
+        for esquema, objetos in generar_objetos(data_factory, filas).items():
+            schema = esquema()
+            serializador = SerializadorCompilado(schema)
+            if json.dumps(serializador.dumpMany(objetos)) != json.dumps(schema.dump(objetos, many=True)):
+                raise AssertionError('{}: la salida no es idéntica a marshmallow'.format(esquema.__name__))
+            marshmallow = medir(lambda: [schema.dump(objeto) for objeto in objetos], repeticiones)
+            compilado = medir(lambda: serializador.dumpMany(objetos), repeticiones)
+            resultados.append({'esquema': esquema.__name__, 'filas': filas, 'marshmallow_ms': round(marshmallow * 1000, 2),
+                               'compilado_ms': round(compilado * 1000, 2), 'aceleracion': round(marshmallow / compilado, 1)})
+    return resultados
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    argumentos = parser.parse_args()
+    from app import app
+    print('{:<20} {:>7} {:>16} {:>14} {:>12}'.format('esquema', 'filas', 'marshmallow (ms)', 'compilado (ms)', 'aceleración'))
+    for resultado in ejecutar(repeticiones=argumentos.repeticiones):
+        print('{esquema:<20} {filas:>7} {marshmallow_ms:>16} {compilado_ms:>14} {aceleracion:>11}x'.format(**resultado))
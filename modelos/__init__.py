@@ -1 +1,4 @@
 from .modelos import *
+from .configuracion import *
+from .busqueda import *
+from .serializadores import *
@@ -0,0 +1,72 @@
+import re
+
+from sqlalchemy import and_, or_, text
+
+
+# Columnas indexadas por tabla; la columna administrador también se indexa para filtrar por tenant dentro del índice
+INDICES_BUSQUEDA = {
+    'ingrediente': ('nombre', 'sitio'),
+    'receta': ('nombre', 'preparacion'),
+}
+# Peso de cada columna en bm25: una coincidencia en el nombre pesa más que en el sitio o la preparación
+PESOS_BUSQUEDA = (10.0, 1.0, 0.0)
+PALABRA = re.compile(r'\w+')
+LARGO_MINIMO = 2
+
+def crear_indices_busqueda(engine):
+    # Tablas FTS5 de contenido externo, sincronizadas por triggers: también cubren los INSERT masivos que no pasan por el ORM
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.begin() as conexion:
+        for tabla, columnas in INDICES_BUSQUEDA.items():
+            indice = tabla + '_busqueda'
+            todas = columnas + ('administrador',)
+            nuevas = ', '.join('new.' + columna for columna in todas)
+            viejas = ', '.join('old.' + columna for columna in todas)
+            existe = conexion.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nombre"), \
+                {'nombre': indice}).first() is not None
+            conexion.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5({1}, content='{2}', content_rowid='id', " \
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')".format(indice, ', '.join(todas), tabla)))
+            conexion.execute(text("CREATE TRIGGER IF NOT EXISTS {0}_insertar AFTER INSERT ON {1} BEGIN " \
+                "INSERT INTO {0} (rowid, {2}) VALUES (new.id, {3}); END".format(indice, tabla, ', '.join(todas), nuevas)))
+            conexion.execute(text("CREATE TRIGGER IF NOT EXISTS {0}_borrar AFTER DELETE ON {1} BEGIN " \
+                "INSERT INTO {0} ({0}, rowid, {2}) VALUES ('delete', old.id, {3}); END".format(indice, tabla, ', '.join(todas), viejas)))
+            # Solo los cambios en columnas indexadas reescriben el índice; los de versión o totales no
+            conexion.execute(text("CREATE TRIGGER IF NOT EXISTS {0}_actualizar AFTER UPDATE OF {2} ON {1} BEGIN " \
+                "INSERT INTO {0} ({0}, rowid, {2}) VALUES ('delete', old.id, {3}); " \
+                "INSERT INTO {0} (rowid, {2}) VALUES (new.id, {4}); END".format(indice, tabla, ', '.join(todas), viejas, nuevas)))
+            if not existe:
+                # Un índice nuevo sobre una base con datos se llena con las filas existentes
+                conexion.execute(text("INSERT INTO {0} ({0}) VALUES ('rebuild')".format(indice)))
+
+def buscar(session, modelo, id_administrador, texto, limite, candidatos):
+    # Devuelve los ids del tenant que coinciden con todas las palabras, como prefijos, del más al menos relevante.
+    # Las palabras de una letra se ignoran: como prefijo coinciden con casi todo el índice
+    palabras = [palabra for palabra in PALABRA.findall(texto.lower()) if len(palabra) >= LARGO_MINIMO]
+    if not palabras:
+        return []
+    tabla = modelo.__tablename__
+    columnas = INDICES_BUSQUEDA[tabla]
+    if session.connection().dialect.name != 'sqlite':
+        filtros = [or_(*[getattr(modelo, columna).ilike('%' + palabra + '%') for columna in columnas]) for palabra in palabras]
+        return [fila[0] for fila in session.query(modelo.id).filter(modelo.administrador == id_administrador, and_(*filtros)) \
+            .order_by(modelo.nombre).limit(limite)]
+
+    # Cada palabra va entre comillas: el texto del usuario nunca se interpreta como sintaxis de FTS5
+    expresion = '{{{}}} : ({})'.format(' '.join(columnas), ' '.join('"{}"*'.format(palabra) for palabra in palabras))
+    pesos = ', '.join(str(peso) for peso in PESOS_BUSQUEDA)
+    # Los candidatos son los mejor puntuados de todo el índice y el tenant se filtra después. El peso de la columna
+    # administrador es 0, así que filtrar por tenant no cambia los puntajes: si hay suficientes candidatos del tenant,
+    # son sus mejores resultados. Agregar el tenant a la expresión obliga a bm25 a recorrer todas sus filas
+    filas = session.execute(text("SELECT rowid, bm25({0}, {1}) AS puntaje, administrador FROM {0} WHERE {0} MATCH :expresion " \
+        "ORDER BY puntaje LIMIT :candidatos".format(tabla + '_busqueda', pesos)), \
+        {'expresion': expresion, 'candidatos': candidatos}).fetchall()
+    propios = [id_fila for id_fila, puntaje, administrador in filas if administrador == id_administrador]
+    if len(filas) < candidatos or len(propios) >= limite:
+        return propios[:limite]
+
+    # Los mejores candidatos son de otros tenants: se repite la búsqueda restringida al tenant, cuyo costo crece con su tamaño
+    expresion = 'administrador : "{}" AND {}'.format(int(id_administrador), expresion)
+    consulta = text("SELECT rowid FROM {0} WHERE {0} MATCH :expresion ORDER BY bm25({0}, {1}) LIMIT :limite" \
+        .format(tabla + '_busqueda', pesos))
+    return [fila[0] for fila in session.execute(consulta, {'expresion': expresion, 'limite': limite})]
@@ -0,0 +1,65 @@
+import os
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+# Motores ya preparados en este proceso; el hook de fork se registra una sola vez y los descarta a todos
+motores_preparados = weakref.WeakSet()
+
+def descartar_motores_heredados():
+    # Las conexiones heredadas del proceso padre (gunicorn --preload) no se comparten con los workers
+    for engine in list(motores_preparados):
+        engine.dispose()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=descartar_motores_heredados)
+
+
+def leer_entero(nombre, por_defecto):
+    valor = os.environ.get(nombre)
+    return int(valor) if valor not in (None, '') else por_defecto
+
+def configurar_base_de_datos(app):
+    # La URI y el perfil del motor se leen del entorno para poder ajustarlos por despliegue
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', 'sqlite:///dbapp.sqlite'))
+    app.config.setdefault('SQLITE_JOURNAL_MODE', os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'))
+    app.config.setdefault('SQLITE_SYNCHRONOUS', os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'))
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT', leer_entero('SQLITE_BUSY_TIMEOUT', 5000))
+    app.config.setdefault('SQLITE_MMAP_SIZE', leer_entero('SQLITE_MMAP_SIZE', 268435456))
+    app.config.setdefault('SQLITE_CACHE_SIZE', leer_entero('SQLITE_CACHE_SIZE', -64000))
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    opciones = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if url.drivername.startswith('sqlite'):
+        opciones.setdefault('connect_args', {})
+        opciones['connect_args'].setdefault('timeout', app.config['SQLITE_BUSY_TIMEOUT'] / 1000)
+        opciones['connect_args'].setdefault('check_same_thread', False)
+        if url.database in (None, '', ':memory:'):
+            return
+    # Un pool pequeño por proceso: cada worker de gunicorn abre sus propias conexiones
+    opciones.setdefault('poolclass', QueuePool)
+    opciones.setdefault('pool_size', leer_entero('DB_POOL_SIZE', 5))
+    opciones.setdefault('max_overflow', leer_entero('DB_MAX_OVERFLOW', 10))
+    opciones.setdefault('pool_recycle', leer_entero('DB_POOL_RECYCLE', 3600))
+
+def preparar_motor(app, engine):
+    if engine.dialect.name == 'sqlite':
+        pragmas = [
+            'PRAGMA journal_mode={}'.format(app.config['SQLITE_JOURNAL_MODE']),
+            'PRAGMA synchronous={}'.format(app.config['SQLITE_SYNCHRONOUS']),
+            'PRAGMA busy_timeout={:d}'.format(app.config['SQLITE_BUSY_TIMEOUT']),
+            'PRAGMA mmap_size={:d}'.format(app.config['SQLITE_MMAP_SIZE']),
+            'PRAGMA cache_size={:d}'.format(app.config['SQLITE_CACHE_SIZE']),
+        ]
+
+        @event.listens_for(engine, 'connect')
+        def aplicar_pragmas(conexion_dbapi, registro):
+            cursor = conexion_dbapi.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    motores_preparados.add(engine)
@@ -1,13 +1,121 @@
 from flask_sqlalchemy import SQLAlchemy
 from marshmallow import fields, Schema
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
-from sqlalchemy import Date
+from sqlalchemy import BigInteger, Date, Float, Numeric, case, cast, event, func, inspect, select, text, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.types import TypeDecorator
+from decimal import Decimal, ROUND_HALF_UP
+import logging
+import threading
+import time
+
+from .busqueda import crear_indices_busqueda
 
 db = SQLAlchemy()
+logger = logging.getLogger(__name__)
+
+def actualizar_esquema(engine):
+    # Agrega a las tablas existentes las columnas e índices nuevos de los modelos, create_all solo crea tablas faltantes
+    inspector = inspect(engine)
+    with engine.begin() as conexion:
+        for tabla in db.metadata.sorted_tables:
+            columnas_existentes = {columna['name'] for columna in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name not in columnas_existentes:
+                    tipo = columna.type.compile(dialect=engine.dialect)
+                    conexion.execute(text('ALTER TABLE {} ADD COLUMN {} {}'.format(tabla.name, columna.name, tipo)))
+    for tabla in db.metadata.sorted_tables:
+        indices_existentes = {indice['name'] for indice in inspector.get_indexes(tabla.name)}
+        for indice in tabla.indexes:
+            if indice.name not in indices_existentes:
+                try:
+                    indice.create(bind=engine)
+                except IntegrityError:
+                    # Los datos existentes tienen duplicados, el índice único se crea cuando se depuren
+                    logger.warning('No se pudo crear el índice %s por valores duplicados', indice.name)
+
+def migrar_datos(engine):
+    # Cada migración de datos corre una sola vez y queda registrada en la tabla migracion
+    tabla = Migracion.__table__
+    with engine.connect() as conexion:
+        aplicadas = {fila[0] for fila in conexion.execute(select(tabla.c.nombre))}
+    for nombre, migracion in MIGRACIONES:
+        if nombre in aplicadas:
+            continue
+        with engine.begin() as conexion:
+            migracion(conexion)
+            conexion.execute(tabla.insert().values(nombre=nombre, aplicada=siguiente_version()))
+        logger.info('Migración de datos %s aplicada', nombre)
+
+def crear_esquema(engine):
+    # Se ejecuta de forma explícita (flask crear-esquema), nunca al construir la aplicación
+    db.metadata.create_all(bind=engine)
+    actualizar_esquema(engine)
+    migrar_datos(engine)
+    crear_indices_busqueda(engine)
+
+_ultima_version = 0
+_candado_version = threading.Lock()
+
+def siguiente_version():
+    # Versión monotónica basada en microsegundos: sirve de ETag y de Last-Modified
+    global _ultima_version
+    with _candado_version:
+        _ultima_version = max(time.time_ns() // 1000, _ultima_version + 1)
+        return _ultima_version
+
+class Escalado(TypeDecorator):
+    # Decimal guardado como entero escalado por 10^decimales: SUM en SQL es exacto y SQLite nunca lo convierte a float
+    impl = BigInteger
+    cache_ok = True
+
+    # Numeric entregaba 10 decimales en SQLite; se conservan para que el JSON no cambie
+    SALIDA = Decimal('1E-10')
+
+    # Mayor entero que cabe en un BIGINT (INTEGER de 8 bytes en SQLite)
+    MAXIMO = 2 ** 63 - 1
+
+    def __init__(self, decimales):
+        super().__init__()
+        self.decimales = decimales
+
+    def escalar(self, valor):
+        return int(Decimal(str(valor)).scaleb(self.decimales).to_integral_value(ROUND_HALF_UP))
+
+    def admite(self, valor):
+        # Las vistas lo revisan antes de guardar: fuera de rango, SQLite no puede guardar el entero
+        numero = Decimal(str(valor))
+        return numero.is_finite() and abs(self.escalar(numero)) <= Escalado.MAXIMO
+
+    def process_bind_param(self, valor, dialect):
+        if valor is None:
+            return None
+        return self.escalar(valor)
+
+    def process_result_value(self, valor, dialect):
+        if valor is None:
+            return None
+        return Decimal(valor).scaleb(-self.decimales).quantize(Escalado.SALIDA)
+
+def crudo(columna):
+    # La columna como entero sin escalar, para operar en SQL sin conversiones
+    return type_coerce(columna, BigInteger)
+
+def dividir(dividendo, divisor, factor):
+    # dividendo * factor / divisor redondeado al más cercano, para valores no negativos. Se divide primero y solo se
+    # multiplica el resto: ningún intermedio supera al resultado, así SQLite nunca desborda int64 y pasa a REAL
+    cociente, resto = dividendo / divisor, dividendo % divisor
+    return cociente * factor + (resto * factor * 2 + divisor) / (divisor * 2)
+
+class Migracion(db.Model):
+    nombre = db.Column(db.String(128), primary_key=True)
+    aplicada = db.Column(db.BigInteger)
 
 class Restaurante(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(128))
+    version = db.Column(db.BigInteger, default=siguiente_version)
+    nombre = db.Column(db.String(128), index=True)
     direccion = db.Column(db.String(128))
     telefono = db.Column(db.String(128))
     redes_sociales = db.Column(db.String(128))
@@ -16,37 +124,46 @@ class Restaurante(db.Model):
     servicio_domicilio = db.Column(db.Boolean)
     tipo_comida = db.Column(db.String(128))
     plataformas = db.Column(db.String(128))
-    administrador = db.Column(db.Integer, db.ForeignKey('administrador.id'))
+    administrador = db.Column(db.Integer, db.ForeignKey('administrador.id'), index=True)
     chefs = db.relationship('Chef', cascade='all, delete, delete-orphan')
 
 class Ingrediente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, default=siguiente_version)
     nombre = db.Column(db.String(128))
     unidad = db.Column(db.String(128))
-    costo = db.Column(db.Numeric)
-    calorias = db.Column(db.Numeric)
+    costo = db.Column(Escalado(4))
+    calorias = db.Column(Escalado(3))
     sitio = db.Column(db.String(128))
-    administrador = db.Column(db.Integer, db.ForeignKey('administrador.id'))
+    administrador = db.Column(db.Integer, db.ForeignKey('administrador.id'), index=True)
 
 class RecetaIngrediente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    cantidad = db.Column(db.Numeric)
-    ingrediente = db.Column(db.Integer, db.ForeignKey('ingrediente.id'))
-    receta = db.Column(db.Integer, db.ForeignKey('receta.id'))
+    version = db.Column(db.BigInteger, default=siguiente_version)
+    cantidad = db.Column(Escalado(3))
+    ingrediente = db.Column(db.Integer, db.ForeignKey('ingrediente.id'), index=True)
+    receta = db.Column(db.Integer, db.ForeignKey('receta.id'), index=True)
 
 class Receta(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, default=siguiente_version)
     nombre = db.Column(db.String(128))
     duracion = db.Column(db.Numeric)
-    porcion = db.Column(db.Numeric)
+    porcion = db.Column(Escalado(3))
     preparacion = db.Column(db.String)
+    # Los totales tienen la escala de cantidad por costo o calorías, así su SUM no redondea
+    costo_total = db.Column(Escalado(7))
+    calorias_total = db.Column(Escalado(6))
+    costo_porcion = db.Column(Escalado(7))
+    calorias_porcion = db.Column(Escalado(6))
     ingredientes = db.relationship('RecetaIngrediente', cascade='all, delete, delete-orphan')
-    usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'))
-    administrador = db.Column(db.Integer, db.ForeignKey('administrador.id'))
+    usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'), index=True)
+    administrador = db.Column(db.Integer, db.ForeignKey('administrador.id'), index=True)
 
 class Usuario(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    usuario = db.Column(db.String(50))
+    version = db.Column(db.BigInteger, default=siguiente_version)
+    usuario = db.Column(db.String(50), unique=True, index=True)
     contrasena = db.Column(db.String(1000))
     nombre = db.Column(db.String(100))
     tipo = db.Column(db.String)
@@ -65,13 +182,17 @@ class Administrador(Usuario):
 
 class Chef(Usuario):
     id = db.Column(db.Integer, db.ForeignKey('usuario.id'), primary_key=True)
-    restaurante = db.Column(db.Integer, db.ForeignKey('restaurante.id'))
+    restaurante = db.Column(db.Integer, db.ForeignKey('restaurante.id'), index=True)
     __mapper_args__ = {
         'polymorphic_identity': 'Chef',
     }
 
 class Menu(db.Model):
+    # Los pronósticos de demanda buscan los menús vigentes de un restaurante a partir de una fecha. Como restaurante
+    # es la primera columna, el mismo índice atiende las búsquedas solo por restaurante
+    __table_args__ = (db.Index('ix_menu_restaurante_fechaFin', 'restaurante', 'fechaFin'),)
     id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, default=siguiente_version)
     nombre = db.Column(db.String(100))
     descripcion = db.Column(db.String(200))
     fechaInicio = db.Column(db.Date)
@@ -84,13 +205,105 @@ class Menu(db.Model):
 
 class MenuReceta(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, default=siguiente_version)
     personas = db.Column(db.Integer)
-    menu = db.Column(db.Integer, db.ForeignKey('menu.id'))
+    menu = db.Column(db.Integer, db.ForeignKey('menu.id'), index=True)
     receta = db.Column(db.Integer, db.ForeignKey('receta.id'))
     
+def valores_totales():
+    # Valores de un UPDATE sobre receta que recalcula sus totales con SUM exactos sobre los enteros escalados
+    def total(columna_total, columna):
+        factor = 10 ** (columna_total.type.decimales - RecetaIngrediente.cantidad.type.decimales - columna.type.decimales)
+        return select(func.coalesce(func.sum(crudo(RecetaIngrediente.cantidad) * crudo(columna)), 0) * factor) \
+            .where(RecetaIngrediente.receta == Receta.id) \
+            .where(RecetaIngrediente.ingrediente == Ingrediente.id) \
+            .scalar_subquery()
+    return {
+        Receta.costo_total: total(Receta.costo_total, Ingrediente.costo),
+        Receta.calorias_total: total(Receta.calorias_total, Ingrediente.calorias)
+    }
+
+def valores_porciones():
+    # Segundo UPDATE: SET ve los valores anteriores de la fila, así que las porciones parten de los totales ya guardados
+    def por_porcion(columna_porcion, columna_total):
+        factor = 10 ** (columna_porcion.type.decimales - columna_total.type.decimales + Receta.porcion.type.decimales)
+        return case((crudo(Receta.porcion) > 0, dividir(crudo(columna_total), crudo(Receta.porcion), factor)), else_=None)
+    return {
+        Receta.costo_porcion: por_porcion(Receta.costo_porcion, Receta.costo_total),
+        Receta.calorias_porcion: por_porcion(Receta.calorias_porcion, Receta.calorias_total)
+    }
+
+class TotalesFueraDeRango(Exception):
+    # Los totales de una receta no caben en un BIGINT escalado; las vistas responden 422
+    pass
+
+def totales_admitidos(session, criterio):
+    # Estima en REAL los totales y porciones de las recetas que cumplen `criterio` antes de escribirlos. En enteros,
+    # SQLite pasaría a REAL en silencio un producto desbordado y fallaría con "integer overflow" en SUM
+    estimaciones = []
+    for columna_total, columna_porcion, columna in ((Receta.costo_total, Receta.costo_porcion, Ingrediente.costo), \
+            (Receta.calorias_total, Receta.calorias_porcion, Ingrediente.calorias)):
+        factor = 10 ** (columna_total.type.decimales - RecetaIngrediente.cantidad.type.decimales - columna.type.decimales)
+        factor_porcion = 10 ** (columna_porcion.type.decimales - columna_total.type.decimales + Receta.porcion.type.decimales)
+        total = func.abs(func.sum(cast(crudo(RecetaIngrediente.cantidad), Float) * crudo(columna)) * factor)
+        estimaciones.append(total)
+        estimaciones.append(total * factor_porcion / func.nullif(func.abs(func.max(crudo(Receta.porcion))), 0))
+        # dividir multiplica el resto, que es menor que la porción, por 2 * factor
+        estimaciones.append(func.abs(cast(func.max(crudo(Receta.porcion)), Float)) * 2 * factor_porcion)
+    por_receta = select(*[estimacion.label('e{}'.format(i)) for i, estimacion in enumerate(estimaciones)]) \
+        .select_from(Receta) \
+        .outerjoin(RecetaIngrediente, RecetaIngrediente.receta == Receta.id) \
+        .outerjoin(Ingrediente, Ingrediente.id == RecetaIngrediente.ingrediente) \
+        .where(criterio).group_by(Receta.id).subquery()
+    maximos = session.execute(select(*[func.max(columna) for columna in por_receta.c])).one()
+    return all(maximo is None or maximo < Escalado.MAXIMO for maximo in maximos)
+
+def migrar_enteros_escalados(conexion):
+    # Pasa costos, calorías, cantidades y porciones de Numeric a enteros escalados y rehace los totales con ellos
+    totales = (Receta.costo_total, Receta.calorias_total, Receta.costo_porcion, Receta.calorias_porcion)
+    for columna in (Ingrediente.costo, Ingrediente.calorias, RecetaIngrediente.cantidad, Receta.porcion) + totales:
+        tabla, nombre = columna.class_.__tablename__, columna.key
+        valor = 'NULL' if columna in totales else 'CAST(ROUND({} * {}) AS BIGINT)'.format(nombre, 10 ** columna.type.decimales)
+        if conexion.dialect.name == 'sqlite':
+            # SQLite no cambia tipos de columna; con afinidad NUMERIC los enteros se guardan como INTEGER
+            conexion.execute(text('UPDATE {0} SET {1} = {2} WHERE {1} IS NOT NULL'.format(tabla, nombre, valor)))
+        elif any(existente['name'] == nombre and isinstance(existente['type'], Numeric) \
+                for existente in inspect(conexion).get_columns(tabla)):
+            conexion.execute(text('ALTER TABLE {} ALTER COLUMN {} TYPE BIGINT USING {}'.format(tabla, nombre, valor)))
+    for valores in (valores_totales(), valores_porciones()):
+        conexion.execute(Receta.__table__.update().values({columna.key: valor for columna, valor in valores.items()}))
+
+MIGRACIONES = (
+    ('enteros_escalados', migrar_enteros_escalados),
+)
+
+# Al modificar una línea se cambia también la versión del registro que la contiene
+PADRES_VERSIONADOS = {
+    RecetaIngrediente: (Receta, 'receta'),
+    MenuReceta: (Menu, 'menu'),
+    Chef: (Restaurante, 'restaurante')
+}
+
+@event.listens_for(Session, 'before_flush')
+def actualizar_versiones(session, contexto, instancias):
+    version = siguiente_version()
+    for instancia in list(session.new) + list(session.dirty) + list(session.deleted):
+        if instancia in session.dirty and not session.is_modified(instancia):
+            continue
+        if hasattr(instancia, 'version') and instancia not in session.deleted:
+            instancia.version = version
+        for modelo, (modelo_padre, llave) in PADRES_VERSIONADOS.items():
+            if isinstance(instancia, modelo):
+                historia = inspect(instancia).attrs[llave].history
+                for id_padre in set(historia.added or ()) | set(historia.unchanged or ()) | set(historia.deleted or ()):
+                    padre = session.get(modelo_padre, id_padre) if id_padre is not None else None
+                    if padre is not None and padre not in session.deleted:
+                        padre.version = version
+
 class MenuRecetaSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = MenuReceta
+        exclude = ('version',)
         include_relationships = True
         include_fk = True
         load_instance = True
@@ -101,6 +314,7 @@ class MenuRecetaSchema(SQLAlchemyAutoSchema):
 class MenuSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Menu
+        exclude = ('version',)
         include_relationships = True
         include_fk = True
         load_instance = True
@@ -112,6 +326,7 @@ class MenuSchema(SQLAlchemyAutoSchema):
 class RestauranteSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Restaurante
+        exclude = ('version',)
         include_relationships = True
         include_fk = True
         load_instance = True
@@ -121,6 +336,7 @@ class RestauranteSchema(SQLAlchemyAutoSchema):
 class IngredienteSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Ingrediente
+        exclude = ('version',)
         load_instance = True
         
     id = fields.String()
@@ -131,6 +347,7 @@ class IngredienteSchema(SQLAlchemyAutoSchema):
 class RecetaIngredienteSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = RecetaIngrediente
+        exclude = ('version',)
         include_relationships = True
         include_fk = True
         load_instance = True
@@ -142,6 +359,7 @@ class RecetaIngredienteSchema(SQLAlchemyAutoSchema):
 class RecetaSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Receta
+        exclude = ('version',)
         include_relationships = True
         include_fk = True
         load_instance = True
@@ -149,11 +367,16 @@ class RecetaSchema(SQLAlchemyAutoSchema):
     id = fields.String()
     duracion = fields.String()
     porcion = fields.String()
+    costo_total = fields.String()
+    calorias_total = fields.String()
+    costo_porcion = fields.String()
+    calorias_porcion = fields.String()
     ingredientes = fields.List(fields.Nested(RecetaIngredienteSchema()))
 
 class AdministradorSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Administrador
+        exclude = ('version',)
         include_relationships = True
         load_instance = True
 
@@ -162,6 +385,7 @@ class AdministradorSchema(SQLAlchemyAutoSchema):
 class ChefSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Chef
+        exclude = ('version',)
         include_relationships = True
         load_instance = True
         
@@ -170,6 +394,7 @@ class ChefSchema(SQLAlchemyAutoSchema):
 class UsuarioSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Usuario
+        exclude = ('version',)
         include_relationships = True
         include_fk = True
         load_instance = True
@@ -0,0 +1,92 @@
+from operator import attrgetter, itemgetter
+
+from marshmallow import fields, missing
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from marshmallow_sqlalchemy.fields import Related, RelatedList
+
+
+def convertir_texto(valor):
+    if valor is None or valor.__class__ is str:
+        return valor
+    if isinstance(valor, bytes):
+        return valor.decode('utf-8')
+    return str(valor)
+
+def convertir_entero(valor):
+    return None if valor is None else int(valor)
+
+def convertir_decimal_flotante(valor):
+    return None if valor is None else float(valor)
+
+def aplicar(convertir, valor):
+    return convertir(valor)
+
+class SerializadorCompilado():
+    # Equivale a schema.dump pero resuelve los campos una sola vez: los valores se leen de una vez del
+    # __dict__ de la instancia y cada campo tiene precalculada su conversión, sin pasar por Field.serialize
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.compatible = True
+        modelo = schema.opts.model
+        claves = []
+        atributos = []
+        conversiones = []
+        for nombre, campo in schema.dump_fields.items():
+            atributo = campo.attribute or nombre
+            # marshmallow omite la clave cuando el objeto no tiene el atributo y el campo no tiene valor por defecto
+            if not hasattr(modelo, atributo) and campo.default is missing:
+                continue
+            claves.append(campo.data_key or nombre)
+            atributos.append(atributo)
+            conversiones.append(self.compilarCampo(campo, nombre))
+        self.claves = tuple(claves)
+        self.conversiones = tuple(conversiones)
+        self.obtener = attrgetter(*atributos) if len(atributos) > 1 else (lambda objeto: (getattr(objeto, atributos[0]),))
+        self.obtenerCargados = itemgetter(*atributos) if len(atributos) > 1 else (lambda estado: (estado[atributos[0]],))
+        # Los esquemas con hooks de dump siguen usando marshmallow
+        self.compatible = self.compatible and not schema._has_processors(PRE_DUMP) and not schema._has_processors(POST_DUMP)
+
+    def compilarCampo(self, campo, nombre):
+        tipo = type(campo)
+        if tipo is fields.String:
+            return convertir_texto
+        if tipo is fields.Integer and not campo.as_string:
+            return convertir_entero
+        if tipo is fields.Float and not campo.as_string:
+            return convertir_decimal_flotante
+        if tipo is fields.Boolean:
+            return lambda valor: valor if valor is None or valor is True or valor is False else campo._serialize(valor, nombre, None)
+        if tipo is fields.Date and campo.format in campo.SERIALIZATION_FUNCS:
+            formatear = campo.SERIALIZATION_FUNCS[campo.format]
+            return lambda valor: None if valor is None else formatear(valor)
+        if tipo is fields.List and type(campo.inner) is fields.Nested and not campo.inner.many \
+                and not campo.inner.only and not campo.inner.exclude:
+            anidado = SerializadorCompilado(campo.inner.schema)
+            return lambda valor: None if valor is None else anidado.dumpMany(valor)
+        if tipo is RelatedList and type(campo.inner) is Related and len(campo.inner.related_keys) == 1:
+            llave = campo.inner.related_keys[0].key
+            return lambda valor: None if valor is None else [None if relacionado is None else getattr(relacionado, llave) for relacionado in valor]
+        # Con cualquier otro tipo de campo el esquema completo se sigue serializando con marshmallow
+        self.compatible = False
+        return None
+
+    def valores(self, objeto):
+        # Los atributos ya cargados están en __dict__; si falta alguno (expirado o diferido) se usa el descriptor del ORM
+        try:
+            return self.obtenerCargados(objeto.__dict__)
+        except KeyError:
+            return self.obtener(objeto)
+
+    def dump(self, objeto):
+        if not self.compatible:
+            return self.schema.dump(objeto)
+        return dict(zip(self.claves, map(aplicar, self.conversiones, self.valores(objeto))))
+
+    def dumpMany(self, objetos):
+        if not self.compatible:
+            return self.schema.dump(objetos, many=True)
+        claves = self.claves
+        conversiones = self.conversiones
+        valores = self.valores
+        return [dict(zip(claves, map(aplicar, conversiones, valores(objeto)))) for objeto in objetos]
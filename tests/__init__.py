@@ -0,0 +1,18 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Cada proceso de pruebas usa su propia base de datos y su propia caché en un directorio temporal,
+# así la suite no toca dbapp.sqlite y varios procesos pueden correrla en paralelo
+DIRECTORIO_PRUEBAS = tempfile.mkdtemp(prefix='recetario-pruebas-')
+atexit.register(shutil.rmtree, DIRECTORIO_PRUEBAS, True)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(DIRECTORIO_PRUEBAS, 'pruebas.sqlite'))
+os.environ.setdefault('CACHE_RESPUESTAS_RUTA', os.path.join(DIRECTORIO_PRUEBAS, 'cache.sqlite'))
+os.environ.setdefault('TRABAJOS_RUTA', os.path.join(DIRECTORIO_PRUEBAS, 'trabajos.sqlite'))
+
+# Los trabajos corren dentro de la solicitud: un hilo aparte no puede compartir la conexión de la transacción de la prueba
+os.environ.setdefault('TRABAJOS_HILOS', '0')
+
+# Toda la suite vigila las consultas: una solicitud que repita una lectura más de REPETICIONES_PERMITIDAS veces falla
+os.environ.setdefault('VIGILAR_CONSULTAS', '1')
@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from faker import Faker
+from sqlalchemy import event
+from modelos import db, crear_esquema
+from vistas import cache_respuestas
+
+from app import app
+
+
+motor = db.get_engine(app)
+
+@event.listens_for(motor, 'connect')
+def desactivar_transaccion_implicita(conexion_dbapi, registro):
+    # pysqlite abre las transacciones por su cuenta y rompe los SAVEPOINT; se delega el BEGIN en SQLAlchemy
+    conexion_dbapi.isolation_level = None
+
+@event.listens_for(motor, 'begin')
+def iniciar_transaccion(conexion):
+    conexion.exec_driver_sql('BEGIN')
+
+# Crear la aplicación no toca la base de datos; la base temporal del proceso se prepara aquí
+crear_esquema(motor)
+
+
+class PruebaAislada(TestCase):
+    # Cada prueba corre dentro de una transacción que se revierte al terminar: los commits de las vistas
+    # solo cierran un SAVEPOINT y no queda nada escrito en la base de datos del proceso
+
+    # Crear un Faker recorre todos sus proveedores; una sola instancia sirve para toda la suite
+    data_factory = Faker()
+
+    def run(self, result=None):
+        contexto = app.app_context()
+        contexto.push()
+        conexion = db.engine.connect()
+        transaccion = conexion.begin()
+        # Sin binds por tabla: Flask-SQLAlchemy los asigna al motor y pasarían por encima de la conexión
+        sesion_original = db.session
+        db.session = db.create_scoped_session({'bind': conexion, 'binds': {}})
+        session = db.session()
+        estado = {'punto': conexion.begin_nested()}
+
+        @event.listens_for(session, 'after_transaction_end')
+        def reabrir_punto_de_guardado(session, transaccion_terminada):
+            # Tras cada commit o rollback de la sesión se abre un SAVEPOINT nuevo
+            if not estado['punto'].is_active:
+                estado['punto'] = conexion.begin_nested()
+
+        # Lo guardado en la caché pertenece a registros que las pruebas anteriores revirtieron
+        cache_respuestas.limpiar()
+        try:
+            return super().run(result)
+        finally:
+            db.session.remove()
+            db.session = sesion_original
+            transaccion.rollback()
+            conexion.close()
+            contexto.pop()
@@ -0,0 +1,66 @@
+"""Corre la suite de pruebas repartida en varios procesos, cada uno con su propia base de datos.
+
+Uso:
+    python -m tests.paralelo                             # un proceso por núcleo
+    python -m tests.paralelo -j 4                        # cuatro procesos
+    python -m tests.paralelo tests.test_chef tests.test_login
+"""
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tests import DIRECTORIO_PRUEBAS
+
+
+def descubrir():
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    return {'tests.' + os.path.basename(ruta)[:-3]: os.path.getsize(ruta)
+            for ruta in glob.glob(os.path.join(raiz, 'test_*.py'))}
+
+def repartir(modulos, procesos):
+    # Los módulos más grandes primero, cada uno al grupo que lleva menos; el tamaño aproxima la duración
+    grupos = [[0, []] for i in range(min(procesos, len(modulos)))]
+    for modulo, tamano in sorted(modulos.items(), key=lambda elemento: -elemento[1]):
+        grupo = min(grupos, key=lambda grupo: grupo[0])
+        grupo[0] += tamano
+        grupo[1].append(modulo)
+    return [sorted(grupo[1]) for grupo in grupos]
+
+def correr(grupo, entorno):
+    inicio = time.perf_counter()
+    resultado = subprocess.run([sys.executable, '-m', 'unittest'] + grupo, env=entorno,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return grupo, resultado.returncode, resultado.stdout, time.perf_counter() - inicio
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-j', '--procesos', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('modulos', nargs='*', help='módulos de prueba, por defecto todos los de tests/')
+    argumentos = parser.parse_args()
+
+    modulos = descubrir()
+    if argumentos.modulos:
+        modulos = {modulo: modulos.get(modulo, 0) for modulo in argumentos.modulos}
+    # Cada proceso hijo crea su propio directorio temporal; no hereda el de este proceso
+    entorno = {nombre: valor for nombre, valor in os.environ.items() if DIRECTORIO_PRUEBAS not in valor}
+
+    inicio = time.perf_counter()
+    grupos = repartir(modulos, max(argumentos.procesos, 1))
+    with ThreadPoolExecutor(max_workers=len(grupos)) as ejecutor:
+        resultados = list(ejecutor.map(lambda grupo: correr(grupo, entorno), grupos))
+
+    fallidos = 0
+    for grupo, codigo, salida, duracion in resultados:
+        print('{} ({:.2f} s): {}'.format('OK' if codigo == 0 else 'FALLÓ', duracion, ' '.join(grupo)))
+        if codigo != 0:
+            fallidos += 1
+            print(salida)
+    print('{} procesos, {:.2f} s en total'.format(len(grupos), time.perf_counter() - inicio))
+    return 1 if fallidos else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import unittest
+
+from sqlalchemy import text
+from modelos import db, Administrador
+from tests import DIRECTORIO_PRUEBAS
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestAislamiento(PruebaAislada):
+
+    def contar_en_otra_conexion(self, usuario):
+        # Otra conexión solo ve lo que realmente quedó escrito en la base de datos
+        with db.engine.connect() as conexion:
+            return conexion.execute(text("SELECT count(*) FROM usuario WHERE usuario = :usuario"), {"usuario": usuario}).scalar()
+
+    def test_base_de_datos_del_proceso(self):
+        self.assertIn(DIRECTORIO_PRUEBAS, app.config['SQLALCHEMY_DATABASE_URI'])
+
+    def test_commits_de_una_prueba_se_revierten(self):
+        usuario = 'test_' + self.data_factory.uuid4()
+
+        class PruebaQueEscribe(PruebaAislada):
+            def test_escribir(prueba):
+                db.session.add(Administrador(usuario=usuario, contrasena='x'))
+                db.session.commit()
+                # Dentro de la prueba el commit es visible
+                prueba.assertEqual(Administrador.query.filter(Administrador.usuario == usuario).count(), 1)
+
+        resultado = unittest.TestResult()
+        PruebaQueEscribe('test_escribir').run(resultado)
+
+        self.assertTrue(resultado.wasSuccessful(), resultado.failures + resultado.errors)
+        self.assertEqual(self.contar_en_otra_conexion(usuario), 0)
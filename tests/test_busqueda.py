@@ -0,0 +1,137 @@
+import json
+import hashlib
+
+from modelos import db, Administrador, Ingrediente, Receta
+from tests.aislamiento import PruebaAislada
+
+from app import app
+from modelos.busqueda import buscar
+from vistas import BusquedaUtil
+
+
+class TestBusqueda(PruebaAislada):
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.token, self.usuario_id = self.crear_administrador()
+
+    def crear_administrador(self):
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+        db.session.add(Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada))
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                           data=json.dumps(usuario_login),
+                                           headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+        return respuesta_login["token"], respuesta_login["id"]
+
+    def crear_ingrediente(self, nombre, sitio, administrador=None):
+        ingrediente = Ingrediente(nombre=nombre, unidad='kg', costo=1, calorias=1, sitio=sitio,
+                                  administrador=administrador or self.usuario_id)
+        db.session.add(ingrediente)
+        db.session.commit()
+        return ingrediente
+
+    def buscar(self, texto, tipo=None, token=None, id_usuario=None):
+        parametros = {'q': texto}
+        if tipo is not None:
+            parametros['tipo'] = tipo
+        resultado = self.client.get("/usuarios/{}/buscar".format(id_usuario or self.usuario_id), query_string=parametros,
+                                    headers={"Authorization": "Bearer {}".format(token or self.token)})
+        return resultado.status_code, json.loads(resultado.get_data())
+
+    def nombres(self, resultados):
+        return [resultado['nombre'] for resultado in resultados]
+
+    def test_autocompletar_por_prefijo(self):
+        self.crear_ingrediente('Arroz blanco', 'Plaza')
+        self.crear_ingrediente('Arveja verde', 'Plaza')
+        self.crear_ingrediente('Pollo', 'Carnicería')
+
+        codigo, datos = self.buscar('ar')
+        self.assertEqual(codigo, 200)
+        self.assertEqual(sorted(self.nombres(datos['ingredientes'])), ['Arroz blanco', 'Arveja verde'])
+        self.assertEqual(self.nombres(self.buscar('arroz bla')[1]['ingredientes']), ['Arroz blanco'])
+
+    def test_coincidencia_en_nombre_antes_que_en_sitio(self):
+        self.crear_ingrediente('Harina', 'Mercado del queso')
+        self.crear_ingrediente('Queso campesino', 'Tienda')
+
+        codigo, datos = self.buscar('queso', tipo='ingredientes')
+        self.assertEqual(self.nombres(datos['ingredientes']), ['Queso campesino', 'Harina'])
+        self.assertNotIn('recetas', datos)
+
+    def test_sin_tildes_y_recetas(self):
+        self.crear_ingrediente('Azúcar morena', 'Plaza')
+        receta = Receta(nombre='Arroz con leche', preparacion='Cocinar con azúcar y canela', duracion=30, porcion=4,
+                        administrador=self.usuario_id, usuario=self.usuario_id)
+        db.session.add(receta)
+        db.session.commit()
+
+        codigo, datos = self.buscar('azucar')
+        self.assertEqual(self.nombres(datos['ingredientes']), ['Azúcar morena'])
+        self.assertEqual(datos['recetas'][0]['id'], str(receta.id))
+        self.assertEqual(self.nombres(datos['recetas']), ['Arroz con leche'])
+
+    def test_solo_del_tenant(self):
+        token_ajeno, id_ajeno = self.crear_administrador()
+        self.crear_ingrediente('Lenteja', 'Plaza')
+        self.crear_ingrediente('Lenteja roja', 'Plaza', administrador=id_ajeno)
+
+        self.assertEqual(self.nombres(self.buscar('lent')[1]['ingredientes']), ['Lenteja'])
+        self.assertEqual(self.nombres(self.buscar('lent', token=token_ajeno, id_usuario=id_ajeno)[1]['ingredientes']), ['Lenteja roja'])
+
+    def test_candidatos_de_otros_tenants(self):
+        _, id_ajeno = self.crear_administrador()
+        for i in range(3):
+            self.crear_ingrediente('Maíz {}'.format(i), 'Plaza', administrador=id_ajeno)
+        self.crear_ingrediente('Maíz pira', 'Plaza')
+
+        # Los primeros candidatos del índice son todos de otro tenant
+        candidatos = BusquedaUtil.CANDIDATOS
+        BusquedaUtil.CANDIDATOS = 2
+        try:
+            self.assertEqual(self.nombres(self.buscar('maiz')[1]['ingredientes']), ['Maíz pira'])
+        finally:
+            BusquedaUtil.CANDIDATOS = candidatos
+
+    def test_candidatos_son_los_mejor_puntuados(self):
+        for i in range(3):
+            self.crear_ingrediente('Harina {}'.format(i), 'Mercado del queso')
+        queso = self.crear_ingrediente('Queso campesino', 'Tienda')
+
+        # La mejor coincidencia tiene el rowid más alto y no está entre los primeros candidatos del índice
+        self.assertEqual(buscar(db.session, Ingrediente, self.usuario_id, 'queso', 1, 2), [queso.id])
+
+    def test_indice_sigue_cambios_e_importaciones(self):
+        ingrediente = self.crear_ingrediente('Tomate', 'Plaza')
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        self.client.put("/ingredientes/{}".format(ingrediente.id), headers=headers, data=json.dumps(
+            {"nombre": "Cebolla", "unidad": "kg", "costo": 2, "calorias": 1, "sitio": "Plaza"}))
+        self.assertEqual(self.buscar('tomate')[1]['ingredientes'], [])
+        self.assertEqual(self.nombres(self.buscar('ceb')[1]['ingredientes']), ['Cebolla'])
+
+        self.client.delete("/ingredientes/{}".format(ingrediente.id), headers=headers)
+        self.assertEqual(self.buscar('ceb')[1]['ingredientes'], [])
+
+        contenido = "nombre,unidad,costo,calorias,sitio\nPimentón,kg,1.5,20,Plaza\n"
+        self.client.post("/usuarios/{}/ingredientes/importar".format(self.usuario_id), data=contenido.encode('utf-8'),
+                         headers={'Content-Type': 'text/csv', "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(self.nombres(self.buscar('pimen')[1]['ingredientes']), ['Pimentón'])
+
+    def test_texto_con_sintaxis_fts(self):
+        self.crear_ingrediente('Arroz', 'Plaza')
+
+        codigo, datos = self.buscar('"arroz* OR (NEAR')
+        self.assertEqual(codigo, 200)
+        self.assertEqual(datos['ingredientes'], [])
+        self.assertEqual(self.buscar('')[1], {'ingredientes': [], 'recetas': []})
+        self.assertEqual(self.buscar('a')[1], {'ingredientes': [], 'recetas': []})
+        self.assertEqual(self.buscar('arroz', tipo='menus')[0], 422)
@@ -0,0 +1,71 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+
+from vistas import AlmacenCompartido, CacheRespuestas
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestCache(PruebaAislada):
+
+    def setUp(self):
+        descriptor, self.ruta = tempfile.mkstemp(suffix='.sqlite')
+        os.close(descriptor)
+        # Dos instancias sobre el mismo archivo simulan dos workers de gunicorn
+        self.worker_uno = CacheRespuestas()
+        self.worker_uno.almacen = AlmacenCompartido(self.ruta, 3, 5)
+        self.worker_dos = CacheRespuestas()
+        self.worker_dos.almacen = AlmacenCompartido(self.ruta, 3, 5)
+
+    def tearDown(self):
+        for sufijo in ('', '-wal', '-shm'):
+            if os.path.exists(self.ruta + sufijo):
+                os.remove(self.ruta + sufijo)
+
+    def test_valores_compartidos_entre_workers(self):
+        clave = self.worker_uno.clave('VistaIngredientes', 1, 'a')
+        self.worker_uno.guardar(clave, ['[]', {'ETag': '"x"'}], 60)
+
+        self.assertEqual(self.worker_dos.obtener(self.worker_dos.clave('VistaIngredientes', 1, 'a')), ['[]', {'ETag': '"x"'}])
+        self.assertEqual(self.worker_dos.aciertos, 1)
+
+    def test_invalidacion_visible_en_otro_worker(self):
+        self.worker_uno.guardar(self.worker_uno.clave('VistaIngredientes', 1, 'a'), [1], 60)
+        self.worker_uno.guardar(self.worker_uno.clave('VistaIngredientes', 2, 'a'), [2], 60)
+        self.worker_dos.invalidar(1)
+
+        self.assertIsNone(self.worker_uno.obtener(self.worker_uno.clave('VistaIngredientes', 1, 'a')))
+        self.assertEqual(self.worker_uno.obtener(self.worker_uno.clave('VistaIngredientes', 2, 'a')), [2])
+
+    def test_invalidacion_de_usuario(self):
+        generacion = self.worker_uno.generacionUsuario(7)
+        self.worker_dos.invalidarUsuario(7)
+        self.assertGreater(self.worker_uno.generacionUsuario(7), generacion)
+
+    def test_tamano_y_expiracion(self):
+        for i in range(0, 5):
+            self.worker_uno.guardar('clave-{}'.format(i), i, 60 + i)
+        self.worker_uno.guardar('vencida', 0, -1)
+
+        self.assertEqual(self.worker_dos.estadisticas()['entradas'], 3)
+        self.assertIsNone(self.worker_dos.obtener('vencida'))
+        self.assertIsNone(self.worker_dos.obtener('clave-0'))
+        self.assertEqual(self.worker_dos.obtener('clave-4'), 4)
+
+    def test_no_se_leen_valores_pickle(self):
+        # Un pickle plantado en el archivo ejecutaría código al cargarse; solo se acepta JSON
+        class Carga():
+            def __reduce__(self):
+                return (os.remove, (self.ruta,))
+        Carga.ruta = self.ruta
+        conexion = sqlite3.connect(self.ruta)
+        conexion.execute("INSERT INTO entrada (clave, valor, expira) VALUES (?, ?, ?)", ('plantada', pickle.dumps(Carga()), time.time() + 60))
+        conexion.commit()
+        conexion.close()
+
+        self.assertIsNone(self.worker_dos.obtener('plantada'))
+        self.assertTrue(os.path.exists(self.ruta))
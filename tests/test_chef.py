@@ -1,17 +1,15 @@
 import json
 import hashlib
-from unittest import TestCase
 
-from faker import Faker
 from faker.generator import random
 from modelos import db, Administrador, Restaurante, Chef
+from tests.aislamiento import PruebaAislada
 
 from app import app
 
-class TestChef(TestCase):
+class TestChef(PruebaAislada):
 
     def setUp(self):
-        self.data_factory = Faker()
         self.client = app.test_client()
         nombre_usuario = 'test_' + self.data_factory.name()
         contrasena = 'T1$' + self.data_factory.word()
@@ -37,21 +35,6 @@ class TestChef(TestCase):
         self.restaurante_id = restaurante.id
         self.chef_creados = []
 
-    def tearDown(self):
-        # Eliminar chef creados en la prueba
-        for chef_creado in self.chef_creados:
-            chef = Chef.query.get(chef_creado.id)
-            db.session.delete(chef)
-            db.session.commit()
-        # Eliminar restaurante creado para la prueba
-        restaurante = Restaurante.query.get(self.restaurante_id)
-        db.session.delete(restaurante)
-        db.session.commit()
-        # Eliminar administrador creado para la prueba
-        administrador = Administrador.query.get(self.usuario_id)
-        db.session.delete(administrador)
-        db.session.commit()
-
     def test_obtener_chefs(self):
         for i in range(0, 10):
             nombre_nuevo_chef = self.data_factory.name()
@@ -0,0 +1,73 @@
+import os
+import sqlite3
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+from modelos import db, configurar_base_de_datos, motores_preparados
+from tests import DIRECTORIO_PRUEBAS
+from tests.aislamiento import PruebaAislada
+from vistas import cache_respuestas, cola_trabajos
+
+from app import app, create_app
+
+
+class TestConfiguracion(PruebaAislada):
+
+    def test_pragmas_sqlite(self):
+        with db.engine.connect() as conexion:
+            self.assertEqual(conexion.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+            self.assertEqual(conexion.execute(text("PRAGMA synchronous")).scalar(), 1)
+            self.assertEqual(conexion.execute(text("PRAGMA busy_timeout")).scalar(), app.config['SQLITE_BUSY_TIMEOUT'])
+            self.assertEqual(conexion.execute(text("PRAGMA cache_size")).scalar(), app.config['SQLITE_CACHE_SIZE'])
+
+    def test_pool_por_proceso(self):
+        self.assertIsInstance(db.engine.pool, QueuePool)
+
+    def test_configuracion_desde_entorno(self):
+        anteriores = {nombre: os.environ.get(nombre) for nombre in ('DATABASE_URL', 'SQLITE_BUSY_TIMEOUT', 'DB_POOL_SIZE')}
+        os.environ.update({'DATABASE_URL': 'sqlite:///otra.sqlite', 'SQLITE_BUSY_TIMEOUT': '1500', 'DB_POOL_SIZE': '2'})
+        try:
+            otra_app = Flask(__name__)
+            configurar_base_de_datos(otra_app)
+        finally:
+            for nombre, valor in anteriores.items():
+                if valor is None:
+                    os.environ.pop(nombre)
+                else:
+                    os.environ[nombre] = valor
+        self.assertEqual(otra_app.config['SQLALCHEMY_DATABASE_URI'], 'sqlite:///otra.sqlite')
+        self.assertEqual(otra_app.config['SQLITE_BUSY_TIMEOUT'], 1500)
+        self.assertEqual(otra_app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'], 2)
+        self.assertEqual(otra_app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']['timeout'], 1.5)
+
+    def test_crear_app_sin_tocar_la_base(self):
+        ruta = os.path.join(DIRECTORIO_PRUEBAS, 'fabrica.sqlite')
+        nueva_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + ruta})
+        self.assertFalse(os.path.exists(ruta))
+        self.assertIn('/metrics', {regla.rule for regla in nueva_app.url_map.iter_rules()})
+
+        resultado = nueva_app.test_cli_runner().invoke(args=['crear-esquema'])
+        self.assertEqual(resultado.exit_code, 0, resultado.output)
+        with sqlite3.connect(ruta) as conexion:
+            tablas = {fila[0] for fila in conexion.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({'usuario', 'receta', 'menu'} <= tablas)
+
+    def test_otra_app_no_reconfigura_la_primera(self):
+        cache, cola = app.extensions['cache_respuestas'], app.extensions['cola_trabajos']
+        with mock.patch('os.register_at_fork') as registrar:
+            otra_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(DIRECTORIO_PRUEBAS, 'otra.sqlite'),
+                                   'CACHE_RESPUESTAS_ALMACEN': 'memoria', 'TRABAJOS_HILOS': 3})
+        registrar.assert_not_called()
+
+        self.assertIs(app.extensions['cache_respuestas'], cache)
+        self.assertIs(app.extensions['cola_trabajos'], cola)
+        self.assertEqual(cache_respuestas.almacen.ruta, app.config['CACHE_RESPUESTAS_RUTA'])
+        self.assertEqual(cola_trabajos.hilos, 0)
+        with otra_app.app_context():
+            self.assertEqual(cola_trabajos.hilos, 3)
+            self.assertEqual(cache_respuestas.almacen.tamano, otra_app.config['CACHE_RESPUESTAS_TAMANO'])
+            self.assertNotIn('ruta', vars(cache_respuestas.almacen))
+            self.assertIn(db.get_engine(otra_app), motores_preparados)
+        self.assertIn(db.engine, motores_preparados)
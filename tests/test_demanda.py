@@ -0,0 +1,145 @@
+import json
+import hashlib
+from datetime import date
+
+from sqlalchemy import event
+from modelos import db, Administrador, Ingrediente, Menu, MenuReceta, Receta, RecetaIngrediente, Restaurante
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestDemanda(PruebaAislada):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada)
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                                data=json.dumps(usuario_login),
+                                                headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        self.centro = self.crear_restaurante()
+        self.norte = self.crear_restaurante()
+        self.arroz = self.crear_ingrediente("kg", "Plaza", 2)
+        self.leche = self.crear_ingrediente("l", "Plaza", 1)
+        self.pollo = self.crear_ingrediente("kg", "Carnicería", 10)
+        # Recetas para 2 porciones
+        self.arroz_con_pollo = self.crear_receta(2, [(self.arroz, 1), (self.pollo, 0.5)])
+        self.arroz_con_leche = self.crear_receta(2, [(self.arroz, 0.5), (self.leche, 1)])
+
+    def crear_restaurante(self):
+        restaurante = Restaurante(nombre=self.data_factory.company(), administrador=self.usuario_id)
+        db.session.add(restaurante)
+        db.session.commit()
+        return restaurante.id
+
+    def crear_ingrediente(self, unidad, sitio, costo):
+        ingrediente = Ingrediente(nombre=self.data_factory.sentence(), unidad=unidad, costo=costo, calorias=1,
+                                  sitio=sitio, administrador=self.usuario_id)
+        db.session.add(ingrediente)
+        db.session.commit()
+        return ingrediente.id
+
+    def crear_receta(self, porcion, lineas):
+        receta = Receta(nombre=self.data_factory.sentence(), porcion=porcion, administrador=self.usuario_id, usuario=self.usuario_id)
+        for id_ingrediente, cantidad in lineas:
+            receta.ingredientes.append(RecetaIngrediente(cantidad=cantidad, ingrediente=id_ingrediente))
+        db.session.add(receta)
+        db.session.commit()
+        return receta.id
+
+    def crear_menu(self, id_restaurante, inicio, fin, recetas):
+        menu = Menu(nombre=self.data_factory.sentence(), fechaInicio=inicio, fechaFin=fin,
+                    autor=self.usuario_id, restaurante=id_restaurante)
+        for id_receta, personas in recetas:
+            menu.recetas.append(MenuReceta(receta=id_receta, personas=personas))
+        db.session.add(menu)
+        db.session.commit()
+        return menu.id
+
+    def solicitar_demanda(self, desde, hasta, restaurante=None):
+        endpoint = "/usuarios/{}/demanda?desde={}&hasta={}".format(self.usuario_id, desde, hasta)
+        if restaurante is not None:
+            endpoint += "&restaurante={}".format(restaurante)
+        return self.client.get(endpoint, headers=self.headers)
+
+    def test_demanda_agrupada_por_sitio_y_unidad(self):
+        self.crear_menu(self.centro, date(2024, 7, 1), date(2024, 7, 7), [(self.arroz_con_pollo, 4)])
+        self.crear_menu(self.norte, date(2024, 7, 5), date(2024, 7, 12), [(self.arroz_con_leche, 8)])
+        # Fuera del rango consultado
+        self.crear_menu(self.centro, date(2024, 8, 1), date(2024, 8, 7), [(self.arroz_con_pollo, 100)])
+
+        resultado = self.solicitar_demanda("2024-07-06", "2024-07-31")
+        demanda = json.loads(resultado.get_data())['demanda']
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual([(fila['sitio'], fila['unidad']) for fila in demanda],
+                         [("Carnicería", "kg"), ("Plaza", "kg"), ("Plaza", "l")])
+        por_ingrediente = {int(fila['ingrediente']): fila for fila in demanda}
+        # Arroz: 4/2 * 1 + 8/2 * 0.5 = 4 kg
+        self.assertEqual(por_ingrediente[self.arroz]['cantidad'], '4.00')
+        self.assertEqual(por_ingrediente[self.arroz]['costo'], '8.00')
+        self.assertEqual(por_ingrediente[self.pollo]['cantidad'], '1.00')
+        self.assertEqual(por_ingrediente[self.leche]['cantidad'], '4.00')
+
+    def test_demanda_exacta(self):
+        sal = self.crear_ingrediente("kg", "Plaza", 1)
+        receta = self.crear_receta(3, [(sal, 0.023)])
+        for dia in range(1, 4):
+            self.crear_menu(self.centro, date(2024, 7, dia), date(2024, 7, dia), [(receta, 5)])
+
+        resultado = self.solicitar_demanda("2024-07-01", "2024-07-31")
+        fila = next(fila for fila in json.loads(resultado.get_data())['demanda'] if int(fila['ingrediente']) == sal)
+
+        # 3 * 5/3 * 0.023 = 0.115 exactos; sumando en float quedaba 0.11499999999999999 y se redondeaba a 0.11
+        self.assertEqual(fila['cantidad'], '0.12')
+        self.assertEqual(fila['costo'], '0.12')
+
+    def test_demanda_de_un_restaurante(self):
+        self.crear_menu(self.centro, date(2024, 7, 1), date(2024, 7, 7), [(self.arroz_con_pollo, 4)])
+        self.crear_menu(self.norte, date(2024, 7, 1), date(2024, 7, 7), [(self.arroz_con_leche, 8)])
+
+        resultado = self.solicitar_demanda("2024-07-01", "2024-07-07", self.norte)
+        demanda = json.loads(resultado.get_data())['demanda']
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual({int(fila['ingrediente']) for fila in demanda}, {self.arroz, self.leche})
+
+    def test_demanda_con_consultas_constantes(self):
+        for dia in range(1, 21):
+            self.crear_menu(self.centro, date(2024, 7, dia), date(2024, 7, dia), [(self.arroz_con_pollo, 2), (self.arroz_con_leche, 2)])
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        try:
+            resultado = self.solicitar_demanda("2024-07-01", "2024-07-31")
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        demanda = json.loads(resultado.get_data())['demanda']
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual({int(fila['ingrediente']): fila['cantidad'] for fila in demanda}[self.arroz], '30.00')
+        self.assertEqual(len(consultas), 1)
+
+    def test_demanda_fechas_invalidas(self):
+        self.assertEqual(self.solicitar_demanda("2024-07-31", "2024-07-01").status_code, 422)
+        self.assertEqual(self.solicitar_demanda("julio", "2024-07-01").status_code, 422)
@@ -0,0 +1,140 @@
+import json
+import hashlib
+from decimal import Decimal
+
+from sqlalchemy import text
+from modelos import db, Administrador, Ingrediente, Receta, migrar_enteros_escalados
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestEscalado(PruebaAislada):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+        db.session.add(Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada))
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                           data=json.dumps(usuario_login),
+                                           headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(respuesta_login["token"])}
+
+    def crear_ingrediente(self, costo, calorias):
+        ingrediente = {"nombre": self.data_factory.sentence(), "unidad": "g", "costo": costo, "calorias": calorias,
+                       "sitio": self.data_factory.city()}
+        respuesta = self.client.post("/usuarios/{}/ingredientes".format(self.usuario_id), data=json.dumps(ingrediente), headers=self.headers)
+        return json.loads(respuesta.get_data())
+
+    def crear_receta(self, lineas, porcion):
+        receta = {"nombre": self.data_factory.sentence(), "preparacion": self.data_factory.sentence(), "duracion": 1,
+                  "porcion": porcion,
+                  "ingredientes": [{"idIngrediente": ingrediente["id"], "cantidad": cantidad} for ingrediente, cantidad in lineas]}
+        respuesta = self.client.post("/usuarios/{}/recetas".format(self.usuario_id), data=json.dumps(receta), headers=self.headers)
+        return json.loads(respuesta.get_data())
+
+    def test_se_guardan_enteros_y_el_json_no_cambia(self):
+        ingrediente = self.crear_ingrediente(0.1, 1.5)
+
+        fila = db.session.execute(text("SELECT costo, calorias, typeof(costo) FROM ingrediente WHERE id = :id"),
+                                  {'id': int(ingrediente['id'])}).first()
+        self.assertEqual(tuple(fila), (1000, 1500, 'integer'))
+        self.assertEqual(ingrediente['costo'], '0.1000000000')
+        self.assertEqual(ingrediente['calorias'], '1.5000000000')
+
+    def test_totales_exactos(self):
+        # En float 0.1 * 0.7 + 0.2 * 0.7 no da 0.21
+        primero = self.crear_ingrediente(0.1, 0.1)
+        segundo = self.crear_ingrediente(0.2, 0.2)
+        receta = self.crear_receta([(primero, 0.7), (segundo, 0.7)], 3)
+
+        respuesta = self.client.get("/recetas/{}".format(receta['id']), headers=self.headers)
+        datos_receta = json.loads(respuesta.get_data())
+        self.assertEqual(datos_receta['costo_total'], '0.2100000000')
+        self.assertEqual(datos_receta['calorias_total'], '0.2100000000')
+        self.assertEqual(datos_receta['costo_porcion'], '0.0700000000')
+        self.assertEqual(datos_receta['ingredientes'][0]['cantidad'], '0.7000000000')
+
+    def test_editar_ingrediente_recalcula_en_sql(self):
+        ingrediente = self.crear_ingrediente(0.1, 1)
+        receta = self.crear_receta([(ingrediente, 3)], 2)
+        editado = {"nombre": ingrediente['nombre'], "unidad": "g", "costo": 0.35, "calorias": 1, "sitio": ingrediente['sitio']}
+
+        self.client.put("/ingredientes/{}".format(ingrediente['id']), data=json.dumps(editado), headers=self.headers)
+
+        receta = Receta.query.get(int(receta['id']))
+        self.assertEqual(receta.costo_total, Decimal('1.05'))
+        self.assertEqual(receta.costo_porcion, Decimal('0.525'))
+
+    def test_totales_grandes_sin_desbordar(self):
+        ingrediente = self.crear_ingrediente(1200000.5, 1000000)
+        receta = self.crear_receta([(ingrediente, 10)], 3)
+
+        respuesta = self.client.get("/recetas/{}".format(receta['id']), headers=self.headers)
+        datos_receta = json.loads(respuesta.get_data())
+        self.assertEqual(datos_receta['costo_total'], '12000005.0000000000')
+        self.assertEqual(datos_receta['costo_porcion'], '4000001.6666667000')
+        self.assertEqual(datos_receta['calorias_porcion'], '3333333.3333330000')
+        fila = db.session.execute(text("SELECT typeof(costo_porcion), typeof(calorias_porcion) FROM receta WHERE id = :id"),
+                                  {'id': int(receta['id'])}).first()
+        self.assertEqual(tuple(fila), ('integer', 'integer'))
+
+    def test_valores_fuera_de_rango(self):
+        ingrediente = {"nombre": self.data_factory.sentence(), "unidad": "g", "costo": 1e16, "calorias": 1, "sitio": "Plaza"}
+        respuesta = self.client.post("/usuarios/{}/ingredientes".format(self.usuario_id), data=json.dumps(ingrediente), headers=self.headers)
+        self.assertEqual(respuesta.status_code, 422)
+
+        # Cada valor cabe en su columna, pero costo_total = 1e9 * 1e6 con 7 decimales no cabe en un BIGINT
+        caro = self.crear_ingrediente(1e9, 1)
+        receta = {"nombre": self.data_factory.sentence(), "preparacion": "", "duracion": 1, "porcion": 1,
+                  "ingredientes": [{"idIngrediente": caro["id"], "cantidad": 1e6}]}
+        respuesta = self.client.post("/usuarios/{}/recetas".format(self.usuario_id), data=json.dumps(receta), headers=self.headers)
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(Receta.query.filter(Receta.administrador == self.usuario_id).count(), 0)
+
+    def test_editar_ingrediente_sin_desbordar_totales(self):
+        ingrediente = self.crear_ingrediente(1, 1)
+        receta = self.crear_receta([(ingrediente, 1e6)], 1)
+        editado = {"nombre": ingrediente['nombre'], "unidad": "g", "costo": 1e9, "calorias": 1, "sitio": ingrediente['sitio']}
+
+        respuesta = self.client.put("/ingredientes/{}".format(ingrediente['id']), data=json.dumps(editado), headers=self.headers)
+
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(Ingrediente.query.get(int(ingrediente['id'])).costo, Decimal('1'))
+        self.assertEqual(Receta.query.get(int(receta['id'])).costo_total, Decimal('1000000'))
+
+    def test_migrar_valores_numeric(self):
+        ingrediente = Ingrediente(nombre=self.data_factory.sentence(), unidad="g", costo=0, calorias=0,
+                                  administrador=self.usuario_id)
+        receta = Receta(nombre=self.data_factory.sentence(), porcion=0, administrador=self.usuario_id, usuario=self.usuario_id)
+        db.session.add_all([ingrediente, receta])
+        db.session.commit()
+        # Así quedaban los valores con db.Numeric en SQLite
+        conexion = db.session.connection()
+        conexion.execute(text("UPDATE ingrediente SET costo = 0.35, calorias = 120.5 WHERE id = :id"), {'id': ingrediente.id})
+        conexion.execute(text("UPDATE receta SET porcion = 4, costo_total = 9.99 WHERE id = :id"), {'id': receta.id})
+        conexion.execute(text("INSERT INTO receta_ingrediente (cantidad, ingrediente, receta) VALUES (2.5, :ingrediente, :receta)"),
+                         {'ingrediente': ingrediente.id, 'receta': receta.id})
+
+        migrar_enteros_escalados(conexion)
+        db.session.expire_all()
+
+        ingrediente = Ingrediente.query.get(ingrediente.id)
+        receta = Receta.query.get(receta.id)
+        self.assertEqual((ingrediente.costo, ingrediente.calorias), (Decimal('0.35'), Decimal('120.5')))
+        self.assertEqual(receta.porcion, Decimal('4'))
+        self.assertEqual(receta.ingredientes[0].cantidad, Decimal('2.5'))
+        self.assertEqual(receta.costo_total, Decimal('0.875'))
+        self.assertEqual(receta.calorias_porcion, Decimal('75.3125'))
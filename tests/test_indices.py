@@ -0,0 +1,111 @@
+import json
+import hashlib
+import re
+from datetime import date
+
+from sqlalchemy import event, text
+from modelos import db, Administrador, Chef, Ingrediente, Menu, MenuReceta, Receta, RecetaIngrediente, Restaurante, Usuario
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestIndices(PruebaAislada):
+
+    def plan_de_consulta(self, consulta):
+        sentencia = consulta.statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True})
+        filas = db.session.execute(text("EXPLAIN QUERY PLAN {}".format(sentencia))).fetchall()
+        return " ".join(fila[-1] for fila in filas)
+
+    def usa_indice(self, plan, indice):
+        # Nombre exacto: ix_menu_restaurante no debe aceptar un plan que usa ix_menu_restaurante_fechaFin
+        return re.search(r"USING (COVERING )?INDEX {}\b".format(re.escape(indice)), plan) is not None
+
+    def verificar_indice(self, consulta, indice):
+        plan = self.plan_de_consulta(consulta)
+        self.assertTrue(self.usa_indice(plan, indice), plan)
+        self.assertNotIn("SCAN", plan.replace("SCAN CONSTANT ROW", ""))
+
+    def planes_de_solicitud(self, metodo, url, **kwargs):
+        # Planes de las consultas que la vista ejecuta de verdad, con sus mismos parámetros
+        sentencias = []
+
+        def capturar(conexion, cursor, sentencia, parametros, contexto, varias):
+            if sentencia.lstrip().upper().startswith("SELECT"):
+                sentencias.append((sentencia, parametros))
+
+        event.listen(db.engine, "before_cursor_execute", capturar)
+        try:
+            respuesta = getattr(self.client, metodo)(url, **kwargs)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", capturar)
+        self.assertLess(respuesta.status_code, 300)
+        conexion = db.session.connection()
+        return [" ".join(fila[-1] for fila in conexion.exec_driver_sql("EXPLAIN QUERY PLAN " + sentencia, parametros))
+                for sentencia, parametros in sentencias]
+
+    def verificar_vista(self, url, *indices, metodo="get", **kwargs):
+        kwargs.setdefault("headers", self.encabezados)
+        planes = self.planes_de_solicitud(metodo, url, **kwargs)
+        for plan in planes:
+            self.assertNotIn("SCAN", plan.replace("SCAN CONSTANT ROW", ""), url)
+        for indice in indices:
+            self.assertTrue(any(self.usa_indice(plan, indice) for plan in planes),
+                            "{} no usa {}: {}".format(url, indice, planes))
+
+    def iniciar_sesion(self):
+        self.client = app.test_client()
+        self.nombre_usuario = 'test_' + self.data_factory.name()
+        self.contrasena = 'T1$' + self.data_factory.word()
+        db.session.add(Administrador(usuario=self.nombre_usuario, contrasena=hashlib.md5(self.contrasena.encode('utf-8')).hexdigest()))
+        db.session.commit()
+        respuesta = json.loads(self.client.post("/login", data=json.dumps({"usuario": self.nombre_usuario, "contrasena": self.contrasena}),
+                                                headers={'Content-Type': 'application/json'}).get_data())
+        self.usuario_id = respuesta["id"]
+        self.encabezados = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(respuesta["token"])}
+        restaurante = Restaurante(nombre=self.data_factory.company(), administrador=self.usuario_id)
+        db.session.add(restaurante)
+        db.session.commit()
+        return restaurante.id
+
+    def test_indices_consultas_por_administrador(self):
+        self.verificar_indice(Ingrediente.query.filter(Ingrediente.administrador == 1).order_by(Ingrediente.id), "ix_ingrediente_administrador")
+        self.verificar_indice(Receta.query.filter(Receta.administrador == 1), "ix_receta_administrador")
+        self.verificar_indice(Receta.query.filter(Receta.usuario == 1), "ix_receta_usuario")
+        self.verificar_indice(Restaurante.query.filter(Restaurante.administrador == 1), "ix_restaurante_administrador")
+
+    def test_indices_lineas_de_receta_y_menu(self):
+        self.verificar_indice(RecetaIngrediente.query.filter(RecetaIngrediente.receta == 1), "ix_receta_ingrediente_receta")
+        self.verificar_indice(RecetaIngrediente.query.filter_by(ingrediente=1), "ix_receta_ingrediente_ingrediente")
+        self.verificar_indice(MenuReceta.query.filter(MenuReceta.menu == 1), "ix_menu_receta_menu")
+
+    def test_indices_menus_y_chefs_por_restaurante(self):
+        self.verificar_indice(Menu.query.filter(Menu.restaurante == 1), "ix_menu_restaurante_fechaFin")
+        self.verificar_indice(Chef.query.filter(Chef.restaurante == 1), "ix_chef_restaurante")
+        self.verificar_indice(Menu.query.filter(Menu.restaurante == 1, Menu.fechaFin >= date(2024, 7, 1)), "ix_menu_restaurante_fechaFin")
+
+    def test_indices_busquedas_por_nombre(self):
+        self.verificar_indice(Usuario.query.filter(Usuario.usuario == "usuario", Usuario.contrasena == "clave"), "ix_usuario_usuario")
+        self.verificar_indice(Restaurante.query.filter_by(nombre="restaurante"), "ix_restaurante_nombre")
+
+    def test_indices_consultas_de_las_vistas(self):
+        id_restaurante = self.iniciar_sesion()
+        receta = Receta(nombre=self.data_factory.sentence(), porcion=1, administrador=self.usuario_id, usuario=self.usuario_id)
+        db.session.add(receta)
+        db.session.commit()
+
+        self.verificar_vista("/usuarios/{}/ingredientes?limit=5".format(self.usuario_id), "ix_ingrediente_administrador")
+        self.verificar_vista("/usuarios/{}/recetas".format(self.usuario_id), "ix_receta_administrador")
+        self.verificar_vista("/recetas/{}".format(receta.id), "ix_receta_ingrediente_receta")
+        self.verificar_vista("/usuarios/{}/restaurantes?limit=5".format(self.usuario_id), "ix_restaurante_administrador")
+        self.verificar_vista("/restaurantes/{}/chefs?limit=5".format(id_restaurante), "ix_chef_restaurante")
+        self.verificar_vista("/usuarios/{}/restaurantes/{}/menus?limit=5".format(self.usuario_id, id_restaurante), "ix_menu_restaurante_fechaFin")
+        self.verificar_vista("/usuarios/{}/demanda?desde=2024-07-01&hasta=2024-07-31".format(self.usuario_id),
+                             "ix_menu_restaurante_fechaFin", "ix_menu_receta_menu", "ix_receta_ingrediente_receta")
+        self.verificar_vista("/login", "ix_usuario_usuario", metodo="post", headers={'Content-Type': 'application/json'},
+                             data=json.dumps({"usuario": self.nombre_usuario, "contrasena": self.contrasena}))
+
+    def test_indice_unico_usuario(self):
+        indices = db.session.execute(text("PRAGMA index_list('usuario')")).fetchall()
+        unicos = {indice[1] for indice in indices if indice[2]}
+        self.assertIn("ix_usuario_usuario", unicos)
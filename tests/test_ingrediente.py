@@ -1,18 +1,31 @@
 import json
 import hashlib
-from unittest import TestCase
 
-from faker import Faker
 from faker.generator import random
+from sqlalchemy import event
+from werkzeug.test import EnvironBuilder, run_wsgi_app
 from modelos import db, Administrador, Ingrediente
+from vistas import cache_respuestas
+from tests.aislamiento import PruebaAislada
 
 from app import app
 
 
-class TestIngrediente(TestCase):
+class CuerpoWsgi():
+    # Como el Body de gunicorn: solo tiene read() y entrega el cuerpo en bloques pequeños
+    def __init__(self, contenido, bloque):
+        self.contenido = contenido
+        self.bloque = bloque
+
+    def read(self, tamano=-1):
+        tamano = self.bloque if tamano is None or tamano < 0 else min(tamano, self.bloque)
+        parte, self.contenido = self.contenido[:tamano], self.contenido[tamano:]
+        return parte
+
+
+class TestIngrediente(PruebaAislada):
 
     def setUp(self):
-        self.data_factory = Faker()
         self.client = app.test_client()
         
         nombre_usuario = 'test_' + self.data_factory.name()
@@ -42,15 +55,6 @@ class TestIngrediente(TestCase):
         self.ingredientes_creados = []
         
     
-    def tearDown(self):
-        for ingrediente_creado in self.ingredientes_creados:
-            ingrediente = Ingrediente.query.get(ingrediente_creado.id)
-            db.session.delete(ingrediente)
-            db.session.commit()
-            
-        usuario_login = Administrador.query.get(self.usuario_id)
-        db.session.delete(usuario_login)
-        db.session.commit()
 
     def test_crear_ingrediente(self):
         #Crear los datos del ingrediente
@@ -269,4 +273,269 @@ class TestIngrediente(TestCase):
 
         
 
-    
\ No newline at end of file
+    
+    def test_listar_ingredientes_paginados(self):
+        for i in range(0,5):
+            ingrediente = Ingrediente(nombre = self.data_factory.sentence(),
+                                  unidad=self.data_factory.sentence(),
+                                  calorias=round(random.uniform(0.1, 0.99), 2),
+                                  costo=round(random.uniform(0.1, 0.99), 2),
+                                  sitio=self.data_factory.sentence(),
+                                  administrador=self.usuario_id)
+            db.session.add(ingrediente)
+            db.session.commit()
+            self.ingredientes_creados.append(ingrediente)
+        ids_creados = [str(ingrediente.id) for ingrediente in self.ingredientes_creados]
+
+        #Recorrer las páginas siguiendo el cursor next
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        ids_obtenidos = []
+        paginas = 0
+        cursor = None
+        while True:
+            parametros = "?limit=2" if cursor is None else "?limit=2&after={}".format(cursor)
+            resultado = self.client.get(endpoint_ingredientes + parametros, headers=headers)
+            datos_respuesta = json.loads(resultado.get_data())
+            self.assertEqual(resultado.status_code, 200)
+            self.assertLessEqual(len(datos_respuesta['resultados']), 2)
+            ids_obtenidos.extend([ingrediente['id'] for ingrediente in datos_respuesta['resultados']])
+            paginas += 1
+            cursor = datos_respuesta['next']
+            if cursor is None:
+                break
+
+        self.assertEqual(paginas, 3)
+        self.assertEqual(ids_obtenidos, ids_creados)
+
+    def test_listar_ingredientes_en_streaming(self):
+        for i in range(0,3):
+            ingrediente = Ingrediente(nombre = self.data_factory.sentence(),
+                                  unidad=self.data_factory.sentence(),
+                                  calorias=round(random.uniform(0.1, 0.99), 2),
+                                  costo=round(random.uniform(0.1, 0.99), 2),
+                                  sitio=self.data_factory.sentence(),
+                                  administrador=self.usuario_id)
+            db.session.add(ingrediente)
+            db.session.commit()
+            self.ingredientes_creados.append(ingrediente)
+        ids_creados = [str(ingrediente.id) for ingrediente in self.ingredientes_creados]
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+
+        #Solicitar NDJSON por encabezado Accept
+        headers = {'Accept': 'application/x-ndjson', "Authorization": "Bearer {}".format(self.token)}
+        resultado_ndjson = self.client.get(endpoint_ingredientes, headers=headers)
+        lineas = resultado_ndjson.get_data(as_text=True).splitlines()
+        self.assertEqual(resultado_ndjson.status_code, 200)
+        self.assertEqual(resultado_ndjson.mimetype, 'application/x-ndjson')
+        self.assertEqual([json.loads(linea)['id'] for linea in lineas], ids_creados)
+
+        #Solicitar un arreglo JSON en streaming por parámetro
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        resultado_json = self.client.get(endpoint_ingredientes + "?stream=json", headers=headers)
+        datos_respuesta = json.loads(resultado_json.get_data())
+        self.assertEqual(resultado_json.status_code, 200)
+        self.assertEqual([ingrediente['id'] for ingrediente in datos_respuesta], ids_creados)
+        self.assertEqual(datos_respuesta[0]['nombre'], self.ingredientes_creados[0].nombre)
+
+    def test_importar_ingredientes_csv(self):
+        contenido = "nombre,unidad,costo,calorias,sitio\n" \
+            "Arroz,kg,1.5,130,Plaza\n" \
+            "Sal,kg,no-numerico,0,Plaza\n" \
+            "Pollo,kg,7.25,239,Carnicería\n"
+        endpoint_importar = "/usuarios/{}/ingredientes/importar".format(self.usuario_id)
+        headers = {'Content-Type': 'text/csv', "Authorization": "Bearer {}".format(self.token)}
+        resultado = self.client.post(endpoint_importar, data=contenido.encode('utf-8'), headers=headers)
+        datos_respuesta = json.loads(resultado.get_data())
+        importados = Ingrediente.query.filter(Ingrediente.administrador == self.usuario_id).order_by(Ingrediente.id).all()
+        self.ingredientes_creados.extend(importados)
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(datos_respuesta['creados'], 2)
+        self.assertEqual(len(datos_respuesta['errores']), 1)
+        self.assertEqual(datos_respuesta['errores'][0]['fila'], 2)
+        self.assertEqual([ingrediente.nombre for ingrediente in importados], ["Arroz", "Pollo"])
+        self.assertEqual(float(importados[1].costo), 7.25)
+        self.assertEqual(importados[1].sitio, "Carnicería")
+
+    def test_importar_ingredientes_ndjson(self):
+        filas = [
+            {"nombre": "Leche", "unidad": "l", "costo": 1.1, "calorias": 42, "sitio": "Tienda"},
+            {"nombre": "Huevo", "unidad": "und", "calorias": 78, "sitio": "Granja"}
+        ]
+        contenido = "\n".join(json.dumps(fila) for fila in filas) + "\n"
+        endpoint_importar = "/usuarios/{}/ingredientes/importar".format(self.usuario_id)
+        headers = {'Content-Type': 'application/x-ndjson', "Authorization": "Bearer {}".format(self.token)}
+        resultado = self.client.post(endpoint_importar, data=contenido, headers=headers)
+        datos_respuesta = json.loads(resultado.get_data())
+        importados = Ingrediente.query.filter(Ingrediente.administrador == self.usuario_id).all()
+        self.ingredientes_creados.extend(importados)
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(datos_respuesta['creados'], 1)
+        self.assertEqual(datos_respuesta['errores'], [{'fila': 2, 'mensaje': "Campos faltantes: costo"}])
+        self.assertEqual(importados[0].nombre, "Leche")
+
+    def test_rechazar_costos_no_finitos(self):
+        contenido = "nombre,unidad,costo,calorias,sitio\n" \
+            "Arroz,kg,nan,130,Plaza\n" \
+            "Sal,kg,1,inf,Plaza\n" \
+            "Pollo,kg,7.25,239,Carnicería\n"
+        endpoint_importar = "/usuarios/{}/ingredientes/importar".format(self.usuario_id)
+        headers = {'Content-Type': 'text/csv', "Authorization": "Bearer {}".format(self.token)}
+        resultado = self.client.post(endpoint_importar, data=contenido.encode('utf-8'), headers=headers)
+        datos_respuesta = json.loads(resultado.get_data())
+        self.ingredientes_creados.extend(Ingrediente.query.filter(Ingrediente.administrador == self.usuario_id).all())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(datos_respuesta['creados'], 1)
+        self.assertEqual([error['fila'] for error in datos_respuesta['errores']], [1, 2])
+
+        nuevo_ingrediente = {"nombre": self.data_factory.sentence(), "unidad": "kg", "costo": "nan", "calorias": 10, "sitio": "Plaza"}
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        resultado = self.client.post("/usuarios/{}/ingredientes".format(self.usuario_id), data=json.dumps(nuevo_ingrediente), headers=headers)
+        self.assertEqual(resultado.status_code, 422)
+
+    def test_importar_filas_invalidas_sin_abortar(self):
+        contenido = "nombre,unidad,costo,calorias,sitio\n".encode('utf-8') + \
+            b"bad\xff,kg,1,1,Plaza\n" + \
+            "Sal,kg,1e20,0,Plaza\n" \
+            "Pollo,kg,7.25,239,Carnicería\n".encode('utf-8')
+        endpoint_importar = "/usuarios/{}/ingredientes/importar".format(self.usuario_id)
+        headers = {'Content-Type': 'text/csv', "Authorization": "Bearer {}".format(self.token)}
+        resultado = self.client.post(endpoint_importar, data=contenido, headers=headers)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(datos_respuesta['creados'], 1)
+        self.assertEqual(datos_respuesta['errores'], [
+            {'fila': 1, 'mensaje': "La fila no es texto UTF-8 válido"},
+            {'fila': 2, 'mensaje': "El costo o las calorías están fuera del rango permitido"}])
+
+        filas = [
+            {"nombre": "Leche", "unidad": "l", "costo": True, "calorias": 42, "sitio": "Tienda"},
+            {"nombre": "Huevo", "unidad": "und", "costo": 1, "calorias": 78, "sitio": "Granja"}
+        ]
+        headers['Content-Type'] = 'application/x-ndjson'
+        resultado = self.client.post(endpoint_importar, data="\n".join(json.dumps(fila) for fila in filas), headers=headers)
+        datos_respuesta = json.loads(resultado.get_data())
+        self.assertEqual(datos_respuesta, {'creados': 1, 'errores': [{'fila': 1, 'mensaje': "El costo y las calorías deben ser numéricos"}]})
+        importados = Ingrediente.query.filter(Ingrediente.administrador == self.usuario_id).order_by(Ingrediente.id).all()
+        self.assertEqual([ingrediente.nombre for ingrediente in importados], ["Pollo", "Huevo"])
+
+    def test_importar_desde_flujo_wsgi_sin_io(self):
+        contenido = "nombre,unidad,costo,calorias,sitio\r\n" \
+            "Pollo,kg,7.25,239,Carnicería\r\n" \
+            "Piña,und,3,50,Plaza"
+        endpoint_importar = "/usuarios/{}/ingredientes/importar".format(self.usuario_id)
+        headers = {'Content-Type': 'text/csv', "Authorization": "Bearer {}".format(self.token)}
+        # El cliente de pruebas envuelve el cuerpo en un LimitedStream; aquí la vista recibe el flujo del servidor tal cual
+        entorno = EnvironBuilder(path=endpoint_importar, method='POST', headers=headers).get_environ()
+        entorno.update({'wsgi.input': CuerpoWsgi(contenido.encode('utf-8'), 7), 'wsgi.input_terminated': True})
+        cuerpo, estado, _ = run_wsgi_app(app, entorno)
+        datos_respuesta = json.loads(b''.join(cuerpo))
+        importados = Ingrediente.query.filter(Ingrediente.administrador == self.usuario_id).order_by(Ingrediente.id).all()
+        self.ingredientes_creados.extend(importados)
+
+        self.assertEqual(estado, '200 OK')
+        self.assertEqual(datos_respuesta, {'creados': 2, 'errores': []})
+        self.assertEqual([(ingrediente.nombre, ingrediente.sitio) for ingrediente in importados],
+                         [("Pollo", "Carnicería"), ("Piña", "Plaza")])
+
+    def test_listar_ingredientes_condicional(self):
+        ingrediente = Ingrediente(nombre = self.data_factory.sentence(),
+                              unidad=self.data_factory.sentence(),
+                              calorias=round(random.uniform(0.1, 0.99), 2),
+                              costo=round(random.uniform(0.1, 0.99), 2),
+                              sitio=self.data_factory.sentence(),
+                              administrador=self.usuario_id)
+        db.session.add(ingrediente)
+        db.session.commit()
+        self.ingredientes_creados.append(ingrediente)
+
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        resultado = self.client.get(endpoint_ingredientes, headers=headers)
+        etag = resultado.headers['ETag']
+        self.assertNotIn('Last-Modified', resultado.headers)
+
+        #La colección no cambió: 304 por ETag; las colecciones no se validan por fecha
+        resultado_etag = self.client.get(endpoint_ingredientes, headers=dict(headers, **{'If-None-Match': etag}))
+        resultado_fecha = self.client.get(endpoint_ingredientes, headers=dict(headers, **{'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}))
+        self.assertEqual(resultado_etag.status_code, 304)
+        self.assertEqual(resultado_fecha.status_code, 200)
+
+        #Al agregar un ingrediente el validador de la colección cambia
+        otro_ingrediente = Ingrediente(nombre = self.data_factory.sentence(), administrador=self.usuario_id)
+        db.session.add(otro_ingrediente)
+        db.session.commit()
+        self.ingredientes_creados.append(otro_ingrediente)
+        resultado_nuevo = self.client.get(endpoint_ingredientes, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(resultado_nuevo.status_code, 200)
+        self.assertEqual(len(json.loads(resultado_nuevo.get_data())), 2)
+
+    def test_borrar_ingrediente_antiguo_invalida_condicional(self):
+        antiguo = Ingrediente(nombre=self.data_factory.sentence(), administrador=self.usuario_id)
+        db.session.add(antiguo)
+        db.session.commit()
+        reciente = Ingrediente(nombre=self.data_factory.sentence(), administrador=self.usuario_id)
+        db.session.add(reciente)
+        db.session.commit()
+
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        etag = self.client.get(endpoint_ingredientes, headers=headers).headers['ETag']
+
+        #Borrar la fila que no es la más reciente no cambia la versión máxima, pero sí la cantidad
+        self.client.delete("/ingredientes/{}".format(antiguo.id), headers=headers)
+        for condicion in ({'If-None-Match': etag}, {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}):
+            resultado = self.client.get(endpoint_ingredientes, headers=dict(headers, **condicion))
+            self.assertEqual(resultado.status_code, 200)
+            self.assertEqual([ingrediente['id'] for ingrediente in json.loads(resultado.get_data())], [str(reciente.id)])
+
+    def contar_consultas(self, solicitud):
+        sentencias = []
+        def registrar_sentencia(conn, cursor, statement, parameters, context, executemany):
+            sentencias.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', registrar_sentencia)
+        try:
+            resultado = solicitud()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', registrar_sentencia)
+        return resultado, len(sentencias)
+
+    def test_listar_ingredientes_desde_cache(self):
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        nuevo_ingrediente = {"nombre": self.data_factory.sentence(), "unidad": "kg", "costo": 1.5, "calorias": 10, "sitio": "Plaza"}
+        self.client.post(endpoint_ingredientes, data=json.dumps(nuevo_ingrediente), headers=headers)
+        self.ingredientes_creados.extend(Ingrediente.query.filter(Ingrediente.administrador == self.usuario_id).all())
+
+        primera = self.client.get(endpoint_ingredientes, headers=headers)
+        aciertos = cache_respuestas.aciertos
+        segunda, consultas = self.contar_consultas(lambda: self.client.get(endpoint_ingredientes, headers=headers))
+        self.assertEqual(consultas, 0)
+        self.assertEqual(cache_respuestas.aciertos, aciertos + 1)
+        self.assertEqual(segunda.get_data(), primera.get_data())
+        self.assertEqual(segunda.headers['ETag'], primera.headers['ETag'])
+        condicional = self.client.get(endpoint_ingredientes, headers=dict(headers, **{'If-None-Match': primera.headers['ETag']}))
+        self.assertEqual(condicional.status_code, 304)
+
+        #Una escritura del mismo administrador invalida sus entradas
+        otro_ingrediente = dict(nuevo_ingrediente, nombre=self.data_factory.sentence())
+        self.client.post(endpoint_ingredientes, data=json.dumps(otro_ingrediente), headers=headers)
+        self.ingredientes_creados = Ingrediente.query.filter(Ingrediente.administrador == self.usuario_id).all()
+        tercera = self.client.get(endpoint_ingredientes, headers=headers)
+        self.assertEqual(len(json.loads(tercera.get_data())), 2)
+
+    def test_listar_ingredientes_sin_cache(self):
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        app.config['CACHE_RESPUESTAS'] = False
+        try:
+            self.client.get(endpoint_ingredientes, headers=headers)
+            resultado, consultas = self.contar_consultas(lambda: self.client.get(endpoint_ingredientes, headers=headers))
+        finally:
+            app.config['CACHE_RESPUESTAS'] = True
+        self.assertEqual(resultado.status_code, 200)
+        self.assertGreater(consultas, 0)
@@ -1,15 +1,15 @@
 import json
 import hashlib
-from unittest import TestCase
-from faker import Faker
 from faker.generator import random
-from modelos import db, Administrador, Chef
+from flask_jwt_extended import decode_token
+from sqlalchemy import event
+from modelos import db, Administrador, Chef, Menu, Restaurante
+from tests.aislamiento import PruebaAislada
 from app import app
 
-class TestLogin(TestCase):
+class TestLogin(PruebaAislada):
 
     def setUp(self):
-        self.data_factory = Faker()
         self.client = app.test_client()
         nombre_usuario = 'test_' + self.data_factory.name()
         contrasena = 'T1$' + self.data_factory.word()
@@ -44,19 +44,9 @@ class TestLogin(TestCase):
                                                 data=json.dumps(self.usuario_login_chef),
                                                 headers={'Content-Type': 'application/json'})
         respuesta_login_chef = json.loads(solicitud_login_chef.get_data())
-        self.token = respuesta_login_chef["token"]
+        self.token_chef = respuesta_login_chef["token"]
         self.usuario_id_chef = respuesta_login_chef["id"]
 
-    def tearDown(self):
-        # Eliminar administrador creado para la prueba
-        administrador = Administrador.query.get(self.usuario_id_admin)
-        db.session.delete(administrador)
-        db.session.commit()
-        # Eliminar chef creado para la prueba
-        chef = Chef.query.get(self.usuario_id_chef)
-        db.session.delete(chef)
-        db.session.commit()
-
     def test_obtener_tipo_login_admin(self):
          #Definir endpoint, encabezados y hacer el llamado
         endpoint_login = "/login"
@@ -85,4 +75,54 @@ class TestLogin(TestCase):
         resultado_login_admin = self.client.post(endpoint_login, data=json.dumps(self.usuario_login_chef),
                                                    headers=headers)
         datos_respuesta = json.loads(resultado_login_admin.get_data())
-        self.assertEqual(datos_respuesta['mensaje'], "El usuario ya existe")
\ No newline at end of file
+        self.assertEqual(datos_respuesta['mensaje'], "El usuario ya existe")
+
+    def test_token_incluye_claims_admin(self):
+        claims = decode_token(self.token)
+        self.assertEqual(claims["tipo"], "Administrador")
+        self.assertEqual(claims["administrador"], self.usuario_id_admin)
+        self.assertEqual(claims["usuario"], self.usuario_login_admin["usuario"])
+        self.assertIsNone(claims["restaurante"])
+
+    def test_listar_ingredientes_sin_consultar_usuarios(self):
+        endpoint = "/usuarios/{}/ingredientes".format(self.usuario_id_admin)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        try:
+            resultado = self.client.get(endpoint, headers=headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        self.assertEqual(resultado.status_code, 200)
+        #Una consulta para el validador de la colección y otra para los ingredientes
+        self.assertEqual(len(consultas), 2)
+        for consulta in consultas:
+            self.assertNotIn("FROM usuario", consulta)
+
+    def test_reasignar_chef_invalida_claims(self):
+        restaurante = Restaurante(nombre=self.data_factory.name(), administrador=self.usuario_id_admin)
+        db.session.add(restaurante)
+        db.session.commit()
+        menu = Menu(nombre=self.data_factory.sentence(), restaurante=restaurante.id)
+        db.session.add(menu)
+        chef = Chef.query.get(self.usuario_id_chef)
+        chef.restaurante = restaurante.id
+        db.session.commit()
+        id_menu = menu.id
+
+        #El token del chef se emitió antes de la reasignación, así que se consulta la base de datos
+        endpoint = "/usuarios/{}/menus".format(self.usuario_id_chef)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token_chef)}
+        resultado = self.client.get(endpoint, headers=headers)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        chef = Chef.query.get(self.usuario_id_chef)
+        chef.restaurante = None
+        db.session.delete(Menu.query.get(id_menu))
+        db.session.delete(Restaurante.query.get(restaurante.id))
+        db.session.commit()
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual([menu['id'] for menu in datos_respuesta], [str(id_menu)])
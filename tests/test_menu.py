@@ -0,0 +1,113 @@
+import json
+import hashlib
+from datetime import date
+
+from sqlalchemy import event
+from modelos import db, Administrador, Menu, MenuReceta, Receta, Restaurante
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestMenu(PruebaAislada):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada)
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                                data=json.dumps(usuario_login),
+                                                headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        restaurante = Restaurante(nombre=self.data_factory.name(), administrador=self.usuario_id)
+        db.session.add(restaurante)
+        db.session.commit()
+        self.restaurante_id = restaurante.id
+
+        self.recetas_creadas = []
+        for i in range(0, 3):
+            receta = Receta(nombre=self.data_factory.sentence(), porcion=1, administrador=self.usuario_id, usuario=self.usuario_id)
+            db.session.add(receta)
+            db.session.commit()
+            self.recetas_creadas.append(receta.id)
+
+        menu = Menu(nombre=self.data_factory.sentence(),
+                    descripcion=self.data_factory.sentence(),
+                    fechaInicio=date(2024, 7, 1),
+                    fechaFin=date(2024, 7, 7),
+                    foto=self.data_factory.url(),
+                    autor=self.usuario_id,
+                    restaurante=self.restaurante_id)
+        menu.recetas.append(MenuReceta(personas=2, receta=self.recetas_creadas[0]))
+        menu.recetas.append(MenuReceta(personas=4, receta=self.recetas_creadas[1]))
+        db.session.add(menu)
+        db.session.commit()
+        self.menu_id = menu.id
+
+    def menu_editado(self, recetas, descripcion=None):
+        menu = Menu.query.get(self.menu_id)
+        return {
+            "nombre": menu.nombre,
+            "descripcion": descripcion if descripcion is not None else menu.descripcion,
+            "fechaInicio": "2024-07-01",
+            "fechaFin": "2024-07-07",
+            "foto": menu.foto,
+            "restaurante": {"id": self.restaurante_id},
+            "recetas": recetas
+        }
+
+    def editar_menu(self, menu_editado):
+        endpoint_menu = "/usuarios/{}/menu/{}".format(self.usuario_id, self.menu_id)
+        sentencias = []
+        def registrar_sentencia(conn, cursor, statement, parameters, context, executemany):
+            sentencias.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', registrar_sentencia)
+        try:
+            resultado = self.client.put(endpoint_menu, data=json.dumps(menu_editado), headers=self.headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', registrar_sentencia)
+        # Los SAVEPOINT son de la transacción de la prueba, no de la vista
+        return resultado, [sentencia for sentencia in sentencias if not sentencia.startswith(("SELECT", "SAVEPOINT", "RELEASE SAVEPOINT"))]
+
+    def test_editar_solo_descripcion_del_menu(self):
+        recetas = [{"receta": self.recetas_creadas[0], "personas": 2}, {"receta": self.recetas_creadas[1], "personas": 4}]
+        nueva_descripcion = self.data_factory.sentence()
+        resultado, escrituras = self.editar_menu(self.menu_editado(recetas, nueva_descripcion))
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(datos_respuesta['descripcion'], nueva_descripcion)
+        self.assertEqual(len(escrituras), 1)
+        self.assertTrue(escrituras[0].startswith("UPDATE menu SET"))
+
+    def test_editar_recetas_del_menu(self):
+        ids_anteriores = {menu_receta.receta: menu_receta.id for menu_receta in Menu.query.get(self.menu_id).recetas}
+        recetas = [{"receta": self.recetas_creadas[0], "personas": 6}, {"receta": self.recetas_creadas[2], "personas": 3}]
+        resultado, escrituras = self.editar_menu(self.menu_editado(recetas))
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len([escritura for escritura in escrituras if escritura.startswith("UPDATE menu_receta")]), 1)
+        self.assertEqual(len([escritura for escritura in escrituras if escritura.startswith("INSERT INTO menu_receta")]), 1)
+        self.assertEqual(len([escritura for escritura in escrituras if escritura.startswith("DELETE FROM menu_receta")]), 1)
+        recetas_menu = {menu_receta.receta: menu_receta for menu_receta in Menu.query.get(self.menu_id).recetas}
+        self.assertEqual(set(recetas_menu), {self.recetas_creadas[0], self.recetas_creadas[2]})
+        self.assertEqual(recetas_menu[self.recetas_creadas[0]].id, ids_anteriores[self.recetas_creadas[0]])
+        self.assertEqual(recetas_menu[self.recetas_creadas[0]].personas, 6)
+        self.assertEqual(recetas_menu[self.recetas_creadas[2]].personas, 3)
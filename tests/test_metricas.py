@@ -0,0 +1,173 @@
+import json
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from modelos import db, Administrador, Ingrediente
+from vistas import AlmacenCompartido, LIMITES_LATENCIA, METRICAS_ACUMULADAS, NO_DISPONIBLE, SENTENCIAS_SQL, cache_respuestas, foto_a_json, \
+    registro_metricas, sumar_fotos_json
+from tests import DIRECTORIO_PRUEBAS
+from tests.aislamiento import PruebaAislada
+
+from app import app, create_app
+
+
+class TestMetricas(PruebaAislada):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada)
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                                data=json.dumps(usuario_login),
+                                                headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+    def leer_metricas(self):
+        resultado = self.client.get("/metrics")
+        self.assertEqual(resultado.status_code, 200)
+        self.assertTrue(resultado.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        valores = {}
+        for linea in resultado.get_data(as_text=True).splitlines():
+            if linea and not linea.startswith('#'):
+                nombre, valor = linea.rsplit(' ', 1)
+                valores[nombre] = float(valor)
+        return valores
+
+    def valor(self, valores, nombre, **etiquetas):
+        patron = re.compile(re.escape(nombre) + r'\{' + ','.join(
+            '{}="{}"'.format(clave, re.escape(str(valor))) for clave, valor in etiquetas.items()) + r'\}$')
+        return sum(valor for clave, valor in valores.items() if patron.match(clave))
+
+    def test_metricas_por_endpoint(self):
+        antes = self.leer_metricas()
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+        nuevo_ingrediente = {
+            "nombre": self.data_factory.sentence(), "unidad": "kg", "costo": 1.5, "calorias": 10, "sitio": "Plaza"
+        }
+        self.client.post(endpoint_ingredientes, data=json.dumps(nuevo_ingrediente), headers=self.headers)
+        resultado = self.client.get(endpoint_ingredientes + "?stream=ndjson", headers=self.headers)
+        self.assertEqual(resultado.status_code, 200)
+        cuerpo = resultado.get_data()
+        despues = self.leer_metricas()
+
+        etiquetas = {'endpoint': 'vistaingredientes', 'metodo': 'GET'}
+        conteo = 'recetario_solicitud_duracion_segundos_count'
+        self.assertEqual(self.valor(despues, conteo, **etiquetas) - self.valor(antes, conteo, **etiquetas), 1)
+        self.assertEqual(self.valor(despues, 'recetario_solicitudes_total', endpoint='vistaingredientes', metodo='POST', estado=200)
+                         - self.valor(antes, 'recetario_solicitudes_total', endpoint='vistaingredientes', metodo='POST', estado=200), 1)
+        # El cuerpo en streaming se cuenta al terminar de enviarse
+        self.assertEqual(self.valor(despues, 'recetario_respuesta_bytes_total', **etiquetas)
+                         - self.valor(antes, 'recetario_respuesta_bytes_total', **etiquetas), len(cuerpo))
+        self.assertGreater(self.valor(despues, 'recetario_sql_sentencias_total', **etiquetas)
+                           - self.valor(antes, 'recetario_sql_sentencias_total', **etiquetas), 0)
+        self.assertGreater(self.valor(despues, 'recetario_sql_duracion_segundos_total', **etiquetas)
+                           - self.valor(antes, 'recetario_sql_duracion_segundos_total', **etiquetas), 0)
+        # Los buckets son acumulativos y el de +Inf coincide con el conteo
+        self.assertEqual(self.valor(despues, 'recetario_solicitud_duracion_segundos_bucket', **etiquetas, le='+Inf'),
+                         self.valor(despues, conteo, **etiquetas))
+
+    def test_metricas_cuentan_excepciones_como_500(self):
+        antes = self.leer_metricas()
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+        # Con PROPAGATE_EXCEPTIONS la excepción llega hasta el cliente de pruebas sin pasar por after_request
+        with self.assertRaises(KeyError):
+            self.client.post(endpoint_ingredientes, data=json.dumps({"nombre": "Sal", "unidad": "kg"}), headers=self.headers)
+        despues = self.leer_metricas()
+
+        etiquetas = {'endpoint': 'vistaingredientes', 'metodo': 'POST', 'estado': 500}
+        self.assertEqual(self.valor(despues, 'recetario_solicitudes_total', **etiquetas)
+                         - self.valor(antes, 'recetario_solicitudes_total', **etiquetas), 1)
+
+    def test_registro_por_aplicacion(self):
+        otra_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(DIRECTORIO_PRUEBAS, 'metricas.sqlite'),
+                               'CACHE_RESPUESTAS_ALMACEN': 'memoria'})
+        self.assertIs(registro_metricas._get_current_object(), app.extensions['registro_metricas'])
+        self.assertIsNot(otra_app.extensions['registro_metricas'], app.extensions['registro_metricas'])
+
+    def test_consultas_sql_en_streaming_no_disponibles(self):
+        endpoint_ingredientes = "/usuarios/{}/ingredientes".format(self.usuario_id)
+        anterior = app.config['CONTAR_CONSULTAS']
+        app.config['CONTAR_CONSULTAS'] = True
+        try:
+            normal = self.client.get(endpoint_ingredientes, headers=self.headers)
+            streaming = self.client.get(endpoint_ingredientes + "?stream=ndjson", headers=self.headers)
+            streaming.get_data()
+        finally:
+            app.config['CONTAR_CONSULTAS'] = anterior
+
+        self.assertGreater(int(normal.headers['X-Consultas-SQL']), 0)
+        # Los encabezados se envían antes de que el cuerpo ejecute sus consultas
+        self.assertEqual(streaming.headers['X-Consultas-SQL'], NO_DISPONIBLE)
+
+    def test_metricas_combinan_workers(self):
+        descriptor, ruta = tempfile.mkstemp(suffix='.sqlite')
+        os.close(descriptor)
+        almacen_original = cache_respuestas.almacen
+        # Otro worker publicó su foto en el mismo archivo compartido
+        cache_respuestas.almacen = AlmacenCompartido(ruta, 10, 5)
+        try:
+            cache_respuestas.almacen.publicarMetricas('otro-worker', foto_a_json({
+                'series': {('vistaingredientes', 'GET'): [1] + [0] * len(LIMITES_LATENCIA) + [0.001, 3, 0.0005, 120]},
+                'estados': {('vistaingredientes', 'GET', 200): 1},
+                'cache': [2, 1]}), sumar_fotos_json)
+            propias = registro_metricas.foto()
+            combinadas = registro_metricas.combinar()
+        finally:
+            cache_respuestas.almacen = almacen_original
+            for sufijo in ('', '-wal', '-shm'):
+                if os.path.exists(ruta + sufijo):
+                    os.remove(ruta + sufijo)
+
+        serie_propia = propias['series'].get(('vistaingredientes', 'GET'), [0] * (len(LIMITES_LATENCIA) + 5))
+        self.assertEqual(combinadas['series'][('vistaingredientes', 'GET')][SENTENCIAS_SQL], serie_propia[SENTENCIAS_SQL] + 3)
+        self.assertEqual(combinadas['estados'][('vistaingredientes', 'GET', 200)], propias['estados'].get(('vistaingredientes', 'GET', 200), 0) + 1)
+        self.assertEqual(combinadas['cache'], [propias['cache'][0] + 2, propias['cache'][1] + 1])
+
+    def foto_de_prueba(self, sentencias):
+        return foto_a_json({
+            'series': {('vistaingredientes', 'GET'): [1] + [0] * len(LIMITES_LATENCIA) + [0.001, sentencias, 0.0005, 120]},
+            'estados': {('vistaingredientes', 'GET', 200): 1},
+            'cache': [1, 0]})
+
+    def test_fotos_de_workers_terminados_se_acumulan(self):
+        descriptor, ruta = tempfile.mkstemp(suffix='.sqlite')
+        os.close(descriptor)
+        almacen = AlmacenCompartido(ruta, 10, 5)
+        try:
+            for sentencias in (3, 4):
+                # Un worker que ya terminó dejó su última foto
+                proceso = subprocess.Popen([sys.executable, '-c', 'pass'])
+                proceso.wait()
+                almacen.publicarMetricas('{}:0'.format(proceso.pid), self.foto_de_prueba(sentencias), sumar_fotos_json)
+            almacen.publicarMetricas('{}:0'.format(os.getpid()), self.foto_de_prueba(5), sumar_fotos_json)
+            fotos = almacen.leerMetricas()
+        finally:
+            for sufijo in ('', '-wal', '-shm'):
+                if os.path.exists(ruta + sufijo):
+                    os.remove(ruta + sufijo)
+
+        self.assertEqual(sorted(fotos), sorted([METRICAS_ACUMULADAS, '{}:0'.format(os.getpid())]))
+        acumuladas = fotos[METRICAS_ACUMULADAS]
+        self.assertEqual(acumuladas['series'][0][2][SENTENCIAS_SQL], 7)
+        self.assertEqual(acumuladas['estados'], [['vistaingredientes', 'GET', 200, 2]])
+        self.assertEqual(acumuladas['cache'], [2, 0])
@@ -0,0 +1,153 @@
+import json
+import hashlib
+from datetime import date
+
+from modelos import db, Administrador, Chef, Ingrediente, Menu, MenuReceta, Receta, RecetaIngrediente, Restaurante
+from vistas import Medicion, PresupuestoConsultasExcedido, presupuesto_consultas, verificar_presupuesto
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestPresupuestos(PruebaAislada):
+
+    # Sentencias SQL permitidas por solicitud con los datos de setUp; un N+1 sobre esos registros las supera
+    PRESUPUESTOS = {
+        'GET vistachefs': 2,
+        'GET vistarecetas': 5,
+        'GET vistareceta': 4,
+        # Incluye la estimación de los totales que evita desbordar los enteros escalados
+        'PUT vistareceta': 9,
+        'GET vistamenuschef': 6,
+        'GET vistamenusadmin': 6,
+        'PUT vistamenu': 9,
+        'POST vistareportemenus': 2,
+        'GET vistademanda': 1,
+        'GET vistabusqueda': 6,
+    }
+
+    def setUp(self):
+        self.client = app.test_client()
+
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada)
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                                data=json.dumps(usuario_login),
+                                                headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        # Suficientes registros para que un N+1 supere cualquiera de los presupuestos
+        restaurante = Restaurante(nombre=self.data_factory.company(), administrador=self.usuario_id)
+        db.session.add(restaurante)
+        db.session.commit()
+        self.restaurante_id = restaurante.id
+
+        usuario_chef = 'test_chef_' + self.data_factory.uuid4()
+        for i in range(6):
+            db.session.add(Chef(nombre=self.data_factory.name(), usuario=usuario_chef + str(i),
+                                contrasena=contrasena_encriptada, restaurante=self.restaurante_id))
+        db.session.commit()
+        solicitud_login = self.client.post("/login",
+                                                data=json.dumps({"usuario": usuario_chef + "0", "contrasena": contrasena}),
+                                                headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+        self.chef_id = respuesta_login["id"]
+        self.headers_chef = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(respuesta_login["token"])}
+
+        self.ingredientes_creados = []
+        for i in range(8):
+            ingrediente = Ingrediente(nombre=self.data_factory.sentence(), unidad="kg", costo=i + 1, calorias=10,
+                                      sitio=self.data_factory.company(), administrador=self.usuario_id)
+            db.session.add(ingrediente)
+            db.session.commit()
+            self.ingredientes_creados.append(ingrediente.id)
+
+        self.recetas_creadas = []
+        for i in range(6):
+            receta = Receta(nombre=self.data_factory.sentence(), porcion=2, administrador=self.usuario_id, usuario=self.usuario_id)
+            for j in range(4):
+                receta.ingredientes.append(RecetaIngrediente(cantidad=j + 1, ingrediente=self.ingredientes_creados[(i + j) % 8]))
+            db.session.add(receta)
+            db.session.commit()
+            self.recetas_creadas.append(receta.id)
+
+        self.menus_creados = []
+        for i in range(4):
+            menu = Menu(nombre=self.data_factory.sentence(), descripcion=self.data_factory.sentence(),
+                        fechaInicio=date(2024, 7, 1), fechaFin=date(2024, 7, 7), foto=self.data_factory.url(),
+                        autor=self.usuario_id, restaurante=self.restaurante_id)
+            for j in range(4):
+                menu.recetas.append(MenuReceta(personas=10, receta=self.recetas_creadas[(i + j) % 6]))
+            db.session.add(menu)
+            db.session.commit()
+            self.menus_creados.append(menu.id)
+
+    def test_solicitudes_dentro_del_presupuesto(self):
+        id_receta = self.recetas_creadas[0]
+        id_menu = self.menus_creados[0]
+        with presupuesto_consultas(app, self.PRESUPUESTOS):
+            self.assertEqual(self.client.get("/restaurantes/{}/chefs".format(self.restaurante_id), headers=self.headers).status_code, 200)
+            self.assertEqual(self.client.get("/usuarios/{}/recetas".format(self.usuario_id), headers=self.headers).status_code, 200)
+
+            receta = json.loads(self.client.get("/recetas/{}".format(id_receta), headers=self.headers).get_data())
+            receta_editada = {
+                "nombre": receta["nombre"], "preparacion": "", "duracion": 30, "porcion": 2,
+                "ingredientes": [{"id": linea["id"], "idIngrediente": linea["ingrediente"]["id"], "cantidad": 2}
+                                 for linea in receta["ingredientes"]]
+            }
+            self.assertEqual(self.client.put("/recetas/{}".format(id_receta), data=json.dumps(receta_editada),
+                                             headers=self.headers).status_code, 200)
+
+            self.assertEqual(self.client.get("/usuarios/{}/menus".format(self.chef_id), headers=self.headers_chef).status_code, 200)
+            self.assertEqual(self.client.get("/usuarios/{}/restaurantes/{}/menus".format(self.usuario_id, self.restaurante_id),
+                                             headers=self.headers).status_code, 200)
+            menu_editado = {
+                "nombre": self.data_factory.sentence(), "descripcion": "", "fechaInicio": "2024-07-01", "fechaFin": "2024-07-07",
+                "foto": "", "restaurante": {"id": self.restaurante_id},
+                "recetas": [{"receta": id_receta, "personas": 5} for id_receta in self.recetas_creadas]
+            }
+            self.assertEqual(self.client.put("/usuarios/{}/menu/{}".format(self.usuario_id, id_menu), data=json.dumps(menu_editado),
+                                             headers=self.headers).status_code, 200)
+
+            reporte = {"recetas": [{"receta": id_receta, "personas": 4} for id_receta in self.recetas_creadas]}
+            self.assertEqual(self.client.post("/reporteMenu", data=json.dumps(reporte), headers=self.headers).status_code, 200)
+            self.assertEqual(self.client.get("/usuarios/{}/demanda?desde=2024-07-01&hasta=2024-07-31".format(self.usuario_id),
+                                             headers=self.headers).status_code, 200)
+            self.assertEqual(self.client.get("/usuarios/{}/buscar?q=re".format(self.usuario_id), headers=self.headers).status_code, 200)
+
+    def test_presupuesto_excedido_hace_fallar_la_prueba(self):
+        with presupuesto_consultas(app, {'GET vistachefs': 0}):
+            with self.assertRaises(PresupuestoConsultasExcedido):
+                self.client.get("/restaurantes/{}/chefs".format(self.restaurante_id), headers=self.headers)
+
+    def test_detecta_lecturas_repetidas(self):
+        medicion = Medicion(vigilar=True)
+        for id_receta in (1, 2, 3):
+            medicion.anotar("SELECT receta_ingrediente.id FROM receta_ingrediente WHERE receta_ingrediente.receta = ?")
+            medicion.anotar("SELECT ingrediente.id FROM ingrediente WHERE ingrediente.id IN ({})".format(', '.join('?' * id_receta)))
+            medicion.anotar("INSERT INTO menu_receta (personas, menu, receta) VALUES (?, ?, ?)")
+        medicion.sentencias = 9
+
+        with self.assertRaises(PresupuestoConsultasExcedido) as contexto:
+            verificar_presupuesto({}, 2, 'vistareceta', 'GET', medicion)
+        mensaje = str(contexto.exception)
+        self.assertIn("3 veces, posible N+1: SELECT receta_ingrediente.id", mensaje)
+        self.assertIn("3 veces, posible N+1: SELECT ingrediente.id FROM ingrediente WHERE ingrediente.id IN (?)", mensaje)
+        self.assertNotIn("INSERT", mensaje)
+        # Con un margen suficiente la misma solicitud pasa
+        verificar_presupuesto({'GET vistareceta': 9}, 3, 'vistareceta', 'GET', medicion)
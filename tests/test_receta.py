@@ -0,0 +1,312 @@
+import json
+import hashlib
+import time
+
+from faker.generator import random
+from sqlalchemy import event, text
+from modelos import db, Administrador, Ingrediente, Receta, RecetaIngrediente
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestReceta(PruebaAislada):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada)
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                                data=json.dumps(usuario_login),
+                                                headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        self.ingredientes_creados = []
+        self.recetas_creadas = []
+
+    def crear_ingrediente(self):
+        ingrediente = Ingrediente(nombre=self.data_factory.sentence(),
+                                  unidad=self.data_factory.word(),
+                                  costo=round(random.uniform(0.1, 0.99), 2),
+                                  calorias=round(random.uniform(0.1, 0.99), 2),
+                                  sitio=self.data_factory.sentence(),
+                                  administrador=self.usuario_id)
+        db.session.add(ingrediente)
+        db.session.commit()
+        self.ingredientes_creados.append(ingrediente.id)
+        return ingrediente
+
+    def crear_receta(self, lineas):
+        receta = Receta(nombre=self.data_factory.sentence(),
+                        preparacion=self.data_factory.sentence(),
+                        duracion=1,
+                        porcion=2,
+                        administrador=self.usuario_id,
+                        usuario=self.usuario_id)
+        for ingrediente, cantidad in lineas:
+            receta.ingredientes.append(RecetaIngrediente(cantidad=cantidad, ingrediente=ingrediente.id))
+        db.session.add(receta)
+        db.session.commit()
+        self.recetas_creadas.append(receta.id)
+        return receta
+
+    def test_listar_recetas_con_ingredientes(self):
+        compartido = self.crear_ingrediente()
+        propio = self.crear_ingrediente()
+        self.crear_receta([(compartido, 1), (propio, 2)])
+        self.crear_receta([(compartido, 3)])
+
+        endpoint_recetas = "/usuarios/{}/recetas".format(self.usuario_id)
+        resultado = self.client.get(endpoint_recetas, headers=self.headers)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(datos_respuesta), 2)
+        for receta in datos_respuesta:
+            for receta_ingrediente in receta['ingredientes']:
+                ingrediente = receta_ingrediente['ingrediente']
+                esperado = compartido if ingrediente['id'] == str(compartido.id) else propio
+                self.assertEqual(ingrediente['id'], str(esperado.id))
+                self.assertEqual(ingrediente['nombre'], esperado.nombre)
+                self.assertEqual(ingrediente['costo'], float(esperado.costo))
+
+    def test_dar_receta_con_ingredientes(self):
+        ingrediente = self.crear_ingrediente()
+        receta = self.crear_receta([(ingrediente, 5)])
+
+        endpoint_receta = "/recetas/{}".format(receta.id)
+        resultado = self.client.get(endpoint_receta, headers=self.headers)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(datos_respuesta['id'], str(receta.id))
+        self.assertEqual(len(datos_respuesta['ingredientes']), 1)
+        self.assertEqual(float(datos_respuesta['ingredientes'][0]['cantidad']), 5)
+        self.assertEqual(datos_respuesta['ingredientes'][0]['ingrediente']['nombre'], ingrediente.nombre)
+        self.assertEqual(datos_respuesta['ingredientes'][0]['ingrediente']['costo'], float(ingrediente.costo))
+
+    def test_crear_receta_calcula_totales(self):
+        ingrediente_uno = self.crear_ingrediente()
+        ingrediente_dos = self.crear_ingrediente()
+        nueva_receta = {
+            "nombre": self.data_factory.sentence(),
+            "preparacion": self.data_factory.sentence(),
+            "duracion": 1,
+            "porcion": 4,
+            "ingredientes": [
+                {"cantidad": 2, "idIngrediente": str(ingrediente_uno.id)},
+                {"cantidad": 3, "idIngrediente": str(ingrediente_dos.id)}
+            ]
+        }
+
+        endpoint_recetas = "/usuarios/{}/recetas".format(self.usuario_id)
+        resultado = self.client.post(endpoint_recetas, data=json.dumps(nueva_receta), headers=self.headers)
+        datos_respuesta = json.loads(resultado.get_data())
+        receta = Receta.query.get(datos_respuesta['id'])
+        self.recetas_creadas.append(receta.id)
+
+        costo_esperado = 2 * float(ingrediente_uno.costo) + 3 * float(ingrediente_dos.costo)
+        calorias_esperadas = 2 * float(ingrediente_uno.calorias) + 3 * float(ingrediente_dos.calorias)
+        self.assertEqual(resultado.status_code, 200)
+        self.assertAlmostEqual(float(receta.costo_total), costo_esperado)
+        self.assertAlmostEqual(float(receta.calorias_total), calorias_esperadas)
+        self.assertAlmostEqual(float(receta.costo_porcion), costo_esperado / 4)
+        self.assertAlmostEqual(float(receta.calorias_porcion), calorias_esperadas / 4)
+
+    def test_editar_ingrediente_ajusta_totales(self):
+        ingrediente = self.crear_ingrediente()
+        otro_ingrediente = self.crear_ingrediente()
+        receta = self.crear_receta([(ingrediente, 2), (otro_ingrediente, 1)])
+        receta_ajena = self.crear_receta([(otro_ingrediente, 1)])
+        id_receta = receta.id
+        id_receta_ajena = receta_ajena.id
+        costo_otro_ingrediente = float(otro_ingrediente.costo)
+        calorias_otro_ingrediente = float(otro_ingrediente.calorias)
+        ingrediente_editado = {
+            "nombre": ingrediente.nombre,
+            "unidad": ingrediente.unidad,
+            "costo": float(ingrediente.costo) + 1,
+            "calorias": float(ingrediente.calorias) + 10,
+            "sitio": ingrediente.sitio
+        }
+        endpoint_ingrediente = "/ingredientes/{}".format(ingrediente.id)
+        app.test_cli_runner().invoke(args=['recalcular-totales'])
+        costo_ajena = float(Receta.query.get(id_receta_ajena).costo_total)
+
+        resultado = self.client.put(endpoint_ingrediente, data=json.dumps(ingrediente_editado), headers=self.headers)
+
+        receta = Receta.query.get(id_receta)
+        self.assertEqual(resultado.status_code, 200)
+        self.assertAlmostEqual(float(receta.costo_total), 2 * ingrediente_editado["costo"] + costo_otro_ingrediente)
+        self.assertAlmostEqual(float(receta.calorias_total), 2 * ingrediente_editado["calorias"] + calorias_otro_ingrediente)
+        self.assertAlmostEqual(float(receta.costo_porcion), float(receta.costo_total) / 2)
+        self.assertAlmostEqual(float(Receta.query.get(id_receta_ajena).costo_total), costo_ajena)
+
+    def test_recalcular_totales_desde_cli(self):
+        ingrediente = self.crear_ingrediente()
+        receta = self.crear_receta([(ingrediente, 3)])
+        receta.costo_total = None
+        receta.calorias_total = None
+        db.session.commit()
+        id_receta = receta.id
+        costo_ingrediente = float(ingrediente.costo)
+        calorias_ingrediente = float(ingrediente.calorias)
+
+        resultado = app.test_cli_runner().invoke(args=['recalcular-totales'])
+
+        receta = Receta.query.get(id_receta)
+        self.assertEqual(resultado.exit_code, 0)
+        self.assertAlmostEqual(float(receta.costo_total), 3 * costo_ingrediente)
+        self.assertAlmostEqual(float(receta.calorias_total), 3 * calorias_ingrediente)
+        self.assertAlmostEqual(float(receta.costo_porcion), 3 * costo_ingrediente / 2)
+
+    def test_listar_recetas_en_streaming(self):
+        ingrediente = self.crear_ingrediente()
+        receta = self.crear_receta([(ingrediente, 2)])
+
+        endpoint_recetas = "/usuarios/{}/recetas?stream=json".format(self.usuario_id)
+        resultado = self.client.get(endpoint_recetas, headers=self.headers)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(datos_respuesta), 1)
+        self.assertEqual(datos_respuesta[0]['id'], str(receta.id))
+        self.assertEqual(datos_respuesta[0]['ingredientes'][0]['ingrediente']['nombre'], ingrediente.nombre)
+
+    def test_listar_recetas_sin_cargas_perezosas(self):
+        ingredientes = [self.crear_ingrediente() for i in range(0, 3)]
+        for i in range(0, 10):
+            self.crear_receta([(ingrediente, 1) for ingrediente in ingredientes])
+
+        endpoint_recetas = "/usuarios/{}/recetas".format(self.usuario_id)
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        try:
+            resultado = self.client.get(endpoint_recetas, headers=self.headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        #Dos validadores de la colección, una consulta para las recetas, una para sus líneas y una para los ingredientes
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(datos_respuesta), 10)
+        self.assertEqual(len(consultas), 5)
+
+    def test_editar_receta_solo_toca_lineas_modificadas(self):
+        ingredientes = [self.crear_ingrediente() for i in range(0, 4)]
+        receta = self.crear_receta([(ingredientes[0], 1), (ingredientes[1], 2), (ingredientes[2], 3)])
+        lineas = sorted(receta.ingredientes, key=lambda linea: linea.id)
+        receta_editada = {
+            "nombre": receta.nombre,
+            "preparacion": receta.preparacion,
+            "duracion": 1,
+            "porcion": 2,
+            "ingredientes": [
+                {"id": str(lineas[0].id), "cantidad": 1, "idIngrediente": str(ingredientes[0].id)},
+                {"id": str(lineas[1].id), "cantidad": 5, "idIngrediente": str(ingredientes[1].id)},
+                {"id": "", "cantidad": 4, "idIngrediente": str(ingredientes[3].id)}
+            ]
+        }
+        id_receta = receta.id
+        id_lineas = [linea.id for linea in lineas]
+        id_ingredientes = [ingrediente.id for ingrediente in ingredientes]
+        costo_esperado = float(ingredientes[0].costo) + 5 * float(ingredientes[1].costo) + 4 * float(ingredientes[3].costo)
+
+        endpoint_receta = "/recetas/{}".format(id_receta)
+        sentencias = []
+        def registrar_sentencia(conn, cursor, statement, parameters, context, executemany):
+            sentencias.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', registrar_sentencia)
+        try:
+            resultado = self.client.put(endpoint_receta, data=json.dumps(receta_editada), headers=self.headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', registrar_sentencia)
+
+        self.assertEqual(resultado.status_code, 200)
+        actualizaciones = [parametros for sentencia, parametros in sentencias if sentencia.startswith("UPDATE receta_ingrediente")]
+        self.assertEqual(len(actualizaciones), 1)
+        self.assertEqual(len([sentencia for sentencia, parametros in sentencias if sentencia.startswith("DELETE FROM receta_ingrediente")]), 1)
+        self.assertEqual(len([sentencia for sentencia, parametros in sentencias if sentencia.startswith("INSERT INTO receta_ingrediente")]), 1)
+
+        receta = Receta.query.get(id_receta)
+        lineas_finales = {linea.ingrediente: linea for linea in receta.ingredientes}
+        self.assertEqual(len(lineas_finales), 3)
+        self.assertNotIn(id_ingredientes[2], lineas_finales)
+        self.assertEqual(lineas_finales[id_ingredientes[0]].id, id_lineas[0])
+        self.assertEqual(float(lineas_finales[id_ingredientes[0]].cantidad), 1)
+        self.assertEqual(lineas_finales[id_ingredientes[1]].id, id_lineas[1])
+        self.assertEqual(float(lineas_finales[id_ingredientes[1]].cantidad), 5)
+        self.assertEqual(float(lineas_finales[id_ingredientes[3]].cantidad), 4)
+        self.assertAlmostEqual(float(receta.costo_total), costo_esperado)
+
+    def test_dar_receta_con_etag(self):
+        ingrediente = self.crear_ingrediente()
+        receta = self.crear_receta([(ingrediente, 2)])
+        endpoint_receta = "/recetas/{}".format(receta.id)
+        ingrediente_editado = {
+            "nombre": ingrediente.nombre,
+            "unidad": ingrediente.unidad,
+            "costo": round(float(ingrediente.costo) + 1, 2),
+            "calorias": float(ingrediente.calorias),
+            "sitio": ingrediente.sitio
+        }
+        endpoint_ingrediente = "/ingredientes/{}".format(ingrediente.id)
+
+        resultado = self.client.get(endpoint_receta, headers=self.headers)
+        etag = resultado.headers['ETag']
+        self.assertEqual(resultado.status_code, 200)
+
+        #Sin cambios se responde 304 sin cuerpo
+        headers_condicionales = dict(self.headers, **{'If-None-Match': etag})
+        resultado_condicional = self.client.get(endpoint_receta, headers=headers_condicionales)
+        self.assertEqual(resultado_condicional.status_code, 304)
+        self.assertEqual(resultado_condicional.get_data(), b'')
+        self.assertEqual(resultado_condicional.headers['ETag'], etag)
+
+        #Al cambiar el precio de un ingrediente de la receta cambia su representación
+        self.client.put(endpoint_ingrediente, data=json.dumps(ingrediente_editado), headers=self.headers)
+        resultado_modificado = self.client.get(endpoint_receta, headers=headers_condicionales)
+        datos_respuesta = json.loads(resultado_modificado.get_data())
+        self.assertEqual(resultado_modificado.status_code, 200)
+        self.assertNotEqual(resultado_modificado.headers['ETag'], etag)
+        self.assertEqual(datos_respuesta['ingredientes'][0]['ingrediente']['costo'], ingrediente_editado['costo'])
+
+    def fijar_versiones(self, receta, ingrediente, segundo):
+        for tabla, id_fila in (('receta', receta.id), ('ingrediente', ingrediente.id)):
+            db.session.execute(text("UPDATE {} SET version = :version WHERE id = :id".format(tabla)),
+                               {'version': segundo * 1000000, 'id': id_fila})
+        db.session.commit()
+
+    def test_last_modified_solo_con_segundo_terminado(self):
+        ingrediente = self.crear_ingrediente()
+        receta = self.crear_receta([(ingrediente, 2)])
+        endpoint_receta = "/recetas/{}".format(receta.id)
+
+        #Una escritura en el mismo segundo tendría la misma fecha: mientras el segundo no termina no se envía
+        self.fijar_versiones(receta, ingrediente, int(time.time()) + 5)
+        resultado = self.client.get(endpoint_receta, headers=self.headers)
+        self.assertNotIn('Last-Modified', resultado.headers)
+
+        self.fijar_versiones(receta, ingrediente, int(time.time()) - 5)
+        resultado = self.client.get(endpoint_receta, headers=self.headers)
+        ultima_modificacion = resultado.headers['Last-Modified']
+        resultado_fecha = self.client.get(endpoint_receta, headers=dict(self.headers, **{'If-Modified-Since': ultima_modificacion}))
+        self.assertEqual(resultado_fecha.status_code, 304)
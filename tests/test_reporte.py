@@ -0,0 +1,149 @@
+import json
+import hashlib
+
+from sqlalchemy import event
+from modelos import db, Administrador, Ingrediente, Receta, RecetaIngrediente
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestReporte(PruebaAislada):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada)
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                                data=json.dumps(usuario_login),
+                                                headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+
+        self.ingredientes_creados = []
+        self.recetas_creadas = []
+
+    def crear_ingrediente(self):
+        ingrediente = Ingrediente(nombre=self.data_factory.sentence(),
+                                  unidad=self.data_factory.word(),
+                                  costo=1,
+                                  calorias=1,
+                                  sitio=self.data_factory.sentence(),
+                                  administrador=self.usuario_id)
+        db.session.add(ingrediente)
+        db.session.commit()
+        self.ingredientes_creados.append(ingrediente)
+        return ingrediente
+
+    def crear_receta(self, porcion, lineas):
+        receta = Receta(nombre=self.data_factory.sentence(),
+                        preparacion=self.data_factory.sentence(),
+                        duracion=1,
+                        porcion=porcion,
+                        administrador=self.usuario_id,
+                        usuario=self.usuario_id)
+        for ingrediente, cantidad in lineas:
+            receta.ingredientes.append(RecetaIngrediente(cantidad=cantidad, ingrediente=ingrediente.id))
+        db.session.add(receta)
+        db.session.commit()
+        self.recetas_creadas.append(receta)
+        return receta
+
+    def solicitar_reporte(self, recetas):
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        return self.client.post("/reporteMenu", data=json.dumps({"recetas": recetas}), headers=headers)
+
+    def test_reporte_suma_ingredientes_compartidos(self):
+        arroz = self.crear_ingrediente()
+        pollo = self.crear_ingrediente()
+        receta_uno = self.crear_receta(2, [(arroz, 3), (pollo, 1)])
+        receta_dos = self.crear_receta(4, [(arroz, 2)])
+
+        resultado = self.solicitar_reporte([{"receta": receta_uno.id, "personas": 4},
+                                            {"receta": receta_dos.id, "personas": 8}])
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(datos_respuesta), 2)
+        self.assertEqual(datos_respuesta[0]['nombre'], arroz.nombre)
+        self.assertEqual(datos_respuesta[0]['cantidad'], '10')
+        self.assertEqual(datos_respuesta[0]['unidad'], arroz.unidad)
+        self.assertEqual(datos_respuesta[0]['sitio'], arroz.sitio)
+        self.assertEqual(datos_respuesta[1]['nombre'], pollo.nombre)
+        self.assertEqual(datos_respuesta[1]['cantidad'], '2')
+
+    def test_reporte_redondea_en_cada_paso(self):
+        sal = self.crear_ingrediente()
+        receta_uno = self.crear_receta(10, [(sal, 4)])
+        receta_dos = self.crear_receta(10, [(sal, 4)])
+
+        resultado = self.solicitar_reporte([{"receta": receta_uno.id, "personas": 1},
+                                            {"receta": receta_dos.id, "personas": 1}])
+        datos_respuesta = json.loads(resultado.get_data())
+
+        # Cada receta aporta 0.4, que se redondea a 0 antes de sumar la siguiente
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(datos_respuesta[0]['cantidad'], '0')
+
+    def test_reporte_numero_fijo_de_consultas(self):
+        ingredientes = [self.crear_ingrediente() for i in range(0, 5)]
+        recetas = [self.crear_receta(2, [(ingrediente, 1) for ingrediente in ingredientes]) for i in range(0, 10)]
+
+        solicitud = [{"receta": receta.id, "personas": 2} for receta in recetas]
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        try:
+            resultado = self.solicitar_reporte(solicitud)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(datos_respuesta), 5)
+        for elemento in datos_respuesta:
+            self.assertEqual(elemento['cantidad'], '10')
+        self.assertLessEqual(len(consultas), 2)
+
+    def test_reporte_receta_inexistente(self):
+        resultado = self.solicitar_reporte([{"receta": 0, "personas": 2}])
+        self.assertEqual(resultado.status_code, 422)
+
+    def test_reporte_repetido_desde_cache(self):
+        arroz = self.crear_ingrediente()
+        receta = self.crear_receta(2, [(arroz, 3)])
+        solicitud = [{"receta": receta.id, "personas": 4}]
+        primero = self.solicitar_reporte(solicitud)
+
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        try:
+            segundo = self.solicitar_reporte(solicitud)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        self.assertEqual(len(consultas), 0)
+        self.assertEqual(json.loads(segundo.get_data()), json.loads(primero.get_data()))
+
+        #Al cambiar una línea de la receta el reporte se recalcula
+        linea = RecetaIngrediente.query.filter(RecetaIngrediente.receta == receta.id).first()
+        linea.cantidad = 5
+        db.session.commit()
+        tercero = self.solicitar_reporte(solicitud)
+        self.assertEqual(json.loads(tercero.get_data())[0]['cantidad'], '10')
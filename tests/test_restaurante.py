@@ -1,18 +1,16 @@
 import json
 import hashlib
-from unittest import TestCase
 
-from faker import Faker
 from faker.generator import random
 from modelos import db, Administrador, Restaurante
+from tests.aislamiento import PruebaAislada
 
 from app import app
 
-class TestRestaurante(TestCase):
+class TestRestaurante(PruebaAislada):
 
     
     def setUp(self):
-        self.data_factory = Faker()
         self.client = app.test_client()
         
         nombre_usuario = 'test_' + self.data_factory.name()
@@ -190,17 +188,6 @@ class TestRestaurante(TestCase):
         self.assertIn('El Restaurante con nombre {} ya existe dentro de la cadena'.format(restaurante_creado.nombre), json_data['mensaje'])
         
 
-
-    def tearDown(self):
-        for restaurante_creados in self.restaurantes_creados:
-            restaurante = Restaurante.query.get(restaurante_creados.id)
-            db.session.delete(restaurante)
-            db.session.commit()
-            
-        usuario_login = Administrador.query.get(self.usuario_id)
-        db.session.delete(usuario_login)
-        db.session.commit()
-
     def test_obtener_lista_vacia_restaurantes(self):
         #Definir endpoint, encabezados y hacer el llamado
         endpoint = "/usuarios/{}/restaurantes".format(str(self.usuario_id))
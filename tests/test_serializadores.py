@@ -0,0 +1,45 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from modelos import \
+    Chef, Ingrediente, IngredienteSchema, Menu, MenuReceta, MenuSchema, Receta, RecetaIngrediente, RecetaSchema, \
+    Restaurante, RestauranteSchema, SerializadorCompilado
+from tests.aislamiento import PruebaAislada
+
+from app import app
+
+
+class TestSerializadores(PruebaAislada):
+
+    def verificar_igual_a_marshmallow(self, schema, objetos):
+        serializador = SerializadorCompilado(schema)
+        self.assertEqual(json.dumps(serializador.dumpMany(objetos)), json.dumps(schema.dump(objetos, many=True)))
+        for objeto in objetos:
+            self.assertEqual(json.dumps(serializador.dump(objeto)), json.dumps(schema.dump(objeto)))
+
+    def test_ingredientes(self):
+        ingredientes = [Ingrediente(id=1, nombre=self.data_factory.sentence(), unidad="kg", costo=Decimal("1.25"),
+                                    calorias=Decimal("130.5"), sitio=self.data_factory.city(), administrador=3),
+                        Ingrediente(id=2, nombre=self.data_factory.sentence())]
+        self.verificar_igual_a_marshmallow(IngredienteSchema(), ingredientes)
+
+    def test_recetas_con_lineas(self):
+        receta = Receta(id=5, nombre=self.data_factory.sentence(), preparacion=self.data_factory.text(), duracion=3,
+                        porcion=2, costo_total=Decimal("10.50"), calorias_total=Decimal("99.1"), administrador=1, usuario=1)
+        receta.ingredientes = [RecetaIngrediente(id=7, cantidad=Decimal("2.5"), ingrediente=1, receta=5),
+                               RecetaIngrediente(id=8, cantidad=1, ingrediente=2, receta=5)]
+        self.verificar_igual_a_marshmallow(RecetaSchema(), [receta, Receta(id=6, nombre="Sin líneas")])
+
+    def test_menus_con_recetas(self):
+        menu = Menu(id=2, nombre=self.data_factory.sentence(), descripcion=self.data_factory.sentence(),
+                    fechaInicio=date(2024, 7, 1), fechaFin=date(2024, 7, 7), foto=self.data_factory.url(),
+                    autor=1, restaurante=4)
+        menu.recetas = [MenuReceta(id=1, personas=2, receta=5, menu=2)]
+        self.verificar_igual_a_marshmallow(MenuSchema(), [menu, Menu(id=3)])
+
+    def test_restaurantes_con_chefs(self):
+        restaurante = Restaurante(id=4, nombre=self.data_factory.company(), direccion=self.data_factory.address(),
+                                  servicio_sitio=True, servicio_domicilio=False, administrador=1)
+        restaurante.chefs = [Chef(id=10), Chef(id=11)]
+        self.verificar_igual_a_marshmallow(RestauranteSchema(), [restaurante, Restaurante(id=5)])
@@ -0,0 +1,174 @@
+import json
+import hashlib
+import pickle
+import subprocess
+import sys
+import threading
+
+from modelos import db, Administrador, Ingrediente, Receta, RecetaIngrediente
+from tests.aislamiento import PruebaAislada
+from vistas import ColaLlena, ColaTrabajos, EJECUTANDO, FALLIDO, TERMINADO
+
+from app import app
+
+
+class TestTrabajos(PruebaAislada):
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.token, self.usuario_id = self.crear_administrador()
+
+    def crear_administrador(self):
+        nombre_usuario = 'test_' + self.data_factory.name()
+        contrasena = 'T1$' + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode('utf-8')).hexdigest()
+        db.session.add(Administrador(usuario=nombre_usuario, contrasena=contrasena_encriptada))
+        db.session.commit()
+
+        usuario_login = {
+            "usuario": nombre_usuario,
+            "contrasena": contrasena
+        }
+        solicitud_login = self.client.post("/login",
+                                           data=json.dumps(usuario_login),
+                                           headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+        return respuesta_login["token"], respuesta_login["id"]
+
+    def crear_receta(self):
+        ingrediente = Ingrediente(nombre=self.data_factory.sentence(),
+                                  unidad=self.data_factory.word(),
+                                  costo=1,
+                                  calorias=1,
+                                  sitio=self.data_factory.sentence(),
+                                  administrador=self.usuario_id)
+        db.session.add(ingrediente)
+        db.session.commit()
+        receta = Receta(nombre=self.data_factory.sentence(),
+                        preparacion=self.data_factory.sentence(),
+                        duracion=1,
+                        porcion=2,
+                        administrador=self.usuario_id,
+                        usuario=self.usuario_id)
+        receta.ingredientes.append(RecetaIngrediente(cantidad=3, ingrediente=ingrediente.id))
+        db.session.add(receta)
+        db.session.commit()
+        return receta
+
+    def encabezados(self, token=None):
+        return {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(token or self.token)}
+
+    def enviar_reporte(self, recetas):
+        return self.client.post("/reporteMenu?asincrono=1", data=json.dumps({"recetas": recetas}), headers=self.encabezados())
+
+    def test_reporte_asincrono(self):
+        receta = self.crear_receta()
+        recetas = [{"receta": receta.id, "personas": 4}]
+
+        envio = self.enviar_reporte(recetas)
+        datos_envio = json.loads(envio.get_data())
+        self.assertEqual(envio.status_code, 202)
+        self.assertTrue(envio.headers['Location'].endswith('/trabajos/{}'.format(datos_envio['id'])))
+
+        estado = self.client.get('/trabajos/{}'.format(datos_envio['id']), headers=self.encabezados())
+        self.assertEqual(json.loads(estado.get_data())['estado'], TERMINADO)
+
+        resultado = self.client.get(json.loads(estado.get_data())['resultado'], headers=self.encabezados())
+        sincrono = self.client.post("/reporteMenu", data=json.dumps({"recetas": recetas}), headers=self.encabezados())
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(json.loads(resultado.get_data()), json.loads(sincrono.get_data()))
+
+    def test_envios_identicos_comparten_trabajo(self):
+        receta = self.crear_receta()
+
+        primero = json.loads(self.enviar_reporte([{"receta": receta.id, "personas": 4}]).get_data())
+        segundo = json.loads(self.enviar_reporte([{"receta": receta.id, "personas": 4}]).get_data())
+        otro = json.loads(self.enviar_reporte([{"receta": receta.id, "personas": 6}]).get_data())
+
+        self.assertEqual(primero['id'], segundo['id'])
+        self.assertNotEqual(primero['id'], otro['id'])
+
+    def test_trabajo_fallido(self):
+        envio = json.loads(self.enviar_reporte([{"receta": 0, "personas": 4}]).get_data())
+        self.assertEqual(envio['estado'], 'fallido')
+
+        resultado = self.client.get('/trabajos/{}/resultado'.format(envio['id']), headers=self.encabezados())
+        self.assertEqual(resultado.status_code, 422)
+
+    def test_trabajo_de_otro_tenant(self):
+        receta = self.crear_receta()
+        envio = json.loads(self.enviar_reporte([{"receta": receta.id, "personas": 4}]).get_data())
+        token_ajeno, _ = self.crear_administrador()
+
+        estado = self.client.get('/trabajos/{}'.format(envio['id']), headers=self.encabezados(token_ajeno))
+        self.assertEqual(estado.status_code, 404)
+
+    def test_pool_acotado_y_envios_que_coinciden(self):
+        cola = ColaTrabajos()
+        cola.configurar(app)
+        cola.hilos = 1
+        cola.limite = 1
+        liberar = threading.Event()
+
+        def generar():
+            liberar.wait(5)
+            return ['listo']
+
+        clave = 'reporte-' + self.data_factory.uuid4()
+        id_trabajo = cola.enviar(clave, self.usuario_id, generar)
+        # Con la cola llena un envío igual recibe el mismo trabajo y uno distinto se rechaza
+        self.assertEqual(cola.enviar(clave, self.usuario_id, generar), id_trabajo)
+        with self.assertRaises(ColaLlena):
+            cola.enviar('otro-' + self.data_factory.uuid4(), self.usuario_id, generar)
+
+        liberar.set()
+        cola.ejecutor.shutdown(wait=True)
+        trabajo = cola.obtener(id_trabajo, con_resultado=True)
+        self.assertEqual(trabajo['estado'], TERMINADO)
+        self.assertEqual(trabajo['resultado'], ['listo'])
+
+    def test_resultados_expiran(self):
+        cola = ColaTrabajos()
+        cola.configurar(app)
+        cola.ttl = -1
+
+        id_trabajo = cola.enviar('reporte-' + self.data_factory.uuid4(), self.usuario_id, lambda: ['listo'])
+        self.assertIsNone(cola.obtener(id_trabajo))
+
+    def test_trabajo_de_worker_terminado(self):
+        cola = ColaTrabajos()
+        cola.configurar(app)
+        clave = 'reporte-' + self.data_factory.uuid4()
+        id_trabajo = cola.enviar(clave, self.usuario_id, lambda: ['listo'])
+        # Simula un worker que murió a mitad del trabajo: el pid de un proceso ya terminado
+        proceso = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proceso.wait()
+        with cola.almacen.candado:
+            cola.almacen.conectar().execute("UPDATE trabajo SET estado = ?, pid = ? WHERE id = ?", (EJECUTANDO, proceso.pid, id_trabajo))
+
+        self.assertEqual(cola.obtener(id_trabajo)['estado'], FALLIDO)
+        nuevo = cola.enviar(clave, self.usuario_id, lambda: ['listo'])
+        self.assertNotEqual(nuevo, id_trabajo)
+        self.assertEqual(cola.obtener(nuevo)['estado'], TERMINADO)
+        self.assertEqual(cola.obtener(id_trabajo)['estado'], FALLIDO)
+
+    def test_envio_de_trabajo_ya_expirado(self):
+        receta = self.crear_receta()
+        cola = app.extensions['cola_trabajos']
+        ttl = cola.ttl
+        cola.ttl = -1
+        try:
+            respuesta = self.enviar_reporte([{"receta": receta.id, "personas": 4}])
+        finally:
+            cola.ttl = ttl
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_resultados_pickle_no_se_cargan(self):
+        cola = ColaTrabajos()
+        cola.configurar(app)
+        id_trabajo = cola.enviar('reporte-' + self.data_factory.uuid4(), self.usuario_id, lambda: ['listo'])
+        self.assertEqual(cola.obtener(id_trabajo, con_resultado=True)['resultado'], ['listo'])
+
+        # Un resultado plantado en el archivo compartido no se deserializa con pickle
+        cola.almacen.conectar().execute("UPDATE trabajo SET resultado = ? WHERE id = ?", (pickle.dumps(['plantado']), id_trabajo))
+        self.assertIsNone(cola.obtener(id_trabajo, con_resultado=True)['resultado'])
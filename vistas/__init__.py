@@ -1 +1,4 @@
+from .cache import *
+from .instrumentacion import *
+from .trabajos import *
 from .vistas import *
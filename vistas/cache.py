@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.local import LocalProxy
+
+from modelos import \
+    Administrador, Chef, Ingrediente, Menu, MenuReceta, Receta, RecetaIngrediente, Restaurante, Usuario, \
+    leer_entero
+
+# Fila de métricas que suma las fotos de los workers ya terminados
+METRICAS_ACUMULADAS = 'acumuladas'
+
+
+def a_json(valor):
+    return json.dumps(valor, separators=(',', ':'))
+
+def desde_json(texto):
+    # Los archivos compartidos guardan JSON y nunca pickle: un archivo alterado no puede ejecutar código al leerse.
+    # Lo que no es JSON, como las filas de versiones anteriores, cuenta como ausente
+    try:
+        return json.loads(texto)
+    except (TypeError, ValueError):
+        return None
+
+def directorio_privado(app):
+    # Los archivos compartidos por los workers van en la carpeta de instancia, accesible solo para el usuario de la aplicación
+    os.makedirs(app.instance_path, mode=0o700, exist_ok=True)
+    os.chmod(app.instance_path, 0o700)
+    return app.instance_path
+
+def proceso_terminado(proceso):
+    # Las fotos de métricas se identifican como "pid:inicio". El almacén es local al host, así que el pid se puede consultar
+    try:
+        return pid_terminado(int(proceso.split(':', 1)[0]))
+    except ValueError:
+        return False
+
+def pid_terminado(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, OverflowError):
+        return False
+    return False
+
+def nueva_generacion(actual):
+    # Las generaciones son marcas de tiempo en microsegundos que nunca retroceden
+    return max(actual + 1, int(time.time() * 1000000))
+
+class AlmacenMemoria():
+    # LRU con expiración dentro del proceso; solo sirve cuando hay un único worker
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self.entradas = OrderedDict()
+        self.generaciones = {}
+        self.candado = threading.Lock()
+
+    def obtener(self, clave):
+        with self.candado:
+            entrada = self.entradas.get(clave)
+            if entrada is None or entrada[0] < time.time():
+                self.entradas.pop(clave, None)
+                return None
+            self.entradas.move_to_end(clave)
+            return entrada[1]
+
+    def guardar(self, clave, valor, ttl):
+        with self.candado:
+            self.entradas[clave] = (time.time() + ttl, valor)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.tamano:
+                self.entradas.popitem(last=False)
+
+    def generacion(self, espacio):
+        return self.generaciones.get(espacio, 0)
+
+    def invalidar(self, espacio):
+        with self.candado:
+            self.generaciones[espacio] = nueva_generacion(self.generaciones.get(espacio, 0))
+
+    def limpiar(self):
+        with self.candado:
+            self.entradas.clear()
+
+    def cantidad(self):
+        return len(self.entradas)
+
+    def publicarMetricas(self, proceso, valor, sumar):
+        # Con un único proceso no hay métricas de otros workers que combinar
+        pass
+
+    def leerMetricas(self):
+        return {}
+
+class AlmacenCompartido():
+    # Archivo SQLite compartido por todos los workers del host; las generaciones se incrementan de forma atómica
+
+    def __init__(self, ruta, tamano, espera):
+        self.ruta = ruta
+        self.tamano = tamano
+        self.espera = espera
+        self.candado = threading.Lock()
+        self.conexion = None
+        self.pid = None
+        with self.candado:
+            self.conectar().executescript(
+                "CREATE TABLE IF NOT EXISTS entrada (clave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS ix_entrada_expira ON entrada (expira);"
+                "CREATE TABLE IF NOT EXISTS generacion (espacio TEXT PRIMARY KEY, valor INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS metricas (proceso TEXT PRIMARY KEY, valor TEXT NOT NULL);")
+
+    def conectar(self):
+        # Cada proceso abre su propia conexión; la heredada de un fork no se reutiliza
+        if self.conexion is None or self.pid != os.getpid():
+            self.conexion = sqlite3.connect(self.ruta, timeout=self.espera, isolation_level=None, check_same_thread=False)
+            self.conexion.execute("PRAGMA journal_mode=WAL")
+            self.conexion.execute("PRAGMA synchronous=NORMAL")
+            self.pid = os.getpid()
+        return self.conexion
+
+    def obtener(self, clave):
+        with self.candado:
+            fila = self.conectar().execute("SELECT valor FROM entrada WHERE clave = ? AND expira >= ?", (clave, time.time())).fetchone()
+        return desde_json(fila[0]) if fila is not None else None
+
+    def guardar(self, clave, valor, ttl):
+        ahora = time.time()
+        with self.candado:
+            conexion = self.conectar()
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                conexion.execute("INSERT OR REPLACE INTO entrada (clave, valor, expira) VALUES (?, ?, ?)", \
+                    (clave, a_json(valor), ahora + ttl))
+                conexion.execute("DELETE FROM entrada WHERE expira < ?", (ahora,))
+                # Al superar el tamaño se descartan primero las entradas que vencen antes
+                conexion.execute("DELETE FROM entrada WHERE clave IN (SELECT clave FROM entrada ORDER BY expira " \
+                    "LIMIT max((SELECT count(*) FROM entrada) - ?, 0))", (self.tamano,))
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+
+    def generacion(self, espacio):
+        with self.candado:
+            fila = self.conectar().execute("SELECT valor FROM generacion WHERE espacio = ?", (espacio,)).fetchone()
+        return fila[0] if fila is not None else 0
+
+    def invalidar(self, espacio):
+        with self.candado:
+            self.conectar().execute("INSERT INTO generacion (espacio, valor) VALUES (?, ?) " \
+                "ON CONFLICT (espacio) DO UPDATE SET valor = max(valor + 1, excluded.valor)", \
+                (espacio, nueva_generacion(0)))
+
+    def limpiar(self):
+        with self.candado:
+            self.conectar().execute("DELETE FROM entrada")
+
+    def cantidad(self):
+        with self.candado:
+            return self.conectar().execute("SELECT count(*) FROM entrada").fetchone()[0]
+
+    def publicarMetricas(self, proceso, valor, sumar):
+        # Cada worker deja su última foto. Las de procesos terminados se suman con `sumar` en una única fila acumulada:
+        # los contadores no retroceden y la tabla no crece con cada reinicio de un worker
+        with self.candado:
+            conexion = self.conectar()
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                conexion.execute("INSERT OR REPLACE INTO metricas (proceso, valor) VALUES (?, ?)", (proceso, a_json(valor)))
+                filas = conexion.execute("SELECT proceso, valor FROM metricas").fetchall()
+                terminadas = [(otro, foto) for otro, foto in filas if proceso_terminado(otro)]
+                if terminadas:
+                    fotos = [desde_json(foto) for otro, foto in filas if otro == METRICAS_ACUMULADAS] + \
+                        [desde_json(foto) for otro, foto in terminadas]
+                    conexion.execute("INSERT OR REPLACE INTO metricas (proceso, valor) VALUES (?, ?)", \
+                        (METRICAS_ACUMULADAS, a_json(sumar([foto for foto in fotos if foto is not None]))))
+                    conexion.executemany("DELETE FROM metricas WHERE proceso = ?", [(otro,) for otro, foto in terminadas])
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+
+    def leerMetricas(self):
+        with self.candado:
+            filas = self.conectar().execute("SELECT proceso, valor FROM metricas").fetchall()
+        fotos = {proceso: desde_json(valor) for proceso, valor in filas}
+        return {proceso: foto for proceso, foto in fotos.items() if foto is not None}
+
+class CacheRespuestas():
+    # Caché de resultados ya calculados, separada por administrador (tenant)
+
+    def __init__(self):
+        self.almacen = AlmacenMemoria(1024)
+        self.aciertos = 0
+        self.fallos = 0
+
+    def configurar(self, app):
+        if app.config['CACHE_RESPUESTAS_ALMACEN'] == 'compartido':
+            self.almacen = AlmacenCompartido(app.config['CACHE_RESPUESTAS_RUTA'], \
+                app.config['CACHE_RESPUESTAS_TAMANO'], app.config['SQLITE_BUSY_TIMEOUT'] / 1000)
+        else:
+            self.almacen = AlmacenMemoria(app.config['CACHE_RESPUESTAS_TAMANO'])
+
+    def clave(self, vista, id_administrador, *partes):
+        # La generación del tenant forma parte de la clave: al invalidar, sus entradas anteriores dejan de encontrarse
+        espacio = 'tenant:{}'.format(id_administrador)
+        return json.dumps([vista, espacio, self.almacen.generacion(espacio)] + list(partes), default=str)
+
+    def claveSolicitud(self, vista, id_administrador, id_usuario):
+        return self.clave(vista, id_administrador, id_usuario, sorted(request.args.items(multi=True)))
+
+    def obtener(self, clave):
+        valor = self.almacen.obtener(clave)
+        if valor is None:
+            self.fallos += 1
+        else:
+            self.aciertos += 1
+        return valor
+
+    def guardar(self, clave, valor, ttl):
+        self.almacen.guardar(clave, valor, ttl)
+
+    def invalidar(self, id_administrador):
+        self.almacen.invalidar('tenant:{}'.format(id_administrador))
+
+    def generacionUsuario(self, id_usuario):
+        return self.almacen.generacion('usuario:{}'.format(id_usuario))
+
+    def invalidarUsuario(self, id_usuario):
+        self.almacen.invalidar('usuario:{}'.format(id_usuario))
+
+    def limpiar(self):
+        self.almacen.limpiar()
+
+    def estadisticas(self):
+        return {'aciertos': self.aciertos, 'fallos': self.fallos, 'entradas': self.almacen.cantidad()}
+
+# Cada aplicación guarda su caché en app.extensions; este proxy resuelve la de la aplicación activa
+cache_respuestas = LocalProxy(lambda: current_app.extensions['cache_respuestas'])
+
+def configurar_cache(app):
+    # Por defecto la caché vive en un archivo SQLite local para que todos los workers de gunicorn la compartan
+    app.config.setdefault('CACHE_RESPUESTAS', os.environ.get('CACHE_RESPUESTAS', '1') not in ('0', 'false', 'False'))
+    app.config.setdefault('CACHE_RESPUESTAS_ALMACEN', os.environ.get('CACHE_RESPUESTAS_ALMACEN', 'compartido'))
+    if 'CACHE_RESPUESTAS_RUTA' not in app.config:
+        base_de_datos = hashlib.md5(app.config['SQLALCHEMY_DATABASE_URI'].encode('utf-8')).hexdigest()[:12]
+        app.config['CACHE_RESPUESTAS_RUTA'] = os.environ.get('CACHE_RESPUESTAS_RUTA') or \
+            os.path.join(directorio_privado(app), 'recetario-cache-{}.sqlite'.format(base_de_datos))
+    app.config.setdefault('CACHE_RESPUESTAS_TAMANO', leer_entero('CACHE_RESPUESTAS_TAMANO', 1024))
+    app.config.setdefault('CACHE_RESPUESTAS_TTL', leer_entero('CACHE_RESPUESTAS_TTL', 60))
+    cache = CacheRespuestas()
+    cache.configurar(app)
+    app.extensions['cache_respuestas'] = cache
+
+def cargar(session, modelo, id_registro, cargados):
+    # El mapa de identidad de la sesión es débil: se conservan aquí los registros ya consultados durante el flush
+    if id_registro is None:
+        return None
+    if (modelo, id_registro) not in cargados:
+        cargados[(modelo, id_registro)] = session.get(modelo, id_registro)
+    return cargados[(modelo, id_registro)]
+
+def obtener_administrador(session, instancia, cargados=None):
+    # Resuelve a qué tenant pertenece un registro modificado
+    cargados = {} if cargados is None else cargados
+    if isinstance(instancia, Administrador):
+        return instancia.id
+    if isinstance(instancia, (Ingrediente, Receta, Restaurante)):
+        return instancia.administrador
+    if isinstance(instancia, (Chef, Menu)):
+        restaurante = cargar(session, Restaurante, instancia.restaurante, cargados)
+        return restaurante.administrador if restaurante is not None else None
+    if isinstance(instancia, RecetaIngrediente):
+        receta = cargar(session, Receta, instancia.receta, cargados)
+        return receta.administrador if receta is not None else None
+    if isinstance(instancia, MenuReceta):
+        menu = cargar(session, Menu, instancia.menu, cargados)
+        return obtener_administrador(session, menu, cargados) if menu is not None else None
+    return None
+
+@event.listens_for(Session, 'before_flush')
+def registrar_tenants_modificados(session, contexto, instancias):
+    tenants = session.info.setdefault('tenants_modificados', set())
+    usuarios = session.info.setdefault('usuarios_modificados', set())
+    cargados = {}
+    for instancia in list(session.new) + list(session.dirty) + list(session.deleted):
+        tenants.add(obtener_administrador(session, instancia, cargados))
+        # Un usuario editado o borrado deja de resolverse desde la caché
+        if isinstance(instancia, Usuario) and instancia.id is not None:
+            usuarios.add(instancia.id)
+
+@event.listens_for(Session, 'after_flush')
+def registrar_administradores_nuevos(session, contexto):
+    # Un administrador nuevo puede reutilizar el id de uno borrado: su id solo se conoce después del flush
+    tenants = session.info.setdefault('tenants_modificados', set())
+    for instancia in session.new:
+        if isinstance(instancia, Administrador):
+            tenants.add(instancia.id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidar_tenants_modificados(session):
+    # Fuera de un contexto de aplicación no hay caché que invalidar
+    if not has_app_context() or 'cache_respuestas' not in current_app.extensions:
+        session.info.pop('tenants_modificados', None)
+        session.info.pop('usuarios_modificados', None)
+        return
+    for id_administrador in session.info.pop('tenants_modificados', set()):
+        cache_respuestas.invalidar(id_administrador)
+    for id_usuario in session.info.pop('usuarios_modificados', set()):
+        cache_respuestas.invalidarUsuario(id_usuario)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def descartar_tenants_modificados(session, transaccion_anterior):
+    session.info.pop('tenants_modificados', None)
+    session.info.pop('usuarios_modificados', None)
@@ -0,0 +1,306 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import partial
+
+from flask import Response, current_app, g, has_request_context, request
+from flask_restful import Resource
+from sqlalchemy import event
+from werkzeug.local import LocalProxy
+
+from modelos import leer_entero
+from .cache import cache_respuestas
+
+# Límites superiores en segundos de los buckets del histograma de latencia
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Posiciones dentro de cada serie: buckets (el último es +Inf), suma de latencias, sentencias SQL, segundos SQL y bytes
+SUMA_LATENCIA = len(LIMITES_LATENCIA) + 1
+SENTENCIAS_SQL = SUMA_LATENCIA + 1
+SEGUNDOS_SQL = SUMA_LATENCIA + 2
+BYTES = SUMA_LATENCIA + 3
+# Para reconocer sentencias que solo difieren en sus parámetros
+LISTA_PARAMETROS = re.compile(r"\?(\s*,\s*\?)+")
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# El control de transacciones no es una consulta: COMMIT ni siquiera pasa por el cursor
+CONTROL_TRANSACCION = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+# Valor de X-Consultas-SQL cuando la cuenta no se conoce al enviar los encabezados
+NO_DISPONIBLE = 'no-disponible'
+
+
+class PresupuestoConsultasExcedido(AssertionError):
+    # Es un AssertionError para que la prueba que hizo la solicitud falle como cualquier otra aserción
+    pass
+
+
+class Medicion():
+    # Lo observado durante una solicitud; se guarda en g y lo actualizan los eventos del motor
+    __slots__ = ('inicio', 'sentencias', 'segundos_sql', 'bytes', 'normalizadas', 'registrada')
+
+    def __init__(self, vigilar=False):
+        self.inicio = time.perf_counter()
+        self.sentencias = 0
+        self.segundos_sql = 0.0
+        self.bytes = 0
+        # after_request o teardown_request ya se encargaron de registrarla
+        self.registrada = False
+        # Solo al vigilar las consultas se guarda el texto de cada sentencia
+        self.normalizadas = {} if vigilar else None
+
+    def anotar(self, sentencia):
+        # Un N+1 es una lectura repetida; las escrituras de varias filas hijas son esperables
+        if not sentencia.lstrip()[:6].upper() == 'SELECT':
+            return
+        clave = LITERAL.sub('?', LISTA_PARAMETROS.sub('?', ' '.join(sentencia.split())))
+        self.normalizadas[clave] = self.normalizadas.get(clave, 0) + 1
+
+    def repetidas(self, permitidas):
+        return sorted(((cantidad, sentencia) for sentencia, cantidad in self.normalizadas.items() if cantidad > permitidas), reverse=True)
+
+class RegistroMetricas():
+    # Acumula por (endpoint, método) en la memoria del proceso; cada worker publica su foto en el almacén compartido
+
+    def __init__(self):
+        self.candado = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        # Un worker recién creado por fork no hereda lo que haya medido el proceso padre
+        self.pid = os.getpid()
+        self.proceso = '{}:{}'.format(self.pid, time.time())
+        self.series = {}
+        self.estados = {}
+        self.publicado = time.time()
+
+    def registrar(self, endpoint, metodo, estado, medicion):
+        duracion = time.perf_counter() - medicion.inicio
+        with self.candado:
+            if self.pid != os.getpid():
+                self.reiniciar()
+            serie = self.series.get((endpoint, metodo))
+            if serie is None:
+                serie = self.series[(endpoint, metodo)] = [0] * SUMA_LATENCIA + [0.0, 0, 0.0, 0]
+            serie[bisect_left(LIMITES_LATENCIA, duracion)] += 1
+            serie[SUMA_LATENCIA] += duracion
+            serie[SENTENCIAS_SQL] += medicion.sentencias
+            serie[SEGUNDOS_SQL] += medicion.segundos_sql
+            serie[BYTES] += medicion.bytes
+            clave = (endpoint, metodo, estado)
+            self.estados[clave] = self.estados.get(clave, 0) + 1
+
+    def foto(self):
+        with self.candado:
+            return {'series': {clave: list(serie) for clave, serie in self.series.items()},
+                    'estados': dict(self.estados),
+                    'cache': [cache_respuestas.aciertos, cache_respuestas.fallos]}
+
+    def publicar(self, intervalo):
+        # Como mucho una escritura cada `intervalo` segundos por worker
+        ahora = time.time()
+        if ahora - self.publicado < intervalo:
+            return
+        self.publicado = ahora
+        cache_respuestas.almacen.publicarMetricas(self.proceso, foto_a_json(self.foto()), sumar_fotos_json)
+
+    def combinar(self):
+        # Suma la foto propia, que está al día, con la última publicada por cada uno de los otros workers
+        fotos = {proceso: foto_desde_json(foto) for proceso, foto in cache_respuestas.almacen.leerMetricas().items()}
+        fotos[self.proceso] = self.foto()
+        return sumar_fotos(fotos.values())
+
+    def exportar(self):
+        # Formato de texto de Prometheus (versión 0.0.4)
+        datos = self.combinar()
+        series = sorted(datos['series'].items())
+        lineas = [
+            '# HELP recetario_solicitud_duracion_segundos Latencia de las solicitudes por endpoint y método.',
+            '# TYPE recetario_solicitud_duracion_segundos histogram']
+        for (endpoint, metodo), serie in series:
+            etiquetas = 'endpoint="{}",metodo="{}"'.format(escapar(endpoint), escapar(metodo))
+            acumulado = 0
+            for limite, cantidad in zip(LIMITES_LATENCIA + ('+Inf',), serie):
+                acumulado += cantidad
+                lineas.append('recetario_solicitud_duracion_segundos_bucket{{{},le="{}"}} {}'.format(etiquetas, limite, acumulado))
+            lineas.append('recetario_solicitud_duracion_segundos_sum{{{}}} {}'.format(etiquetas, repr(float(serie[SUMA_LATENCIA]))))
+            lineas.append('recetario_solicitud_duracion_segundos_count{{{}}} {}'.format(etiquetas, acumulado))
+        lineas += [
+            '# HELP recetario_solicitudes_total Solicitudes atendidas por endpoint, método y código de estado.',
+            '# TYPE recetario_solicitudes_total counter']
+        for (endpoint, metodo, estado), cantidad in sorted(datos['estados'].items()):
+            lineas.append('recetario_solicitudes_total{{endpoint="{}",metodo="{}",estado="{}"}} {}'.format(
+                escapar(endpoint), escapar(metodo), estado, cantidad))
+        for nombre, tipo, ayuda, posicion in (
+                ('recetario_sql_sentencias_total', 'counter', 'Sentencias SQL ejecutadas por endpoint y método.', SENTENCIAS_SQL),
+                ('recetario_sql_duracion_segundos_total', 'counter', 'Tiempo total en sentencias SQL por endpoint y método.', SEGUNDOS_SQL),
+                ('recetario_respuesta_bytes_total', 'counter', 'Bytes enviados en el cuerpo de las respuestas por endpoint y método.', BYTES)):
+            lineas += ['# HELP {} {}'.format(nombre, ayuda), '# TYPE {} {}'.format(nombre, tipo)]
+            for (endpoint, metodo), serie in series:
+                valor = serie[posicion]
+                lineas.append('{}{{endpoint="{}",metodo="{}"}} {}'.format(
+                    nombre, escapar(endpoint), escapar(metodo), repr(float(valor)) if isinstance(valor, float) else valor))
+        lineas += [
+            '# HELP recetario_cache_aciertos_total Respuestas servidas desde la caché.',
+            '# TYPE recetario_cache_aciertos_total counter',
+            'recetario_cache_aciertos_total {}'.format(datos['cache'][0]),
+            '# HELP recetario_cache_fallos_total Consultas a la caché que no encontraron la respuesta.',
+            '# TYPE recetario_cache_fallos_total counter',
+            'recetario_cache_fallos_total {}'.format(datos['cache'][1])]
+        return '\n'.join(lineas) + '\n'
+
+def sumar_fotos(fotos):
+    series = {}
+    estados = {}
+    cache = [0, 0]
+    for foto in fotos:
+        for clave, serie in foto['series'].items():
+            acumulada = series.setdefault(clave, [0] * len(serie))
+            for i, valor in enumerate(serie):
+                acumulada[i] += valor
+        for clave, cantidad in foto['estados'].items():
+            estados[clave] = estados.get(clave, 0) + cantidad
+        cache = [cache[0] + foto['cache'][0], cache[1] + foto['cache'][1]]
+    return {'series': series, 'estados': estados, 'cache': cache}
+
+def sumar_fotos_json(fotos):
+    return foto_a_json(sumar_fotos(foto_desde_json(foto) for foto in fotos))
+
+def foto_a_json(foto):
+    # El almacén compartido guarda JSON, que no admite tuplas como llaves
+    return {'series': [list(clave) + [serie] for clave, serie in foto['series'].items()],
+            'estados': [list(clave) + [cantidad] for clave, cantidad in foto['estados'].items()],
+            'cache': foto['cache']}
+
+def foto_desde_json(datos):
+    return {'series': {(endpoint, metodo): serie for endpoint, metodo, serie in datos['series']},
+            'estados': {(endpoint, metodo, estado): cantidad for endpoint, metodo, estado, cantidad in datos['estados']},
+            'cache': datos['cache']}
+
+def escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Cada aplicación guarda su registro en app.extensions; este proxy resuelve el de la aplicación activa
+registro_metricas = LocalProxy(lambda: current_app.extensions['registro_metricas'])
+
+def medir_flujo(iterable, medicion, terminar):
+    # En las respuestas en streaming el trabajo ocurre al recorrer el cuerpo, así que se registra al terminar
+    try:
+        for fragmento in iterable:
+            medicion.bytes += len(fragmento.encode('utf-8') if isinstance(fragmento, str) else fragmento)
+            yield fragmento
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+        terminar()
+
+def verificar_presupuesto(presupuestos, permitidas, endpoint, metodo, medicion):
+    # El presupuesto se declara por 'MÉTODO endpoint'; sin presupuesto solo se revisan las sentencias repetidas
+    nombre = '{} {}'.format(metodo, endpoint)
+    presupuesto = presupuestos.get(nombre)
+    repetidas = medicion.repetidas(permitidas) if permitidas is not None else []
+    if (presupuesto is None or medicion.sentencias <= presupuesto) and not repetidas:
+        return
+    mensaje = ['{} ejecutó {} sentencias SQL (presupuesto: {})'.format(
+        nombre, medicion.sentencias, presupuesto if presupuesto is not None else 'sin límite')]
+    for cantidad, sentencia in repetidas:
+        mensaje.append('  {} veces, posible N+1: {}'.format(cantidad, sentencia))
+    raise PresupuestoConsultasExcedido('\n'.join(mensaje))
+
+@contextmanager
+def presupuesto_consultas(app, presupuestos=None, repeticiones=None):
+    # Para las pruebas: dentro del bloque, una solicitud que supere su presupuesto o repita una sentencia
+    # más de `repeticiones` veces hace fallar la prueba
+    if 'instrumentacion' not in app.extensions:
+        raise RuntimeError('La instrumentación no está configurada en esta aplicación')
+    anterior = {clave: app.config[clave] for clave in ('VIGILAR_CONSULTAS', 'PRESUPUESTOS_CONSULTAS', 'REPETICIONES_PERMITIDAS')}
+    app.config['VIGILAR_CONSULTAS'] = True
+    app.config['PRESUPUESTOS_CONSULTAS'] = dict(anterior['PRESUPUESTOS_CONSULTAS'], **(presupuestos or {}))
+    if repeticiones is not None:
+        app.config['REPETICIONES_PERMITIDAS'] = repeticiones
+    try:
+        yield
+    finally:
+        app.config.update(anterior)
+
+def configurar_instrumentacion(app, engine):
+    # Con METRICAS (activo por defecto) cada solicitud alimenta /metrics; con CONTAR_CONSULTAS=1
+    # además cada respuesta informa cuántas sentencias SQL ejecutó, para las pruebas de carga.
+    # Con VIGILAR_CONSULTAS=1 (modo de pruebas) se revisan los presupuestos y las sentencias repetidas
+    app.config.setdefault('CONTAR_CONSULTAS', os.environ.get('CONTAR_CONSULTAS', '0') in ('1', 'true', 'True'))
+    app.config.setdefault('METRICAS', os.environ.get('METRICAS', '1') not in ('0', 'false', 'False'))
+    app.config.setdefault('METRICAS_INTERVALO', leer_entero('METRICAS_INTERVALO', 5))
+    app.config.setdefault('VIGILAR_CONSULTAS', os.environ.get('VIGILAR_CONSULTAS', '0') in ('1', 'true', 'True'))
+    app.config.setdefault('PRESUPUESTOS_CONSULTAS', {})
+    app.config.setdefault('REPETICIONES_PERMITIDAS', leer_entero('REPETICIONES_PERMITIDAS', 2))
+    if not app.config['CONTAR_CONSULTAS'] and not app.config['METRICAS'] and not app.config['VIGILAR_CONSULTAS']:
+        return
+    app.extensions['instrumentacion'] = True
+    registro = app.extensions['registro_metricas'] = RegistroMetricas()
+
+    @app.before_request
+    def iniciar_medicion():
+        # g pertenece al contexto de aplicación, que puede ser compartido entre solicitudes
+        g.medicion = Medicion(app.config['VIGILAR_CONSULTAS'])
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def iniciar_sentencia(conexion, cursor, sentencia, parametros, contexto, executemany):
+        if has_request_context():
+            conexion.info['inicio_sentencia'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def terminar_sentencia(conexion, cursor, sentencia, parametros, contexto, executemany):
+        medicion = g.get('medicion') if has_request_context() else None
+        inicio = conexion.info.pop('inicio_sentencia', None)
+        if medicion is not None and inicio is not None and not sentencia.startswith(CONTROL_TRANSACCION):
+            medicion.sentencias += 1
+            medicion.segundos_sql += time.perf_counter() - inicio
+            if medicion.normalizadas is not None:
+                medicion.anotar(sentencia)
+
+    @app.after_request
+    def registrar_medicion(respuesta):
+        medicion = g.get('medicion')
+        if medicion is None:
+            return respuesta
+        medicion.registrada = True
+        if app.config['CONTAR_CONSULTAS']:
+            # Un cuerpo en streaming ejecuta sus consultas después de enviar los encabezados: su cuenta aún no se conoce
+            respuesta.headers['X-Consultas-SQL'] = NO_DISPONIBLE if respuesta.is_streamed else str(medicion.sentencias)
+        if not app.config['METRICAS'] and medicion.normalizadas is None:
+            return respuesta
+        endpoint = request.endpoint or 'desconocido'
+        terminar = partial(terminar_medicion, registro, endpoint, request.method, respuesta.status_code, medicion, \
+            app.config['METRICAS'], dict(app.config['PRESUPUESTOS_CONSULTAS']), app.config['REPETICIONES_PERMITIDAS'])
+        if respuesta.is_streamed:
+            respuesta.response = medir_flujo(respuesta.response, medicion, terminar)
+        else:
+            medicion.bytes = respuesta.calculate_content_length() or 0
+            terminar()
+        if app.config['METRICAS']:
+            registro.publicar(app.config['METRICAS_INTERVALO'])
+        return respuesta
+
+    @app.teardown_request
+    def registrar_error(error):
+        # Con PROPAGATE_EXCEPTIONS una vista que lanza una excepción no pasa por after_request: se cuenta aquí como 500.
+        # El presupuesto de consultas no se revisa para no ocultar la excepción original
+        medicion = g.get('medicion')
+        if error is None or medicion is None or medicion.registrada or not app.config['METRICAS']:
+            return
+        medicion.registrada = True
+        registro.registrar(request.endpoint or 'desconocido', request.method, 500, medicion)
+        registro.publicar(app.config['METRICAS_INTERVALO'])
+
+def terminar_medicion(registro, endpoint, metodo, estado, medicion, metricas, presupuestos, permitidas):
+    if metricas:
+        registro.registrar(endpoint, metodo, estado, medicion)
+    if medicion.normalizadas is not None:
+        verificar_presupuesto(presupuestos, permitidas, endpoint, metodo, medicion)
+
+class VistaMetricas(Resource):
+
+    def get(self):
+        if not current_app.config.get('METRICAS'):
+            return 'Las métricas están deshabilitadas', 404
+        return Response(registro_metricas.exportar(), status=200, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+from modelos import db, leer_entero
+from .cache import a_json, desde_json, directorio_privado, pid_terminado
+
+
+logger = logging.getLogger(__name__)
+
+PENDIENTE = 'pendiente'
+EJECUTANDO = 'ejecutando'
+TERMINADO = 'terminado'
+FALLIDO = 'fallido'
+# Mensaje de un trabajo cuyo worker terminó (timeout de gunicorn, falta de memoria) antes de completarlo
+WORKER_TERMINADO = 'El proceso que ejecutaba el trabajo terminó antes de completarlo'
+
+class ErrorTrabajo(Exception):
+    # Falla esperada de un trabajo; su mensaje se entrega al cliente
+    pass
+
+class ColaLlena(Exception):
+    pass
+
+class AlmacenTrabajos():
+    # Estado y resultado de los trabajos en un archivo SQLite local, visible para todos los workers del host
+
+    def __init__(self, ruta, espera):
+        self.ruta = ruta
+        self.espera = espera
+        self.candado = threading.Lock()
+        self.conexion = None
+        self.pid = None
+        with self.candado:
+            self.conectar().executescript(
+                "CREATE TABLE IF NOT EXISTS trabajo (id TEXT PRIMARY KEY, clave TEXT NOT NULL, administrador INTEGER, " \
+                "estado TEXT NOT NULL, resultado TEXT, mensaje TEXT, creado REAL NOT NULL, terminado REAL, expira REAL NOT NULL, " \
+                "pid INTEGER);"
+                "CREATE INDEX IF NOT EXISTS ix_trabajo_clave ON trabajo (clave);"
+                "CREATE INDEX IF NOT EXISTS ix_trabajo_expira ON trabajo (expira);")
+            # Los archivos creados antes de guardar el proceso dueño no tienen la columna pid
+            columnas = [fila[1] for fila in self.conectar().execute("PRAGMA table_info(trabajo)")]
+            if 'pid' not in columnas:
+                self.conectar().execute("ALTER TABLE trabajo ADD COLUMN pid INTEGER")
+
+    def conectar(self):
+        # Cada proceso abre su propia conexión; la heredada de un fork no se reutiliza
+        if self.conexion is None or self.pid != os.getpid():
+            self.conexion = sqlite3.connect(self.ruta, timeout=self.espera, isolation_level=None, check_same_thread=False)
+            self.conexion.execute("PRAGMA journal_mode=WAL")
+            self.conexion.execute("PRAGMA synchronous=NORMAL")
+            self.pid = os.getpid()
+        return self.conexion
+
+    def reservar(self, clave, id_administrador, ttl, crear=True):
+        # Devuelve (id, nuevo); un envío idéntico a un trabajo vigente y no fallido recibe el id existente
+        ahora = time.time()
+        with self.candado:
+            conexion = self.conectar()
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                conexion.execute("DELETE FROM trabajo WHERE expira < ?", (ahora,))
+                fila = conexion.execute("SELECT id, estado, pid FROM trabajo WHERE clave = ? AND estado != ?", (clave, FALLIDO)).fetchone()
+                if fila is not None and self.abandonado(fila[1], fila[2]):
+                    # El worker dueño murió: el trabajo queda fallido y el envío empieza uno nuevo
+                    conexion.execute("UPDATE trabajo SET estado = ?, mensaje = ?, terminado = ?, expira = ? WHERE id = ?", \
+                        (FALLIDO, WORKER_TERMINADO, ahora, ahora + ttl, fila[0]))
+                    fila = None
+                if fila is not None:
+                    id_trabajo, nuevo = fila[0], False
+                elif crear:
+                    id_trabajo, nuevo = uuid.uuid4().hex, True
+                    conexion.execute("INSERT INTO trabajo (id, clave, administrador, estado, creado, expira, pid) " \
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", (id_trabajo, clave, id_administrador, PENDIENTE, ahora, ahora + ttl, os.getpid()))
+                else:
+                    id_trabajo, nuevo = None, False
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+        return id_trabajo, nuevo
+
+    def actualizar(self, id_trabajo, estado, ttl, resultado=None, mensaje=None):
+        # El TTL se cuenta de nuevo en cada cambio de estado: un resultado dura TTL segundos desde que termina
+        ahora = time.time()
+        terminado = ahora if estado in (TERMINADO, FALLIDO) else None
+        valor = a_json(resultado) if estado == TERMINADO else None
+        with self.candado:
+            self.conectar().execute("UPDATE trabajo SET estado = ?, resultado = ?, mensaje = ?, terminado = ?, expira = ? WHERE id = ?", \
+                (estado, valor, mensaje, terminado, ahora + ttl, id_trabajo))
+
+    def obtener(self, id_trabajo, con_resultado=False):
+        columnas = "id, administrador, estado, mensaje, creado, terminado, expira, pid" + (", resultado" if con_resultado else "")
+        with self.candado:
+            fila = self.conectar().execute("SELECT " + columnas + " FROM trabajo WHERE id = ? AND expira >= ?", \
+                (id_trabajo, time.time())).fetchone()
+        if fila is None:
+            return None
+        trabajo = dict(zip(('id', 'administrador', 'estado', 'mensaje', 'creado', 'terminado', 'expira'), fila))
+        if self.abandonado(trabajo['estado'], fila[7]):
+            trabajo.update({'estado': FALLIDO, 'mensaje': WORKER_TERMINADO})
+        if con_resultado:
+            trabajo['resultado'] = desde_json(fila[8]) if fila[8] is not None else None
+        return trabajo
+
+    def abandonado(self, estado, pid):
+        # Un trabajo sin terminar cuyo proceso dueño ya no existe nunca va a terminar. El archivo es local al host
+        return estado in (PENDIENTE, EJECUTANDO) and pid is not None and pid_terminado(pid)
+
+class ColaTrabajos():
+    # Trabajos largos en un pool de hilos acotado dentro de cada worker; sin broker externo
+
+    def __init__(self):
+        self.almacen = None
+        self.hilos = 2
+        self.limite = 16
+        self.ttl = 3600
+        self.ejecutor = None
+        self.pid = None
+        self.pendientes = 0
+        self.candado = threading.Lock()
+
+    def configurar(self, app):
+        self.almacen = AlmacenTrabajos(app.config['TRABAJOS_RUTA'], app.config['SQLITE_BUSY_TIMEOUT'] / 1000)
+        self.hilos = app.config['TRABAJOS_HILOS']
+        self.limite = app.config['TRABAJOS_COLA']
+        self.ttl = app.config['TRABAJOS_TTL']
+        self.ejecutor = None
+
+    def obtenerEjecutor(self):
+        # El pool no sobrevive a un fork: cada worker crea el suyo la primera vez que lo necesita
+        if self.ejecutor is None or self.pid != os.getpid():
+            self.ejecutor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='trabajo')
+            self.pid = os.getpid()
+            self.pendientes = 0
+        return self.ejecutor
+
+    def enviar(self, clave, id_administrador, funcion):
+        huella = hashlib.sha256(clave.encode('utf-8')).hexdigest()
+        if self.hilos == 0:
+            # Sin hilos el trabajo corre dentro de la solicitud; útil en pruebas y para depurar
+            id_trabajo, nuevo = self.almacen.reservar(huella, id_administrador, self.ttl)
+            if nuevo:
+                self.ejecutar(id_trabajo, funcion)
+            return id_trabajo
+
+        with self.candado:
+            ejecutor = self.obtenerEjecutor()
+            disponible = self.pendientes < self.limite
+            if disponible:
+                self.pendientes += 1
+        # Con la cola llena solo se aceptan envíos que coinciden con un trabajo existente
+        id_trabajo, nuevo = self.almacen.reservar(huella, id_administrador, self.ttl, crear=disponible)
+        if nuevo:
+            ejecutor.submit(self.ejecutarEnSegundoPlano, current_app._get_current_object(), id_trabajo, funcion)
+            return id_trabajo
+        if disponible:
+            with self.candado:
+                self.pendientes -= 1
+        if id_trabajo is None:
+            raise ColaLlena()
+        return id_trabajo
+
+    def ejecutarEnSegundoPlano(self, app, id_trabajo, funcion):
+        try:
+            with app.app_context():
+                try:
+                    self.ejecutar(id_trabajo, funcion)
+                finally:
+                    db.session.remove()
+        finally:
+            with self.candado:
+                self.pendientes -= 1
+
+    def ejecutar(self, id_trabajo, funcion):
+        self.almacen.actualizar(id_trabajo, EJECUTANDO, self.ttl)
+        try:
+            resultado = funcion()
+        except ErrorTrabajo as error:
+            self.almacen.actualizar(id_trabajo, FALLIDO, self.ttl, mensaje=str(error))
+            return
+        except Exception:
+            logger.exception('Falló el trabajo %s', id_trabajo)
+            self.almacen.actualizar(id_trabajo, FALLIDO, self.ttl, mensaje='Error interno al ejecutar el trabajo')
+            return
+        self.almacen.actualizar(id_trabajo, TERMINADO, self.ttl, resultado=resultado)
+
+    def obtener(self, id_trabajo, con_resultado=False):
+        return self.almacen.obtener(id_trabajo, con_resultado)
+
+# Cada aplicación guarda su cola en app.extensions; este proxy resuelve la de la aplicación activa
+cola_trabajos = LocalProxy(lambda: current_app.extensions['cola_trabajos'])
+
+def configurar_trabajos(app):
+    # Los resultados viven junto a la caché, en un archivo SQLite privado que comparten los workers del host
+    app.config.setdefault('TRABAJOS_HILOS', leer_entero('TRABAJOS_HILOS', 2))
+    app.config.setdefault('TRABAJOS_COLA', leer_entero('TRABAJOS_COLA', 16))
+    app.config.setdefault('TRABAJOS_TTL', leer_entero('TRABAJOS_TTL', 3600))
+    if 'TRABAJOS_RUTA' not in app.config:
+        base_de_datos = hashlib.md5(app.config['SQLALCHEMY_DATABASE_URI'].encode('utf-8')).hexdigest()[:12]
+        app.config['TRABAJOS_RUTA'] = os.environ.get('TRABAJOS_RUTA') or \
+            os.path.join(directorio_privado(app), 'recetario-trabajos-{}.sqlite'.format(base_de_datos))
+    cola = ColaTrabajos()
+    cola.configurar(app)
+    app.extensions['cola_trabajos'] = cola
@@ -1,9 +1,21 @@
-from flask import request
-from flask_jwt_extended import jwt_required, create_access_token
+import csv
+import json
+import math
+import time
+
+from flask import Response, current_app, request, stream_with_context
+from flask_jwt_extended import jwt_required, create_access_token, get_jwt, get_jwt_identity
 from flask_restful import Resource
-from datetime import datetime
+from flask_restful.representations.json import output_json
+from werkzeug.http import http_date, parse_date, quote_etag, unquote_etag
+from datetime import datetime, timezone
+from decimal import Decimal
+from fractions import Fraction
+from functools import wraps
 import hashlib
 from marshmallow import Schema, fields
+from sqlalchemy import bindparam, event, func, select
+from sqlalchemy.orm import selectinload
 
 
 from modelos import \
@@ -13,7 +25,12 @@ from modelos import \
     Receta, RecetaSchema, \
     Administrador, AdministradorSchema, \
     Restaurante, RestauranteSchema, \
-    Chef, ChefSchema, Menu, MenuSchema, MenuReceta, MenuRecetaSchema, Usuario, UsuarioSchema
+    Chef, ChefSchema, Menu, MenuSchema, MenuReceta, MenuRecetaSchema, Usuario, UsuarioSchema, \
+    SerializadorCompilado, siguiente_version, buscar, crudo, valores_totales, valores_porciones, \
+    TotalesFueraDeRango, totales_admitidos
+
+from .cache import cache_respuestas
+from .trabajos import ColaLlena, ErrorTrabajo, TERMINADO, FALLIDO, cola_trabajos
 
 
 ingrediente_schema = IngredienteSchema()
@@ -25,16 +42,428 @@ chef_schema = ChefSchema()
 menu_schema = MenuSchema()
 usuario_schema = UsuarioSchema()
 
+# Serializadores precompilados de los esquemas que se usan en los listados
+ingrediente_serializador = SerializadorCompilado(ingrediente_schema)
+receta_serializador = SerializadorCompilado(receta_schema)
+restaurante_serializador = SerializadorCompilado(restaurante_schema)
+menu_serializador = SerializadorCompilado(menu_schema)
+
 class UsuarioUtil():
 
     @staticmethod
     def obtenerIdAdministrador(id_usuario):
+        datos = UsuarioUtil.obtenerDatosUsuario(id_usuario)
+        if datos is None:
+            return id_usuario
+        return datos['administrador']
+
+    @staticmethod
+    def obtenerDatosUsuario(id_usuario):
+        # Se usan los claims del token cuando pertenecen al usuario consultado y siguen vigentes
+        claims = get_jwt()
+        generacion = cache_respuestas.generacionUsuario(id_usuario)
+        if get_jwt_identity() == id_usuario and 'tipo' in claims and claims.get('generacion') == generacion:
+            return {'id': id_usuario, 'usuario': claims['usuario'], 'tipo': claims['tipo'], \
+                'administrador': claims['administrador'], 'restaurante': claims['restaurante']}
+        # Si no, se resuelve en la base y se comparte el resultado con los demás workers
+        clave = json.dumps(['usuario', id_usuario, generacion])
+        datos = cache_respuestas.obtener(clave)
+        if datos is None:
+            datos = UsuarioUtil.consultarDatosUsuario(id_usuario)
+            if datos is not None:
+                cache_respuestas.guardar(clave, datos, current_app.config.get('CACHE_RESPUESTAS_TTL', 60))
+        return datos
+
+    @staticmethod
+    def consultarDatosUsuario(id_usuario):
         usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        if usuario is None:
+            return None
+        datos = {'id': usuario.id, 'usuario': usuario.usuario, 'tipo': usuario.tipo, 'administrador': usuario.id, 'restaurante': None}
         if (usuario.tipo == 'Chef'):
             chef = Chef.query.filter(Chef.id == id_usuario).first()
             restaurante = Restaurante.query.filter(Restaurante.id == chef.restaurante).first()
-            return restaurante.administrador
-        return id_usuario
+            datos['restaurante'] = chef.restaurante
+            datos['administrador'] = restaurante.administrador if restaurante is not None else None
+        return datos
+
+    @staticmethod
+    def generarClaims(usuario):
+        datos = UsuarioUtil.consultarDatosUsuario(usuario.id)
+        # La generación del usuario al emitir el token permite detectar invalidaciones posteriores en cualquier worker
+        return {'usuario': datos['usuario'], 'tipo': datos['tipo'], 'administrador': datos['administrador'], 'restaurante': datos['restaurante'], \
+            'generacion': cache_respuestas.generacionUsuario(usuario.id)}
+
+    @staticmethod
+    def invalidarClaims(id_usuario):
+        # La invalidación queda en la caché compartida para que la vean todos los workers
+        cache_respuestas.invalidarUsuario(id_usuario)
+
+@event.listens_for(Chef.restaurante, 'set')
+def invalidar_claims_chef(chef, valor, valor_anterior, iniciador):
+    # Al reasignar un chef de restaurante sus tokens vigentes dejan de usarse como fuente de verdad
+    if chef.id is not None and valor != valor_anterior:
+        UsuarioUtil.invalidarClaims(chef.id)
+
+class ConsultaUtil():
+
+    # Relaciones que serializan los esquemas anidados y que se cargan por adelantado en un solo SELECT ... IN
+    RELACIONES = {
+        Receta: [Receta.ingredientes],
+        Menu: [Menu.recetas],
+        Restaurante: [Restaurante.chefs]
+    }
+
+    @staticmethod
+    def conRelaciones(modelo):
+        return modelo.query.options(*[selectinload(relacion) for relacion in ConsultaUtil.RELACIONES.get(modelo, [])])
+
+class RecetaUtil():
+
+    TOTALES = ['costo_total', 'calorias_total', 'costo_porcion', 'calorias_porcion']
+
+    @staticmethod
+    def enriquecerIngredientes(resultados):
+        # Solo se consultan los ingredientes referenciados por las recetas y cada uno se serializa una vez
+        ids_recetas = [int(receta['id']) for receta in resultados]
+        if not ids_recetas:
+            return resultados
+        ingredientes = Ingrediente.query \
+            .join(RecetaIngrediente, RecetaIngrediente.ingrediente == Ingrediente.id) \
+            .filter(RecetaIngrediente.receta.in_(ids_recetas)) \
+            .distinct().all()
+        ingredientes_por_id = {}
+        for ingrediente_dump in ingrediente_serializador.dumpMany(ingredientes):
+            ingrediente_dump['costo'] = float(ingrediente_dump['costo'])
+            ingredientes_por_id[ingrediente_dump['id']] = ingrediente_dump
+        for receta in resultados:
+            for receta_ingrediente in receta['ingredientes']:
+                receta_ingrediente['ingrediente'] = ingredientes_por_id.get(receta_ingrediente['ingrediente'], receta_ingrediente['ingrediente'])
+        return resultados
+
+    @staticmethod
+    def valoresAdmitidos(datos):
+        # La porción y las cantidades deben caber en sus enteros escalados antes de escribir la receta
+        return Receta.porcion.type.admite(datos["porcion"]) and \
+            all(RecetaIngrediente.cantidad.type.admite(linea["cantidad"]) for linea in datos["ingredientes"])
+
+    @staticmethod
+    def actualizarTotales(receta):
+        # Los totales de la receta se calculan en SQL a partir de las líneas ya escritas
+        db.session.flush()
+        if not totales_admitidos(db.session, Receta.id == receta.id):
+            raise TotalesFueraDeRango()
+        for valores in (valores_totales(), valores_porciones()):
+            Receta.query.filter(Receta.id == receta.id).update(valores, synchronize_session=False)
+        db.session.expire(receta, RecetaUtil.TOTALES)
+
+    @staticmethod
+    def actualizarTotalesIngrediente(id_ingrediente):
+        # Solo se recalculan, en una sentencia, las recetas que usan el ingrediente
+        db.session.flush()
+        usan_ingrediente = Receta.id.in_(select(RecetaIngrediente.receta).where(RecetaIngrediente.ingrediente == id_ingrediente))
+        if not totales_admitidos(db.session, usan_ingrediente):
+            raise TotalesFueraDeRango()
+        recetas = Receta.query.filter(usan_ingrediente)
+        valores = valores_totales()
+        valores[Receta.version] = siguiente_version()
+        recetas.update(valores, synchronize_session=False)
+        recetas.update(valores_porciones(), synchronize_session=False)
+
+    @staticmethod
+    def recalcularTotales():
+        # Reconstruye los totales de todas las recetas con dos sentencias UPDATE
+        valores = valores_totales()
+        valores[Receta.version] = siguiente_version()
+        actualizadas = Receta.query.update(valores, synchronize_session=False)
+        Receta.query.update(valores_porciones(), synchronize_session=False)
+        db.session.commit()
+        cache_respuestas.limpiar()
+        return actualizadas
+
+class ReporteUtil():
+
+    @staticmethod
+    def generarListaCompras(recetas_solicitadas):
+        # Se resuelven todas las recetas, sus líneas y sus ingredientes en dos consultas
+        ids_recetas = {int(receta['receta']) for receta in recetas_solicitadas}
+        porciones = dict(db.session.query(Receta.id, Receta.porcion).filter(Receta.id.in_(ids_recetas)).all())
+        if len(porciones) != len(ids_recetas):
+            return None
+        lineas_por_receta = {}
+        filas = db.session.query(RecetaIngrediente.receta, RecetaIngrediente.cantidad, \
+                Ingrediente.id, Ingrediente.nombre, Ingrediente.unidad, Ingrediente.sitio) \
+            .join(Ingrediente, Ingrediente.id == RecetaIngrediente.ingrediente) \
+            .filter(RecetaIngrediente.receta.in_(ids_recetas)) \
+            .order_by(RecetaIngrediente.id).all()
+        for fila in filas:
+            lineas_por_receta.setdefault(fila.receta, []).append(fila)
+
+        # Se aplanan las líneas en vectores y se escalan por personas / porcion en un solo paso
+        lineas = []
+        escalas = []
+        for receta in recetas_solicitadas:
+            id_receta = int(receta['receta'])
+            personas = Decimal(str(receta['personas']))
+            for linea in lineas_por_receta.get(id_receta, []):
+                lineas.append(linea)
+                escalas.append((personas, porciones[id_receta]))
+        cantidades = [personas * linea.cantidad / porcion for linea, (personas, porcion) in zip(lineas, escalas)]
+
+        # Se redondea en cada paso, como siempre lo hizo el reporte: 0.4 + 0.4 da "0" y no "1"
+        reporte = {}
+        for linea, cantidad in zip(lineas, cantidades):
+            if linea.id in reporte:
+                reporte[linea.id]['cantidad'] = str(round(float(reporte[linea.id]['cantidad']) + float(cantidad)))
+            else:
+                reporte[linea.id] = {'nombre': linea.nombre, 'cantidad': str(round(cantidad)), 'unidad': linea.unidad, 'sitio': linea.sitio}
+        return list(reporte.values())
+
+    @staticmethod
+    def generarDemanda(id_administrador, desde, hasta, id_restaurante=None):
+        # Una sola consulta agregada: SQL suma enteros exactos por ingrediente y tamaño de porción, y en Python solo se
+        # dividen esas sumas con fracciones; el trabajo depende de los ingredientes distintos, no de los menús
+        consulta = db.session.query(Ingrediente.sitio, Ingrediente.unidad, Ingrediente.id, Ingrediente.nombre, \
+                crudo(Ingrediente.costo).label('costo'), crudo(Receta.porcion).label('porcion'), \
+                func.sum(crudo(RecetaIngrediente.cantidad) * MenuReceta.personas).label('cantidad')) \
+            .select_from(Menu) \
+            .join(Restaurante, Restaurante.id == Menu.restaurante) \
+            .join(MenuReceta, MenuReceta.menu == Menu.id) \
+            .join(Receta, Receta.id == MenuReceta.receta) \
+            .join(RecetaIngrediente, RecetaIngrediente.receta == Receta.id) \
+            .join(Ingrediente, Ingrediente.id == RecetaIngrediente.ingrediente) \
+            .filter(Restaurante.administrador == id_administrador) \
+            .filter(Menu.fechaInicio <= hasta, Menu.fechaFin >= desde)
+        if id_restaurante is not None:
+            consulta = consulta.filter(Menu.restaurante == id_restaurante)
+        filas = consulta.group_by(Ingrediente.sitio, Ingrediente.unidad, Ingrediente.id, Ingrediente.nombre, \
+                Ingrediente.costo, Receta.porcion) \
+            .order_by(Ingrediente.sitio, Ingrediente.unidad, Ingrediente.nombre, Ingrediente.id).all()
+        demanda = {}
+        for fila in filas:
+            elemento = demanda.setdefault(fila.id, {'sitio': fila.sitio, 'unidad': fila.unidad, 'ingrediente': str(fila.id), \
+                'nombre': fila.nombre, 'cantidad': Fraction(0), 'costo': Fraction(fila.costo or 0, 10 ** Ingrediente.costo.type.decimales)})
+            # Cantidad y porción tienen la misma escala, así que su cociente ya está en unidades; sin porción no se aporta nada
+            if fila.porcion:
+                elemento['cantidad'] += Fraction(fila.cantidad or 0, fila.porcion)
+        for elemento in demanda.values():
+            elemento['costo'] = ReporteUtil.redondear(elemento['cantidad'] * elemento['costo'])
+            elemento['cantidad'] = ReporteUtil.redondear(elemento['cantidad'])
+        return list(demanda.values())
+
+    @staticmethod
+    def redondear(valor):
+        # Dos decimales, al par más cercano como round sobre Decimal
+        redondeado = round(valor, 2)
+        return str((Decimal(redondeado.numerator) / redondeado.denominator).quantize(Decimal('0.01')))
+
+class TrabajoUtil():
+
+    @staticmethod
+    def obtenerTrabajo(id_trabajo, con_resultado=False):
+        # Un trabajo de otro tenant se trata igual que uno inexistente
+        trabajo = cola_trabajos.obtener(id_trabajo, con_resultado)
+        if trabajo is None or trabajo['administrador'] != UsuarioUtil.obtenerIdAdministrador(get_jwt_identity()):
+            return None
+        return trabajo
+
+    @staticmethod
+    def describir(trabajo):
+        formatear = lambda marca: datetime.fromtimestamp(marca, timezone.utc).isoformat() if marca is not None else None
+        descripcion = {'id': trabajo['id'], 'estado': trabajo['estado'], 'creado': formatear(trabajo['creado']), \
+            'terminado': formatear(trabajo['terminado']), 'expira': formatear(trabajo['expira'])}
+        if trabajo['estado'] == TERMINADO:
+            descripcion['resultado'] = '/trabajos/{}/resultado'.format(trabajo['id'])
+        if trabajo['estado'] == FALLIDO:
+            descripcion['mensaje'] = trabajo['mensaje']
+        return descripcion
+
+class BusquedaUtil():
+
+    LIMITE_POR_DEFECTO = 10
+    LIMITE_MAXIMO = 50
+    # Mejores filas de todo el índice que se conservan antes de filtrar por tenant. bm25 puntúa igual todas las coincidencias
+    CANDIDATOS = 1000
+
+    # Columnas de cada resultado: lo justo para autocompletar, sin las líneas de las recetas
+    COLUMNAS = {
+        Ingrediente: (Ingrediente.id, Ingrediente.nombre, Ingrediente.unidad, Ingrediente.sitio),
+        Receta: (Receta.id, Receta.nombre, Receta.duracion, Receta.porcion),
+    }
+
+    @staticmethod
+    def buscar(modelo, id_administrador, texto, limite):
+        ids = buscar(db.session, modelo, id_administrador, texto, limite, BusquedaUtil.CANDIDATOS)
+        if not ids:
+            return []
+        columnas = BusquedaUtil.COLUMNAS[modelo]
+        filas = {fila.id: fila for fila in db.session.query(*columnas).filter(modelo.id.in_(ids))}
+        # Se respeta el orden por relevancia del índice
+        return [{columna.key: BusquedaUtil.texto(getattr(filas[id_fila], columna.key)) for columna in columnas} \
+            for id_fila in ids if id_fila in filas]
+
+    @staticmethod
+    def texto(valor):
+        return str(valor) if valor is not None else None
+
+class PaginacionUtil():
+
+    LIMITE_POR_DEFECTO = 100
+    LIMITE_MAXIMO = 1000
+
+    @staticmethod
+    def solicitada():
+        return 'limit' in request.args or 'after' in request.args
+
+    @staticmethod
+    def paginar(consulta, columna_id):
+        # Paginación por llave (keyset) sobre el id: cada página es una consulta de rango sobre el índice
+        if not PaginacionUtil.solicitada():
+            return consulta.all(), None
+        limite = request.args.get('limit', PaginacionUtil.LIMITE_POR_DEFECTO, type=int)
+        limite = min(max(limite, 1), PaginacionUtil.LIMITE_MAXIMO)
+        despues = request.args.get('after', type=int)
+        if despues is not None:
+            consulta = consulta.filter(columna_id > despues)
+        elementos = consulta.order_by(columna_id).limit(limite + 1).all()
+        siguiente = None
+        if len(elementos) > limite:
+            elementos = elementos[:limite]
+            siguiente = str(elementos[-1].id)
+        return elementos, siguiente
+
+    @staticmethod
+    def respuesta(resultados, siguiente):
+        if not PaginacionUtil.solicitada():
+            return resultados
+        return {'resultados': resultados, 'next': siguiente}
+
+class StreamingUtil():
+
+    TAMANO_LOTE = 500
+    TIPOS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+    @staticmethod
+    def formatoSolicitado():
+        formato = request.args.get('stream')
+        if formato in StreamingUtil.TIPOS:
+            return formato
+        if request.accept_mimetypes.best == StreamingUtil.TIPOS['ndjson']:
+            return 'ndjson'
+        return None
+
+    @staticmethod
+    def responder(consulta, columna_id, serializar_lote):
+        # Se recorre un cursor del servidor por lotes y se emite fila por fila, sin armar la lista completa
+        formato = StreamingUtil.formatoSolicitado()
+
+        def generar():
+            primero = True
+            if formato == 'json':
+                yield '['
+            lote = []
+            for elemento in consulta.order_by(columna_id).yield_per(StreamingUtil.TAMANO_LOTE):
+                lote.append(elemento)
+                if len(lote) == StreamingUtil.TAMANO_LOTE:
+                    for fila in StreamingUtil.emitir(serializar_lote(lote), formato, primero):
+                        primero = False
+                        yield fila
+                    lote = []
+            for fila in StreamingUtil.emitir(serializar_lote(lote), formato, primero):
+                primero = False
+                yield fila
+            if formato == 'json':
+                yield ']'
+
+        return Response(stream_with_context(generar()), mimetype=StreamingUtil.TIPOS[formato])
+
+    @staticmethod
+    def emitir(resultados, formato, primero):
+        for resultado in resultados:
+            if formato == 'ndjson':
+                yield json.dumps(resultado) + '\n'
+            else:
+                yield ('' if primero else ',') + json.dumps(resultado)
+            primero = False
+
+class EtagUtil():
+
+    @staticmethod
+    def versionColeccion(modelo, *criterios):
+        # Validador barato de una colección: cantidad de filas y versión máxima
+        cantidad, version = db.session.query(func.count(modelo.id), func.max(modelo.version)) \
+            .select_from(modelo).filter(*criterios).one()
+        return [cantidad, version]
+
+    @staticmethod
+    def validar(*versiones):
+        # Se responde 304 sin serializar cuando el cliente ya tiene la representación vigente
+        versiones = [version or 0 for version in versiones]
+        etag = hashlib.md5(json.dumps([request.full_path] + versiones).encode('utf-8')).hexdigest()
+        ultima_version = max(versiones + [0])
+        encabezados = {'ETag': quote_etag(etag)}
+        # Last-Modified tiene resolución de segundos: solo se envía cuando el segundo de la versión ya terminó,
+        # así una escritura posterior nunca cae en el mismo segundo que la fecha que tiene el cliente
+        segundo = ultima_version // 1000000
+        con_fecha = 0 < segundo < int(time.time())
+        if con_fecha:
+            encabezados['Last-Modified'] = http_date(segundo)
+        if request.if_none_match:
+            no_modificado = request.if_none_match.contains(etag)
+        elif request.if_modified_since and con_fecha:
+            no_modificado = segundo <= int(request.if_modified_since.timestamp())
+        else:
+            no_modificado = False
+        return no_modificado, encabezados
+
+    @staticmethod
+    def validarColeccion(*versiones):
+        # En una colección la versión máxima no cambia al borrar una fila que no es la más reciente: sin Last-Modified
+        # ni If-Modified-Since, solo el ETag (cantidad de filas y versión máxima) valida la representación
+        etag = hashlib.md5(json.dumps([request.full_path] + [version or 0 for version in versiones]).encode('utf-8')).hexdigest()
+        encabezados = {'ETag': quote_etag(etag)}
+        no_modificado = bool(request.if_none_match) and request.if_none_match.contains(etag)
+        return no_modificado, encabezados
+
+    @staticmethod
+    def noModificado(encabezados):
+        return Response(status=304, headers=encabezados)
+
+class CacheUtil():
+
+    @staticmethod
+    def cachear(vista):
+        # Se aplica debajo de jwt_required: el tenant sale de los claims del token
+        @wraps(vista)
+        def envoltura(self, id_usuario, *args, **kwargs):
+            if not current_app.config.get('CACHE_RESPUESTAS', True) or StreamingUtil.formatoSolicitado():
+                return vista(self, id_usuario, *args, **kwargs)
+            clave = cache_respuestas.claveSolicitud(type(self).__name__, UsuarioUtil.obtenerIdAdministrador(id_usuario), id_usuario)
+            guardada = cache_respuestas.obtener(clave)
+            if guardada is not None:
+                cuerpo, encabezados = guardada
+                if CacheUtil.noModificado(encabezados):
+                    return EtagUtil.noModificado(encabezados)
+                return Response(cuerpo, status=200, headers=encabezados, mimetype='application/json')
+            resultado = vista(self, id_usuario, *args, **kwargs)
+            if isinstance(resultado, Response):
+                return resultado
+            datos, codigo, encabezados = (resultado + ({},))[:3] if isinstance(resultado, tuple) else (resultado, 200, {})
+            # Se guarda el cuerpo ya serializado para no volver a consultar ni serializar en los aciertos
+            respuesta = output_json(datos, codigo, encabezados)
+            if codigo == 200:
+                cache_respuestas.guardar(clave, [respuesta.get_data(as_text=True), dict(encabezados)], current_app.config.get('CACHE_RESPUESTAS_TTL', 60))
+            return respuesta
+        return envoltura
+
+    @staticmethod
+    def noModificado(encabezados):
+        etag, _ = unquote_etag(encabezados.get('ETag'))
+        if request.if_none_match:
+            return etag is not None and request.if_none_match.contains(etag)
+        if request.if_modified_since and 'Last-Modified' in encabezados:
+            return parse_date(encabezados['Last-Modified']) <= request.if_modified_since
+        return False
 
 class ErrorSchema(Schema):
     message = fields.Str(required=True)
@@ -73,7 +502,7 @@ class VistaLogIn(Resource):
         if usuario is None:
             return { "mensaje": "Usuario o contraseña incorrectos"} , 404
         else:
-            token_de_acceso = create_access_token(identity=usuario.id)
+            token_de_acceso = create_access_token(identity=usuario.id, additional_claims=UsuarioUtil.generarClaims(usuario))
             return {"mensaje": "Inicio de sesión exitoso", "token": token_de_acceso, "id": usuario.id, "tipo": usuario.tipo, "nombre": usuario.nombre}
 
 
@@ -82,8 +511,11 @@ class VistaRestaurantes(Resource):
     @jwt_required()
     def get(self, id_usuario):
         id_administrador = UsuarioUtil.obtenerIdAdministrador(id_usuario)
-        restaurantes = Restaurante.query.filter(Restaurante.administrador == id_administrador).all()
-        return [restaurante_schema.dump(restaurante) for restaurante in restaurantes]
+        no_modificado, encabezados = EtagUtil.validarColeccion(id_administrador, *EtagUtil.versionColeccion(Restaurante, Restaurante.administrador == id_administrador))
+        if no_modificado:
+            return EtagUtil.noModificado(encabezados)
+        restaurantes, siguiente = PaginacionUtil.paginar(ConsultaUtil.conRelaciones(Restaurante).filter(Restaurante.administrador == id_administrador), Restaurante.id)
+        return PaginacionUtil.respuesta(restaurante_serializador.dumpMany(restaurantes), siguiente), 200, encabezados
     
     @jwt_required()
     def post(self, id_usuario):
@@ -132,52 +564,182 @@ class VistaRestaurantes(Resource):
 class VistaRestaurante(Resource):    
     @jwt_required()
     def get(self, id_usuario, id_restaurante):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
-        buscado_restaurante = Restaurante.query.filter(Restaurante.id == id_restaurante).first()
+        usuario = UsuarioUtil.obtenerDatosUsuario(id_usuario)
+        buscado_restaurante = ConsultaUtil.conRelaciones(Restaurante).filter(Restaurante.id == id_restaurante).first()
         if(usuario == None):
             return {'mensaje': "No existe un usuario con ese id"}, 422
         if(buscado_restaurante == None):
             return {'mensaje': "No existe un restaurante con ese id"}, 422
         else:
-            return restaurante_schema.dump(buscado_restaurante)
+            no_modificado, encabezados = EtagUtil.validar(buscado_restaurante.version)
+            if no_modificado:
+                return EtagUtil.noModificado(encabezados)
+            return restaurante_serializador.dump(buscado_restaurante), 200, encabezados
         
 
 class VistaIngredientes(Resource):
 
     @jwt_required()
+    @CacheUtil.cachear
     def get(self, id_usuario):
         id_administrador = UsuarioUtil.obtenerIdAdministrador(id_usuario)
-        ingredientes = Ingrediente.query.filter(Ingrediente.administrador == id_administrador).all()
-        return [ingrediente_schema.dump(ingrediente) for ingrediente in ingredientes]
+        consulta = Ingrediente.query.filter(Ingrediente.administrador == id_administrador)
+        if StreamingUtil.formatoSolicitado():
+            return StreamingUtil.responder(consulta, Ingrediente.id, \
+                ingrediente_serializador.dumpMany)
+        no_modificado, encabezados = EtagUtil.validarColeccion(id_administrador, *EtagUtil.versionColeccion(Ingrediente, Ingrediente.administrador == id_administrador))
+        if no_modificado:
+            return EtagUtil.noModificado(encabezados)
+        ingredientes, siguiente = PaginacionUtil.paginar(consulta, Ingrediente.id)
+        return PaginacionUtil.respuesta(ingrediente_serializador.dumpMany(ingredientes), siguiente), 200, encabezados
 
     @jwt_required()
     def post(self, id_usuario):
         id_administrador = UsuarioUtil.obtenerIdAdministrador(id_usuario)
+        costo = float(request.json["costo"])
+        calorias = float(request.json["calorias"])
+        if not (math.isfinite(costo) and math.isfinite(calorias)):
+            return {'mensaje': "El costo y las calorías deben ser números finitos"}, 422
+        if not (Ingrediente.costo.type.admite(costo) and Ingrediente.calorias.type.admite(calorias)):
+            return {'mensaje': "El costo o las calorías están fuera del rango permitido"}, 422
         nuevo_ingrediente = Ingrediente( \
             nombre = request.json["nombre"], \
             unidad = request.json["unidad"], \
-            costo = float(request.json["costo"]), \
-            calorias = float(request.json["calorias"]), \
+            costo = costo, \
+            calorias = calorias, \
             sitio = request.json["sitio"], \
             administrador = id_administrador)
         db.session.add(nuevo_ingrediente)
         db.session.commit()
         return ingrediente_schema.dump(nuevo_ingrediente)
     
+class VistaImportarIngredientes(Resource):
+
+    TAMANO_LOTE = 1000
+    TAMANO_BLOQUE = 64 * 1024
+    CAMPOS = ["nombre", "unidad", "costo", "calorias", "sitio"]
+
+    @jwt_required()
+    def post(self, id_usuario):
+        id_administrador = UsuarioUtil.obtenerIdAdministrador(id_usuario)
+        filas = self.leer_filas()
+        if filas is None:
+            return {'mensaje': "El contenido debe ser text/csv o application/x-ndjson"}, 415
+        creados = 0
+        errores = []
+        lote = []
+        # Todas las filas válidas se insertan por lotes (executemany) dentro de una sola transacción
+        for numero, fila in filas:
+            ingrediente, error = self.validar_fila(fila, id_administrador)
+            if error is not None:
+                errores.append({'fila': numero, 'mensaje': error})
+                continue
+            lote.append(ingrediente)
+            if len(lote) == self.TAMANO_LOTE:
+                db.session.execute(Ingrediente.__table__.insert(), lote)
+                creados += len(lote)
+                lote = []
+        if lote:
+            db.session.execute(Ingrediente.__table__.insert(), lote)
+            creados += len(lote)
+        db.session.commit()
+        # Las inserciones masivas no pasan por el flush del ORM
+        cache_respuestas.invalidar(id_administrador)
+        return {'creados': creados, 'errores': errores}
+
+    def leer_filas(self):
+        # El cuerpo se recorre como flujo, sin cargarlo completo en memoria
+        texto = self.leer_lineas(request.stream)
+        if request.mimetype == 'text/csv':
+            return enumerate(csv.DictReader(texto), start=1)
+        if request.mimetype == 'application/x-ndjson':
+            return self.leer_ndjson(texto)
+        return None
+
+    def leer_lineas(self, flujo):
+        # Se decodifica a mano: la entrada WSGI solo garantiza read(), no la interfaz de io (el Body de gunicorn no es IOBase).
+        # Los bytes que no son UTF-8 quedan como sustitutos y validar_fila rechaza solo la fila que los contiene
+        pendiente = b''
+        while True:
+            bloque = flujo.read(self.TAMANO_BLOQUE)
+            if not bloque:
+                break
+            lineas = (pendiente + bloque).split(b'\n')
+            pendiente = lineas.pop()
+            for linea in lineas:
+                yield (linea + b'\n').decode('utf-8', 'surrogateescape')
+        if pendiente:
+            yield pendiente.decode('utf-8', 'surrogateescape')
+
+    def leer_ndjson(self, texto):
+        for numero, linea in enumerate(texto, start=1):
+            if not linea.strip():
+                continue
+            try:
+                yield numero, json.loads(linea)
+            except ValueError:
+                yield numero, None
+
+    def validar_fila(self, fila, id_administrador):
+        if not isinstance(fila, dict):
+            return None, "La fila no es un objeto JSON válido"
+        faltantes = [campo for campo in self.CAMPOS if fila.get(campo) is None]
+        if faltantes:
+            return None, "Campos faltantes: {}".format(", ".join(faltantes))
+        try:
+            for campo in self.CAMPOS:
+                if isinstance(fila[campo], str):
+                    fila[campo].encode('utf-8')
+        except UnicodeEncodeError:
+            return None, "La fila no es texto UTF-8 válido"
+        # float acepta true y false de JSON como 1 y 0
+        if isinstance(fila["costo"], bool) or isinstance(fila["calorias"], bool):
+            return None, "El costo y las calorías deben ser numéricos"
+        try:
+            costo = float(fila["costo"])
+            calorias = float(fila["calorias"])
+        except (TypeError, ValueError):
+            return None, "El costo y las calorías deben ser numéricos"
+        # float acepta "nan" e "inf", que no se pueden guardar como enteros escalados
+        if not (math.isfinite(costo) and math.isfinite(calorias)):
+            return None, "El costo y las calorías deben ser números finitos"
+        # Se revisa antes del lote: un valor fuera de rango haría fallar todo el executemany
+        if not (Ingrediente.costo.type.admite(costo) and Ingrediente.calorias.type.admite(calorias)):
+            return None, "El costo o las calorías están fuera del rango permitido"
+        return {'nombre': fila["nombre"], 'unidad': fila["unidad"], 'costo': costo, 'calorias': calorias, \
+            'sitio': fila["sitio"], 'administrador': id_administrador}, None
+
 class VistaIngrediente(Resource):
 
     @jwt_required()
     def get(self, id_ingrediente):
-        return ingrediente_schema.dump(Ingrediente.query.get_or_404(id_ingrediente))
+        ingrediente = Ingrediente.query.get_or_404(id_ingrediente)
+        no_modificado, encabezados = EtagUtil.validar(ingrediente.version)
+        if no_modificado:
+            return EtagUtil.noModificado(encabezados)
+        return ingrediente_serializador.dump(ingrediente), 200, encabezados
         
     @jwt_required()
     def put(self, id_ingrediente):
         ingrediente = Ingrediente.query.get_or_404(id_ingrediente)
+        anteriores = (ingrediente.costo, ingrediente.calorias)
+        costo = float(request.json["costo"])
+        calorias = float(request.json["calorias"])
+        if not (math.isfinite(costo) and math.isfinite(calorias)):
+            return {'mensaje': "El costo y las calorías deben ser números finitos"}, 422
+        if not (Ingrediente.costo.type.admite(costo) and Ingrediente.calorias.type.admite(calorias)):
+            return {'mensaje': "El costo o las calorías están fuera del rango permitido"}, 422
         ingrediente.nombre = request.json["nombre"]
         ingrediente.unidad = request.json["unidad"]
-        ingrediente.costo = float(request.json["costo"])
-        ingrediente.calorias = float(request.json["calorias"])
+        ingrediente.costo = costo
+        ingrediente.calorias = calorias
         ingrediente.sitio = request.json["sitio"]
+        if anteriores != (Decimal(str(ingrediente.costo)), Decimal(str(ingrediente.calorias))):
+            try:
+                RecetaUtil.actualizarTotalesIngrediente(ingrediente.id)
+            except TotalesFueraDeRango:
+                db.session.rollback()
+                return {'mensaje': "Los totales de una receta con este ingrediente quedarían fuera del rango permitido"}, 422
         db.session.commit()
         return ingrediente_schema.dump(ingrediente)
 
@@ -195,19 +757,28 @@ class VistaIngrediente(Resource):
 class VistaRecetas(Resource):
 
     @jwt_required()
+    @CacheUtil.cachear
     def get(self, id_usuario):
         id_administrador = UsuarioUtil.obtenerIdAdministrador(id_usuario)
-        recetas = self.obtenerRecetas(id_administrador, id_usuario, request.args.get('todos'))
-        resultados = [receta_schema.dump(receta) for receta in recetas]
-        ingredientes = Ingrediente.query.all()
-        for receta in resultados:
-            for receta_ingrediente in receta['ingredientes']:
-                self.actualizar_ingredientes_util(receta_ingrediente, ingredientes)
-        return resultados
+        consulta = self.obtenerRecetas(id_administrador, id_usuario, request.args.get('todos'))
+        if StreamingUtil.formatoSolicitado():
+            return StreamingUtil.responder(consulta, Receta.id, \
+                lambda recetas: RecetaUtil.enriquecerIngredientes(receta_serializador.dumpMany(recetas)))
+        no_modificado, encabezados = EtagUtil.validarColeccion(id_administrador, \
+            *EtagUtil.versionColeccion(Receta, self.obtenerCriterio(id_administrador, id_usuario, request.args.get('todos'))), \
+            *EtagUtil.versionColeccion(Ingrediente, Ingrediente.administrador == id_administrador))
+        if no_modificado:
+            return EtagUtil.noModificado(encabezados)
+        recetas, siguiente = PaginacionUtil.paginar(consulta, Receta.id)
+        resultados = receta_serializador.dumpMany(recetas)
+        RecetaUtil.enriquecerIngredientes(resultados)
+        return PaginacionUtil.respuesta(resultados, siguiente), 200, encabezados
 
     @jwt_required()
     def post(self, id_usuario):
         id_administrador = UsuarioUtil.obtenerIdAdministrador(id_usuario)
+        if not RecetaUtil.valoresAdmitidos(request.json):
+            return {'mensaje': "La porción o las cantidades están fuera del rango permitido"}, 422
         nueva_receta = Receta( \
             nombre = request.json["nombre"], \
             preparacion = request.json["preparacion"], \
@@ -224,62 +795,77 @@ class VistaRecetas(Resource):
             nueva_receta.ingredientes.append(nueva_receta_ingrediente)
             
         db.session.add(nueva_receta)
+        try:
+            RecetaUtil.actualizarTotales(nueva_receta)
+        except TotalesFueraDeRango:
+            db.session.rollback()
+            return {'mensaje': "Los totales de la receta quedarían fuera del rango permitido"}, 422
         db.session.commit()
         return ingrediente_schema.dump(nueva_receta)
         
-    def actualizar_ingredientes_util(self, receta_ingrediente, ingredientes):
-        for ingrediente in ingredientes: 
-            if str(ingrediente.id)==receta_ingrediente['ingrediente']:
-                receta_ingrediente['ingrediente'] = ingrediente_schema.dump(ingrediente)
-                receta_ingrediente['ingrediente']['costo'] = float(receta_ingrediente['ingrediente']['costo'])
-
     def obtenerRecetas(self, id_administrador, id_usuario, todos):
+        return ConsultaUtil.conRelaciones(Receta).filter(self.obtenerCriterio(id_administrador, id_usuario, todos))
+
+    def obtenerCriterio(self, id_administrador, id_usuario, todos):
         if (id_administrador == id_usuario or todos == 'true'):
-            return Receta.query.filter(Receta.administrador == id_administrador).all()
+            return Receta.administrador == id_administrador
         else:
-            return Receta.query.filter(Receta.usuario == id_usuario).all()
+            return Receta.usuario == id_usuario
 
 class VistaReceta(Resource):
 
     @jwt_required()
     def get(self, id_receta):
-        receta = Receta.query.get_or_404(id_receta)
-        ingredientes = Ingrediente.query.all()
-        resultados = receta_schema.dump(receta)
-        recetaIngredientes = resultados['ingredientes']
-        for recetaIngrediente in recetaIngredientes:
-            for ingrediente in ingredientes: 
-                if str(ingrediente.id)==recetaIngrediente['ingrediente']:
-                    recetaIngrediente['ingrediente'] = ingrediente_schema.dump(ingrediente)
-                    recetaIngrediente['ingrediente']['costo'] = float(recetaIngrediente['ingrediente']['costo'])
-        return resultados
+        receta = ConsultaUtil.conRelaciones(Receta).get_or_404(id_receta)
+        version_ingredientes = db.session.query(func.max(Ingrediente.version)) \
+            .join(RecetaIngrediente, RecetaIngrediente.ingrediente == Ingrediente.id) \
+            .filter(RecetaIngrediente.receta == receta.id).scalar()
+        no_modificado, encabezados = EtagUtil.validar(receta.version, version_ingredientes)
+        if no_modificado:
+            return EtagUtil.noModificado(encabezados)
+        resultados = receta_serializador.dump(receta)
+        RecetaUtil.enriquecerIngredientes([resultados])
+        return resultados, 200, encabezados
 
     @jwt_required()
     def put(self, id_receta):
-        receta = Receta.query.get_or_404(id_receta)
+        receta = ConsultaUtil.conRelaciones(Receta).get_or_404(id_receta)
+        if not RecetaUtil.valoresAdmitidos(request.json):
+            return {'mensaje': "La porción o las cantidades están fuera del rango permitido"}, 422
         receta.nombre = request.json["nombre"]
         receta.preparacion = request.json["preparacion"]
         receta.duracion = float(request.json["duracion"])
         receta.porcion = float(request.json["porcion"])
-        #Verificar los ingredientes que se borraron
-        for receta_ingrediente in receta.ingredientes:
-            borrar = self.borrar_ingrediente_util(request.json["ingredientes"], receta_ingrediente)
-            if borrar==True:
-                db.session.delete(receta_ingrediente)
-        db.session.commit()
+        #Se comparan las líneas existentes con las recibidas usando mapas por id
+        existentes = {linea.id: linea for linea in receta.ingredientes}
+        recibidas = {}
+        nuevas = []
         for receta_ingrediente_editar in request.json["ingredientes"]:
             if receta_ingrediente_editar['id']=='':
                 #Es un nuevo ingrediente de la receta porque no tiene código
-                nueva_receta_ingrediente = RecetaIngrediente( \
-                    cantidad = receta_ingrediente_editar["cantidad"], \
-                    ingrediente = int(receta_ingrediente_editar["idIngrediente"])
-                )
-                receta.ingredientes.append(nueva_receta_ingrediente)
-            else:
-                #Se actualiza el ingrediente de la receta
-                receta_ingrediente = self.actualizar_ingrediente_util(receta.ingredientes, receta_ingrediente_editar)
-                db.session.add(receta_ingrediente)
-        db.session.add(receta)
+                nuevas.append({'receta': receta.id, \
+                    'cantidad': Decimal(str(receta_ingrediente_editar["cantidad"])), \
+                    'ingrediente': int(receta_ingrediente_editar["idIngrediente"])})
+            elif int(receta_ingrediente_editar['id']) in existentes:
+                recibidas[int(receta_ingrediente_editar['id'])] = receta_ingrediente_editar
+        borradas = [id_linea for id_linea in existentes if id_linea not in recibidas]
+        actualizadas = []
+        for id_linea, receta_ingrediente_editar in recibidas.items():
+            cantidad = Decimal(str(receta_ingrediente_editar['cantidad']))
+            id_ingrediente = int(receta_ingrediente_editar['idIngrediente'])
+            linea = existentes[id_linea]
+            #Solo se actualizan las líneas que cambiaron
+            if linea.ingrediente != id_ingrediente or linea.cantidad != cantidad:
+                actualizadas.append({'b_id': id_linea, 'b_cantidad': cantidad, 'b_ingrediente': id_ingrediente})
+        self.aplicar_cambios_lineas(borradas, actualizadas, nuevas)
+        if borradas or actualizadas or nuevas:
+            receta.version = siguiente_version()
+        db.session.expire(receta, ['ingredientes'])
+        try:
+            RecetaUtil.actualizarTotales(receta)
+        except TotalesFueraDeRango:
+            db.session.rollback()
+            return {'mensaje': "Los totales de la receta quedarían fuera del rango permitido"}, 422
         db.session.commit()
         return ingrediente_schema.dump(receta)
 
@@ -290,32 +876,28 @@ class VistaReceta(Resource):
         db.session.commit()
         return '', 204
         
-    def borrar_ingrediente_util(self, receta_ingredientes, receta_ingrediente):
-        borrar = True
-        for receta_ingrediente_editar in receta_ingredientes:
-            if receta_ingrediente_editar['id']!='':
-                if int(receta_ingrediente_editar['id']) == receta_ingrediente.id:
-                    borrar = False
-        return(borrar)
-
-    def actualizar_ingrediente_util(self, receta_ingredientes, receta_ingrediente_editar):
-        receta_ingrediente_retornar = None
-        for receta_ingrediente in receta_ingredientes:
-            if int(receta_ingrediente_editar['id']) == receta_ingrediente.id:
-                receta_ingrediente.cantidad = receta_ingrediente_editar['cantidad']
-                receta_ingrediente.ingrediente = receta_ingrediente_editar['idIngrediente']
-                receta_ingrediente_retornar = receta_ingrediente
-        return receta_ingrediente_retornar
+    def aplicar_cambios_lineas(self, borradas, actualizadas, nuevas):
+        tabla = RecetaIngrediente.__table__
+        if borradas:
+            db.session.execute(tabla.delete().where(tabla.c.id.in_(borradas)))
+        if actualizadas:
+            db.session.execute(tabla.update().where(tabla.c.id == bindparam('b_id')) \
+                .values(cantidad=bindparam('b_cantidad'), ingrediente=bindparam('b_ingrediente'), version=siguiente_version()), actualizadas)
+        if nuevas:
+            db.session.execute(tabla.insert(), nuevas)
 
 class VistaChefs(Resource):
 
     @jwt_required()
     def get(self, id_restaurante):
-        chefs = Chef.query.filter(Chef.restaurante == id_restaurante).all()
+        no_modificado, encabezados = EtagUtil.validarColeccion(*EtagUtil.versionColeccion(Chef, Chef.restaurante == id_restaurante))
+        if no_modificado:
+            return EtagUtil.noModificado(encabezados)
+        chefs, siguiente = PaginacionUtil.paginar(Chef.query.filter(Chef.restaurante == id_restaurante), Chef.id)
         resultado = []
         for chef in chefs:        
             resultado.append(chef_schema.dump(chef))
-        return resultado
+        return PaginacionUtil.respuesta(resultado, siguiente), 200, encabezados
     
     @jwt_required()
     def post(self, id_restaurante):
@@ -337,18 +919,17 @@ class VistaMenus(Resource):
 
     @jwt_required()
     def post(self, id_usuario):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = UsuarioUtil.obtenerDatosUsuario(id_usuario)
         id_restaurante = request.json["restaurante"]
-        if (usuario.tipo == 'Chef'):
-            chef = Chef.query.filter(Chef.id == id_usuario).first()
-            id_restaurante = chef.restaurante
+        if (usuario['tipo'] == 'Chef'):
+            id_restaurante = usuario['restaurante']
         nuevo_menu = Menu(nombre=request.json["nombre"],
                           descripcion=request.json["descripcion"],
                           fechaInicio=datetime.strptime(request.json["fechaInicio"], '%Y-%m-%d').date(),
                           fechaFin=datetime.strptime(request.json["fechaFin"], '%Y-%m-%d').date(),
                           foto=request.json["foto"],
                           autor=id_usuario,
-                          autor_name=usuario.usuario,
+                          autor_name=usuario['usuario'],
                           restaurante=id_restaurante)
         for receta in request.json["recetas"]:
             nuevo_menu_receta = MenuReceta(
@@ -363,31 +944,35 @@ class VistaMenus(Resource):
 class VistaMenu(Resource):
     @jwt_required()
     def get(self, id_usuario, id_menu):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
-        buscado_menu = Menu.query.filter(Menu.id == id_menu).first()
+        usuario = UsuarioUtil.obtenerDatosUsuario(id_usuario)
+        buscado_menu = ConsultaUtil.conRelaciones(Menu).filter(Menu.id == id_menu).first()
         if(usuario == None):
             return {'mensaje': "No existe un usuario con ese id"}, 422
         elif(buscado_menu == None):
             return {'mensaje': "No existe un menú con ese id"}, 422 
         else:
-            return menu_schema.dump(buscado_menu)
+            no_modificado, encabezados = EtagUtil.validar(buscado_menu.version)
+            if no_modificado:
+                return EtagUtil.noModificado(encabezados)
+            return menu_serializador.dump(buscado_menu), 200, encabezados
 
 
     @jwt_required()
     def put(self, id_usuario, id_menu):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
-        editar_menu = Menu.query.filter(Menu.id == id_menu).first()
+        usuario = UsuarioUtil.obtenerDatosUsuario(id_usuario)
+        editar_menu = ConsultaUtil.conRelaciones(Menu).filter(Menu.id == id_menu).first()
         id_restaurante = request.json["restaurante"]['id']
         if(usuario == None):
             return {'mensaje': "No existe un usuario con ese id"}, 422
         elif(editar_menu == None):
             return {'mensaje': "No existe un menú con ese id"}, 422 
         else:
-            if(editar_menu.autor != usuario.id):
-               if(usuario.tipo == 'Chef'):
-                chef = Chef.query.filter(Chef.id == id_usuario).first()
-                id_restaurante = chef.restaurante
-                if(chef.restaurante != editar_menu.restaurante):
+            if(editar_menu.autor != usuario['id']):
+               if(usuario['tipo'] == 'Chef'):
+                # El permiso de edición se valida contra la base de datos, no contra el token
+                usuario = UsuarioUtil.consultarDatosUsuario(id_usuario)
+                id_restaurante = usuario['restaurante']
+                if(usuario['restaurante'] != editar_menu.restaurante):
                     return {'mensaje': "El usuario no tiene permisos para editar el menú"}, 422
        
             editar_menu.nombre = request.json["nombre"]
@@ -397,46 +982,56 @@ class VistaMenu(Resource):
             editar_menu.foto = request.json["foto"]
             editar_menu.autor = id_usuario
             editar_menu.restaurante = id_restaurante
-            editar_menu.recetas = []
-
-            for receta in request.json["recetas"]:
-                nuevo_menu_receta = MenuReceta(
-                    personas = receta["personas"], 
-                    receta = int(receta["receta"])
-                )
-                editar_menu.recetas.append(nuevo_menu_receta)
+            self.actualizar_recetas_util(editar_menu, request.json["recetas"])
             db.session.commit()
             return menu_schema.dump(editar_menu)     
+
+    def actualizar_recetas_util(self, menu, recetas):
+        # Se comparan las recetas del menú por id de receta: solo se actualiza, inserta o borra lo que cambió
+        existentes = {}
+        for menu_receta in menu.recetas:
+            existentes.setdefault(menu_receta.receta, []).append(menu_receta)
+        for receta in recetas:
+            id_receta = int(receta["receta"])
+            personas = int(receta["personas"])
+            if existentes.get(id_receta):
+                menu_receta = existentes[id_receta].pop(0)
+                if menu_receta.personas != personas:
+                    menu_receta.personas = personas
+            else:
+                menu.recetas.append(MenuReceta(personas = personas, receta = id_receta))
+        for sobrantes in existentes.values():
+            for menu_receta in sobrantes:
+                menu.recetas.remove(menu_receta)
             
 
 class VistaMenusChef(Resource):
     @jwt_required()
+    @CacheUtil.cachear
     def get(self, id_usuario):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
-        if (usuario.tipo == 'Chef'):
-            chef = Chef.query.filter(Chef.id == id_usuario).first()
-            id_restaurante = chef.restaurante
+        usuario = UsuarioUtil.obtenerDatosUsuario(id_usuario)
+        id_restaurante = usuario['restaurante']
+        no_modificado, encabezados = EtagUtil.validarColeccion(id_restaurante, *EtagUtil.versionColeccion(Menu, Menu.restaurante == id_restaurante))
+        if no_modificado:
+            return EtagUtil.noModificado(encabezados)
         # Obetener la lista de menus por restaurante
-        menus = Menu.query.filter(Menu.restaurante == id_restaurante).all()
-        resultado = []
-        for menu in menus:
-            resultado.append(menu_schema.dump(menu))        
-        return resultado
+        menus, siguiente = PaginacionUtil.paginar(ConsultaUtil.conRelaciones(Menu).filter(Menu.restaurante == id_restaurante), Menu.id)
+        return PaginacionUtil.respuesta(menu_serializador.dumpMany(menus), siguiente), 200, encabezados
 
 class VistaMenusAdmin(Resource):
     @jwt_required()
     def get(self, id_usuario, id_restaurante):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
-        if (usuario.tipo == 'Administrador'):
-            admin = Administrador.query.filter(Administrador.id == id_usuario).first()
+        usuario = UsuarioUtil.obtenerDatosUsuario(id_usuario)
+        if (usuario is None or usuario['tipo'] != 'Administrador'):
+            return {'mensaje': "El usuario no es administrador"}, 422
         # Obetener la lista de menus por restaurante
-        restaurante = Restaurante.query.filter(Restaurante.administrador == admin.id).filter(Restaurante.id == id_restaurante).first()
-        menus = Menu.query.filter(Menu.restaurante == restaurante.id).all()
+        restaurante = Restaurante.query.filter(Restaurante.administrador == usuario['id']).filter(Restaurante.id == id_restaurante).first()
+        no_modificado, encabezados = EtagUtil.validarColeccion(*EtagUtil.versionColeccion(Menu, Menu.restaurante == restaurante.id))
+        if no_modificado:
+            return EtagUtil.noModificado(encabezados)
+        menus, siguiente = PaginacionUtil.paginar(ConsultaUtil.conRelaciones(Menu).filter(Menu.restaurante == restaurante.id), Menu.id)
 
-        resultado = []
-        for menu in menus:
-            resultado.append(menu_schema.dump(menu))        
-        return resultado
+        return PaginacionUtil.respuesta(menu_serializador.dumpMany(menus), siguiente), 200, encabezados
     
 class VistaUsuarios(Resource):
     @jwt_required()
@@ -446,23 +1041,107 @@ class VistaUsuarios(Resource):
 
 
 
+class VistaDemanda(Resource):
+
+    @jwt_required()
+    @CacheUtil.cachear
+    def get(self, id_usuario):
+        usuario = UsuarioUtil.obtenerDatosUsuario(id_usuario)
+        if usuario is None:
+            return {'mensaje': "El usuario no existe"}, 404
+        try:
+            desde = datetime.strptime(request.args['desde'], '%Y-%m-%d').date()
+            hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return {'mensaje': "Se requieren las fechas desde y hasta con formato AAAA-MM-DD"}, 422
+        if desde > hasta:
+            return {'mensaje': "La fecha desde debe ser anterior a la fecha hasta"}, 422
+        # Un chef solo consulta su restaurante; un administrador puede filtrar uno o ver todos los suyos
+        id_restaurante = usuario['restaurante'] if usuario['tipo'] == 'Chef' else request.args.get('restaurante', type=int)
+        return {'desde': desde.isoformat(), 'hasta': hasta.isoformat(), 'restaurante': id_restaurante, \
+            'demanda': ReporteUtil.generarDemanda(usuario['administrador'], desde, hasta, id_restaurante)}
+
 class VistaReporteMenus(Resource):
     
     @jwt_required()
     def post(self):  
-        reporte = {}
-        for receta in request.json['recetas']:
-            rec = Receta.query.filter(Receta.id == receta['receta']).first()
-            recetasIngredientes = RecetaIngrediente.query.filter(RecetaIngrediente.receta == rec.id).all()
-            for recetaIngrediente in recetasIngredientes:
-                ingrediente = Ingrediente.query.filter(Ingrediente.id == recetaIngrediente.ingrediente).first()
-                if ingrediente.id in reporte:
-                    reporte[ingrediente.id]['cantidad'] = str(round(float(reporte[ingrediente.id]['cantidad']) + float(((receta['personas'] * recetaIngrediente.cantidad)/rec.porcion))))
-                else:
-                    reporte[ingrediente.id] = {'nombre': ingrediente.nombre, 'cantidad': str(round((receta['personas'] * recetaIngrediente.cantidad)/rec.porcion)), 'unidad': ingrediente.unidad, 'sitio': ingrediente.sitio} 
-        
-        arrayReporte = []
-        for elemento in reporte:
-            arrayReporte.append(reporte[elemento])
+        recetas = request.json['recetas']
+        if request.args.get('asincrono') in ('1', 'true') or request.json.get('asincrono'):
+            return self.enviarTrabajo(recetas)
+        if not current_app.config.get('CACHE_RESPUESTAS', True):
+            reporte = ReporteUtil.generarListaCompras(recetas)
+        else:
+            id_administrador = UsuarioUtil.obtenerIdAdministrador(get_jwt_identity())
+            clave = cache_respuestas.clave('VistaReporteMenus', id_administrador, \
+                [[receta['receta'], receta['personas']] for receta in recetas])
+            reporte = cache_respuestas.obtener(clave)
+            if reporte is None:
+                reporte = ReporteUtil.generarListaCompras(recetas)
+                if reporte is not None:
+                    cache_respuestas.guardar(clave, reporte, current_app.config.get('CACHE_RESPUESTAS_TTL', 60))
+        if reporte is None:
+            return {'mensaje': "No existe una receta con ese id"}, 422
+        return reporte
+
+    def enviarTrabajo(self, recetas):
+        # La clave incluye la generación del tenant: envíos idénticos sin cambios de por medio comparten el trabajo
+        id_administrador = UsuarioUtil.obtenerIdAdministrador(get_jwt_identity())
+        clave = cache_respuestas.clave('TrabajoReporteMenus', id_administrador, \
+            [[receta['receta'], receta['personas']] for receta in recetas])
+
+        def generar():
+            reporte = ReporteUtil.generarListaCompras(recetas)
+            if reporte is None:
+                raise ErrorTrabajo("No existe una receta con ese id")
+            return reporte
+
+        try:
+            id_trabajo = cola_trabajos.enviar(clave, id_administrador, generar)
+        except ColaLlena:
+            return {'mensaje': "Hay demasiados reportes en proceso, intente más tarde"}, 503, {'Retry-After': '5'}
+        trabajo = cola_trabajos.obtener(id_trabajo)
+        # El trabajo pudo expirar entre la reserva y esta lectura
+        if trabajo is None:
+            return {'mensaje': "El trabajo no existe o ya expiró"}, 404
+        return TrabajoUtil.describir(trabajo), 202, {'Location': '/trabajos/{}'.format(id_trabajo)}
+
+
+class VistaTrabajo(Resource):
+
+    @jwt_required()
+    def get(self, id_trabajo):
+        trabajo = TrabajoUtil.obtenerTrabajo(id_trabajo)
+        if trabajo is None:
+            return {'mensaje': "El trabajo no existe o ya expiró"}, 404
+        return TrabajoUtil.describir(trabajo)
+
 
-        return arrayReporte
\ No newline at end of file
+class VistaResultadoTrabajo(Resource):
+
+    @jwt_required()
+    def get(self, id_trabajo):
+        trabajo = TrabajoUtil.obtenerTrabajo(id_trabajo, con_resultado=True)
+        if trabajo is None:
+            return {'mensaje': "El trabajo no existe o ya expiró"}, 404
+        if trabajo['estado'] == FALLIDO:
+            return {'mensaje': trabajo['mensaje']}, 422
+        if trabajo['estado'] != TERMINADO:
+            return TrabajoUtil.describir(trabajo), 202, {'Retry-After': '1'}
+        return trabajo['resultado']
+
+
+class VistaBusqueda(Resource):
+
+    TIPOS = {'ingredientes': Ingrediente, 'recetas': Receta}
+
+    @jwt_required()
+    def get(self, id_usuario):
+        id_administrador = UsuarioUtil.obtenerIdAdministrador(id_usuario)
+        texto = request.args.get('q', '')
+        limite = request.args.get('limit', BusquedaUtil.LIMITE_POR_DEFECTO, type=int)
+        limite = min(max(limite, 1), BusquedaUtil.LIMITE_MAXIMO)
+        tipo = request.args.get('tipo')
+        if tipo is not None and tipo not in self.TIPOS:
+            return {'mensaje': "El tipo debe ser ingredientes o recetas"}, 422
+        return {nombre: BusquedaUtil.buscar(modelo, id_administrador, texto, limite) \
+            for nombre, modelo in self.TIPOS.items() if tipo in (None, nombre)}